@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+'''
+Offline benchmark of docw create/destroy, against the local stand-ins of benchmarks/fakes.py.
+
+usage: python3 benchmarks/bench.py [--nodes 10,100,500] [--scale 0.05] [--boot 20] [--unrelated 0]
+
+Every droplet gets its own loopback address (127.x.y.z), which is reachable on linux without any setup.
+'''
+
+import argparse, json, os, resource, sys, tempfile, threading, time, urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+os.environ.setdefault('USER', 'docw')
+
+import paramiko as pm
+
+import fakes
+
+class Monitor(object):
+  """
+  Samples the peak number of threads & sockets of this process.
+  """
+  def __init__(self, interval=0.05):
+    self.interval = interval
+    self.peak_threads = 0
+    self.peak_sockets = 0
+    self.stopped = threading.Event()
+    self.thread = threading.Thread(target=self.run, daemon=True)
+
+  def count_sockets(self):
+    count = 0
+    for fd in os.listdir('/proc/self/fd'):
+      try:
+        count += os.readlink('/proc/self/fd/%s' % fd).startswith('socket:')
+      except OSError:
+        # closed in the meantime.
+        pass
+    return count
+
+  def run(self):
+    while not self.stopped.is_set():
+      self.peak_threads = max(self.peak_threads, threading.active_count())
+      self.peak_sockets = max(self.peak_sockets, self.count_sockets())
+      time.sleep(self.interval)
+
+  def __enter__(self):
+    self.thread.start()
+    return self
+
+  def __exit__(self, *args):
+    self.stopped.set()
+    self.thread.join()
+
+def get_user_conf(work_dir, end_point, ssh_port):
+  from docw import docw
+
+  ssh_dir = os.path.join(work_dir, '.ssh')
+  os.makedirs(ssh_dir)
+  key = pm.RSAKey.generate(2048)
+  key.write_private_key_file(os.path.join(ssh_dir, 'id_rsa'))
+  with open(os.path.join(ssh_dir, 'id_rsa.pub'), 'w') as f:
+    f.write('ssh-rsa %s bench@docw\n' % key.get_base64())
+  open(os.path.join(ssh_dir, 'known_hosts'), 'w').close()
+
+  user_conf = dict(docw.default_config, token='bench', region='sfo1', **{ 'ssh-dir': ssh_dir, 'ssh-port': str(ssh_port), 'logs-dir': os.path.join(work_dir, 'logs') })
+  user_conf['repository.hadoop.sfo1'] = end_point.replace('/v2/', '/mirror/')
+  user_conf['repository.zookeeper.sfo1'] = end_point.replace('/v2/', '/mirror/')
+  user_conf['public_key_path'] = os.path.join(ssh_dir, 'id_rsa.pub')
+  user_conf['private_key_path'] = os.path.join(ssh_dir, 'id_rsa')
+  user_conf['known_hosts_path'] = os.path.join(ssh_dir, 'known_hosts')
+  with open(user_conf['public_key_path']) as f:
+    user_conf['public-key'] = f.read().strip()
+  with open(user_conf['private_key_path']) as f:
+    user_conf['private-key'] = f.read().strip()
+
+  return user_conf
+
+def run(nodes, latencies, unrelated_droplets, poll_interval):
+  work_dir = tempfile.mkdtemp(prefix='docw-bench-')
+  # keep ~/.docw (images, caches) of the operator out of the benchmark.
+  os.environ['HOME'] = work_dir
+  process, end_point, ssh_port = fakes.start(latencies, unrelated_droplets)
+  os.environ['DIGITALOCEAN_END_POINT'] = end_point
+
+  from docw import create, destroy
+
+  # the operator's /etc/hosts is left alone.
+  create.update_hosts = lambda hostname_to_ips: None
+  destroy.update_hosts = lambda hostname_to_ips: None
+  create.ACTIVATION_POLL_INTERVAL = poll_interval
+
+  user_conf = get_user_conf(work_dir, end_point, ssh_port)
+  template = os.path.join(work_dir, 'template.json')
+  with open(template, 'w') as f:
+    json.dump([ { 'role': 'hadoop', 'hosts': [ { 'size': '4gb', 'count': nodes - 1 } ] } ], f)
+
+  cwd = os.getcwd()
+  os.chdir(work_dir)
+  try:
+    with Monitor() as monitor:
+      start_time = time.time()
+      create.process(user_conf, [ 'bench', template ])
+      create_time = time.time() - start_time
+
+      start_time = time.time()
+      destroy.process(user_conf, [ 'bench.json' ])
+      destroy_time = time.time() - start_time
+  finally:
+    os.chdir(cwd)
+    with urllib.request.urlopen(end_point.replace('/v2/', '/_stats')) as f:
+      calls = json.loads(f.read().decode('utf-8'))['calls']
+    process.terminate()
+
+  return { 'nodes': nodes,
+           'create_sec': round(create_time, 2),
+           'destroy_sec': round(destroy_time, 2),
+           'api_calls': sum(calls.values()),
+           'api_calls_by_endpoint': calls,
+           'peak_threads': monitor.peak_threads,
+           'peak_sockets': monitor.peak_sockets,
+           'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+           'trace': os.path.join(work_dir, 'bench.trace.jsonl'),
+  }
+
+def main():
+  parser = argparse.ArgumentParser(description='Offline benchmark of docw create/destroy.')
+  parser.add_argument('--nodes', default='10,100,500', help='comma separated cluster sizes')
+  parser.add_argument('--scale', type=float, default=0.05, help='scale of simulated boot & install latencies')
+  parser.add_argument('--boot', type=float, default=20.0, help='simulated droplet boot time (sec, before scale)')
+  parser.add_argument('--unrelated', type=int, default=0, help='unrelated droplets already in the account')
+  parser.add_argument('--poll', type=float, default=1.0, help='activation polling interval (sec)')
+  parser.add_argument('--output', help='write results as json to this file')
+  args = parser.parse_args()
+
+  results = []
+  for nodes in [ int(n) for n in args.nodes.split(',') ]:
+    # each size runs in its own process, so that peak threads, sockets & memory don't leak between sizes.
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if 0 == pid:
+      os.close(read_fd)
+      result = run(nodes, fakes.Latencies(boot=args.boot, scale=args.scale), args.unrelated, args.poll)
+      with os.fdopen(write_fd, 'w') as f:
+        f.write(json.dumps(result))
+      os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+      content = f.read()
+    os.waitpid(pid, 0)
+    if not content:
+      print('Error: benchmark of %d nodes failed.' % nodes, file=sys.stderr)
+      return 1
+    results.append(json.loads(content))
+
+  print('\n%6s %10s %11s %9s %12s %12s %10s' % ('nodes', 'create(s)', 'destroy(s)', 'api', 'peak threads', 'peak sockets', 'rss(mb)'))
+  for result in results:
+    print('%6d %10.2f %11.2f %9d %12d %12d %10.1f' % (result['nodes'], result['create_sec'], result['destroy_sec'], result['api_calls'],
+                                                      result['peak_threads'], result['peak_sockets'], result['max_rss_mb']))
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2)
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
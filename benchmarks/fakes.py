@@ -0,0 +1,343 @@
+'''
+Local stand-ins for the DigitalOcean api and for the ssh servers of droplets.
+
+Both run in a separate process (see start), so that the benchmarked orchestrator
+doesn't share threads, sockets or memory with them.
+'''
+
+import hashlib, io, itertools as it, json, logging, multiprocessing, os, re, socket, tarfile, threading, time, urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import paramiko as pm
+
+SIZES = [
+  # slug, memory (mb), vcpus, disk (gb), price monthly, price hourly
+  ('512mb', 512, 1, 20, 5.0, 0.00744),
+  ('1gb', 1024, 1, 30, 10.0, 0.01488),
+  ('2gb', 2048, 2, 40, 20.0, 0.02976),
+  ('4gb', 4096, 2, 60, 40.0, 0.05952),
+  ('8gb', 8192, 4, 80, 80.0, 0.11905),
+  ('16gb', 16384, 8, 160, 160.0, 0.2381),
+]
+REGIONS = [ 'nyc1', 'nyc2', 'nyc3', 'sfo1', 'lon1', 'sgp1', 'ams1', 'ams2', 'ams3' ]
+
+class Latencies(object):
+  """
+  Simulated latencies, in seconds.
+  """
+  def __init__(self, boot=20.0, api=0.05, command=0.02, system_packages=120.0, user_packages=30.0, apt_cache=20.0, scale=1.0, output_lines=2000):
+    self.boot = boot * scale
+    self.api = api
+    self.command = command
+    self.system_packages = system_packages * scale
+    self.user_packages = user_packages * scale
+    self.apt_cache = apt_cache * scale
+    self.output_lines = output_lines
+
+  def of_script(self, script):
+    if 'apt-cacher-ng' in script:
+      return self.apt_cache, self.output_lines
+    if 'apt-get' in script:
+      return self.system_packages, self.output_lines
+    if 'tar -xvf' in script:
+      return self.user_packages, self.output_lines
+    return self.command, 0
+
+class FakeDigitalOcean(object):
+  """
+  In-memory DigitalOcean account: droplets, tags, ssh keys & a package mirror.
+  """
+  def __init__(self, latencies, unrelated_droplets=0, mirror_size=1 << 20):
+    self.latencies = latencies
+    self.lock = threading.Lock()
+    self.ids = it.count(1000)
+    self.droplets = dict()
+    self.tags = set()
+    self.ssh_keys = []
+    self.calls = dict()
+    self.mirror = os.urandom(mirror_size)
+    self.addresses = it.count(2)
+
+    for i in range(0, unrelated_droplets):
+      droplet = self.new_droplet('unrelated-%d' % i, '512mb', 'sfo1', [])
+      droplet['status'] = 'active'
+
+  def count(self, method, path):
+    key = '%s %s' % (method, re.sub(r'/\d+', '/{id}', path))
+    with self.lock:
+      self.calls[key] = self.calls.get(key, 0) + 1
+
+  def new_droplet(self, name, size_slug, region, tags):
+    droplet_id = next(self.ids)
+    n = next(self.addresses)
+    size = [ size for size in SIZES if size[0] == size_slug ][0]
+    droplet = { 'id': droplet_id,
+                'name': name,
+                'memory': size[1],
+                'vcpus': size[2],
+                'disk': size[3],
+                'locked': False,
+                'status': 'new',
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'features': [ 'private_networking' ],
+                'backup_ids': [],
+                'snapshot_ids': [],
+                'image': { 'slug': 'ubuntu-14-04-x64' },
+                'size_slug': size_slug,
+                'networks': { 'v4': [ { 'ip_address': '127.%d.%d.%d' % (1 + n // 62500, n // 250 % 250, 1 + n % 250),
+                                        'netmask': '255.0.0.0', 'gateway': '127.0.0.1', 'type': 'public' },
+                                      { 'ip_address': '10.%d.%d.%d' % (n // 62500, n // 250 % 250, 1 + n % 250),
+                                        'netmask': '255.255.0.0', 'gateway': '10.0.0.1', 'type': 'private' } ],
+                              'v6': [] },
+                'region': { 'slug': region },
+                'tags': list(tags or []),
+                '_active_at': time.time() + self.latencies.boot,
+    }
+    with self.lock:
+      self.droplets[droplet_id] = droplet
+      self.tags.update(droplet['tags'])
+
+    return droplet
+
+  def view(self, droplet):
+    if 'new' == droplet['status'] and time.time() >= droplet['_active_at']:
+      droplet['status'] = 'active'
+    return { k: v for k, v in droplet.items() if not k.startswith('_') }
+
+  def mirror_checksum(self):
+    return hashlib.sha512(self.mirror).hexdigest()
+
+def page(items, key, params, base_url):
+  per_page = int(params.get('per_page', [ 20 ])[0])
+  number = int(params.get('page', [ 1 ])[0])
+  data = { key: items[(number - 1) * per_page:number * per_page], 'links': { 'pages': dict() }, 'meta': { 'total': len(items) } }
+  if number * per_page < len(items):
+    query = dict([ (k, v[0]) for k, v in params.items() ], page=number + 1, per_page=per_page)
+    data['links']['pages']['next'] = '%s?%s' % (base_url, urllib.parse.urlencode(query))
+  return data
+
+def get_handler(account):
+  class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+      pass
+
+    def reply(self, status, data=None, body=None, content_type='application/json'):
+      if data is not None:
+        body = json.dumps(data).encode('utf-8')
+      body = body or b''
+      self.send_response(status)
+      self.send_header('Content-Type', content_type)
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def read_body(self):
+      length = int(self.headers.get('Content-Length') or 0)
+      content = self.rfile.read(length) if length else b''
+      try:
+        return json.loads(content.decode('utf-8')) if content else dict()
+      except ValueError:
+        return dict()
+
+    def handle_request(self, method):
+      url = urllib.parse.urlparse(self.path)
+      path = url.path.rstrip('/')
+      params = urllib.parse.parse_qs(url.query)
+      body = self.read_body()
+
+      if path.startswith('/mirror/'):
+        if path.endswith('.sha512'):
+          return self.reply(200, body=('%s  %s\n' % (account.mirror_checksum(), os.path.basename(path[:-7]))).encode(), content_type='text/plain')
+        return self.reply(200, body=account.mirror, content_type='application/octet-stream')
+
+      if '/_stats' == path:
+        with account.lock:
+          return self.reply(200, { 'calls': dict(account.calls) })
+
+      if not path.startswith('/v2/'):
+        return self.reply(404, { 'id': 'not_found', 'message': 'not found' })
+
+      path = path[len('/v2'):]
+      account.count(method, path)
+      time.sleep(account.latencies.api)
+      base_url = 'http://%s:%d/v2%s' % (self.server.server_address[0], self.server.server_address[1], path)
+
+      if 'GET' == method and '/account' == path:
+        return self.reply(200, { 'account': { 'droplet_limit': 100000, 'email': 'bench@localhost', 'uuid': 'bench', 'status': 'active' } })
+
+      if '/account/keys' == path:
+        if 'POST' == method:
+          with account.lock:
+            key = { 'id': len(account.ssh_keys) + 1, 'name': body.get('name'), 'public_key': body.get('public_key'), 'fingerprint': '' }
+            account.ssh_keys.append(key)
+          return self.reply(201, { 'ssh_key': key })
+        return self.reply(200, page(list(account.ssh_keys), 'ssh_keys', params, base_url))
+
+      m = re.match(r'^/account/keys/(\d+)$', path)
+      if m:
+        return self.reply(200, { 'ssh_key': account.ssh_keys[int(m.group(1)) - 1] })
+
+      if '/regions' == path:
+        return self.reply(200, page([ { 'slug': slug, 'name': slug, 'available': True, 'features': [ 'private_networking' ],
+                                        'sizes': [ size[0] for size in SIZES ] } for slug in REGIONS ], 'regions', params, base_url))
+
+      if '/sizes' == path:
+        return self.reply(200, page([ { 'slug': s[0], 'memory': s[1], 'vcpus': s[2], 'disk': s[3], 'transfer': 1.0,
+                                        'price_monthly': s[4], 'price_hourly': s[5], 'regions': REGIONS, 'available': True } for s in SIZES ],
+                                    'sizes', params, base_url))
+
+      if '/tags' == path:
+        if 'POST' == method:
+          with account.lock:
+            account.tags.add(body.get('name'))
+          return self.reply(201, { 'tag': { 'name': body.get('name'), 'resources': dict() } })
+        return self.reply(200, page([ { 'name': tag, 'resources': dict() } for tag in sorted(account.tags) ], 'tags', params, base_url))
+
+      m = re.match(r'^/tags/([^/]+)/resources$', path)
+      if m and 'POST' == method:
+        tag = urllib.parse.unquote(m.group(1))
+        with account.lock:
+          for resource in body.get('resources', []):
+            droplet = account.droplets.get(int(resource['resource_id']))
+            if droplet and tag not in droplet['tags']:
+              droplet['tags'].append(tag)
+        return self.reply(204)
+
+      if '/droplets' == path:
+        if 'POST' == method:
+          names = body.get('names') or [ body.get('name') ]
+          droplets = [ account.new_droplet(name, body.get('size'), body.get('region'), body.get('tags')) for name in names ]
+          links = { 'actions': [ { 'id': droplets[0]['id'], 'rel': 'create', 'href': '' } ] }
+          if 'names' in body:
+            return self.reply(202, { 'droplets': [ account.view(d) for d in droplets ], 'links': links })
+          return self.reply(202, { 'droplet': account.view(droplets[0]), 'links': links })
+
+        tag = params.get('tag_name', [ None ])[0]
+        with account.lock:
+          droplets = [ account.view(d) for d in account.droplets.values() if tag is None or tag in d['tags'] ]
+
+        if 'DELETE' == method:
+          with account.lock:
+            for droplet in droplets:
+              account.droplets.pop(droplet['id'], None)
+          return self.reply(204)
+
+        return self.reply(200, page(droplets, 'droplets', params, base_url))
+
+      m = re.match(r'^/droplets/(\d+)$', path)
+      if m:
+        with account.lock:
+          droplet = account.droplets.get(int(m.group(1)))
+          if droplet and 'DELETE' == method:
+            del account.droplets[droplet['id']]
+            return self.reply(204)
+        if droplet is None:
+          return self.reply(404, { 'id': 'not_found', 'message': 'The resource you were accessing could not be found.' })
+        return self.reply(200, { 'droplet': account.view(droplet) })
+
+      return self.reply(404, { 'id': 'not_found', 'message': 'not found: %s %s' % (method, path) })
+
+    def do_GET(self):
+      self.handle_request('GET')
+
+    def do_POST(self):
+      self.handle_request('POST')
+
+    def do_DELETE(self):
+      self.handle_request('DELETE')
+
+  return Handler
+
+class FakeSSHServer(pm.ServerInterface):
+  """
+  Accepts any public key, and runs every command by draining its stdin, sleeping for its simulated
+  latency and writing simulated output.
+  """
+  def __init__(self, latencies):
+    self.latencies = latencies
+
+  def get_allowed_auths(self, username):
+    return 'publickey'
+
+  def check_auth_publickey(self, username, key):
+    return pm.AUTH_SUCCESSFUL
+
+  def check_channel_request(self, kind, chanid):
+    return pm.OPEN_SUCCEEDED if 'session' == kind else pm.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+  def check_channel_exec_request(self, channel, command):
+    threading.Thread(target=self.run, args=(channel, command.decode('utf-8')), daemon=True).start()
+    return True
+
+  def run(self, channel, command):
+    try:
+      stdin = io.BytesIO()
+      for data in iter(lambda: channel.recv(32768), b''):
+        stdin.write(data)
+
+      latency, lines = self.latencies.of_script(stdin.getvalue().decode('utf-8', 'replace')) if 'bash -s' in command else (self.latencies.command, 0)
+      if command.startswith('tar -xf'):
+        tarfile.open(fileobj=io.BytesIO(stdin.getvalue())).getmembers()
+
+      for i in range(0, lines, 100):
+        channel.sendall(''.join([ 'simulated output line %d of %s\n' % (j, command) for j in range(i, min(i + 100, lines)) ]).encode('utf-8'))
+      time.sleep(latency)
+      channel.send_exit_status(0)
+    except Exception:
+      channel.send_exit_status(1)
+    finally:
+      channel.close()
+
+def accept_ssh(client, latencies, host_key):
+  transport = pm.Transport(client)
+  transport.add_server_key(host_key)
+  try:
+    # blocks until the key exchange is done.
+    transport.start_server(server=FakeSSHServer(latencies))
+  except (pm.SSHException, EOFError, OSError):
+    transport.close()
+
+def serve_ssh(sock, latencies, host_key):
+  while True:
+    client, _ = sock.accept()
+    threading.Thread(target=accept_ssh, args=(client, latencies, host_key), daemon=True).start()
+
+def serve(api_port, ssh_port, latencies, unrelated_droplets, ready):
+  # host key probes hang up right after the key exchange: don't report them.
+  logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+  account = FakeDigitalOcean(latencies, unrelated_droplets)
+  api = ThreadingHTTPServer(('127.0.0.1', api_port), get_handler(account))
+  api.daemon_threads = True
+
+  sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  sock.bind(('0.0.0.0', ssh_port))
+  sock.listen(1024)
+  threading.Thread(target=serve_ssh, args=(sock, latencies, pm.RSAKey.generate(2048)), daemon=True).start()
+
+  ready.set()
+  api.serve_forever()
+
+def get_free_port():
+  with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+def start(latencies, unrelated_droplets=0):
+  """
+  Starts the fake api & ssh servers in a child process.
+
+  Returns:
+    @return: (process, api end point, ssh port)
+  """
+  api_port = get_free_port()
+  ssh_port = get_free_port()
+  ready = multiprocessing.Event()
+  process = multiprocessing.Process(target=serve, args=(api_port, ssh_port, latencies, unrelated_droplets, ready), daemon=True)
+  process.start()
+  ready.wait()
+
+  return process, 'http://127.0.0.1:%d/v2/' % api_port, ssh_port
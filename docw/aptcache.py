@@ -0,0 +1,69 @@
+import threading
+
+APT_CACHER_PORT = 3142
+APT_PROXY_CONF = '/etc/apt/apt.conf.d/01proxy'
+
+SERVER_CMDS_TEMPLATE = '''apt-get update
+apt-get -y install apt-cacher-ng || exit 1
+service apt-cacher-ng restart
+
+# wait until the cache accepts connections: if it doesn't, fail before apt is pointed to it.
+for i in $(seq 1 30); do
+  (echo > /dev/tcp/127.0.0.1/{port}) 2> /dev/null && break
+  sleep 1
+done
+(echo > /dev/tcp/127.0.0.1/{port}) 2> /dev/null || exit 1
+'''
+
+def proxy_cmds(url):
+  return '''echo 'Acquire::http::Proxy "{url}";' > {path}
+echo 'Acquire::https::Proxy "DIRECT";' >> {path}
+'''.format(url=url, path=APT_PROXY_CONF)
+
+class AptCache(object):
+  """
+  Points apt of every host to a single package cache, so that each .deb is downloaded from the internet once.
+
+  The 'apt-cache' user setting is either 'none', 'first' (run apt-cacher-ng on the first host which installs
+  packages) or the url of an existing cache (e.g. http://192.168.0.2:3142 on the operator host).
+  """
+  def __init__(self, user_conf):
+    self.mode = user_conf.get('apt-cache', 'none')
+    self.server = None
+    self.url = None
+    self.lock = threading.Lock()
+    self.ready = threading.Event()
+    # clients reach the cache server via these addresses, once they are known.
+    self.hostname_to_private_ips = dict()
+
+    if self.mode.startswith('http://'):
+      self.url = self.mode
+    if 'first' != self.mode:
+      self.ready.set()
+
+  def host_cmds(self, hostname):
+    """
+    Returns commands which set up apt of given host. Blocks until the cache server is ready.
+
+    In 'first' mode, the first host which asks becomes the cache server: since it is already running,
+    the hosts waiting for it never starve it of a worker.
+    """
+    with self.lock:
+      if 'first' == self.mode and self.server is None:
+        self.server = hostname
+
+    if hostname == self.server:
+      return SERVER_CMDS_TEMPLATE.format(port=APT_CACHER_PORT) + proxy_cmds('http://127.0.0.1:%d' % APT_CACHER_PORT)
+
+    self.ready.wait()
+    return proxy_cmds(self.url) if self.url else ''
+
+  def host_configured(self, hostname, succeeded):
+    if hostname != self.server or self.ready.is_set():
+      return
+
+    if succeeded:
+      self.url = 'http://%s:%d' % (self.hostname_to_private_ips.get(hostname) or hostname, APT_CACHER_PORT)
+    else:
+      print('%s: Warning: apt cache is not available, hosts will download packages by themselves.' % hostname)
+    self.ready.set()
@@ -0,0 +1,96 @@
+import time
+
+from docw import create
+from docw import destroy
+from docw import droplets as dr
+from docw import hostkeys as hk
+from docw import images
+from docw import inventory as iv
+from docw import metadata as md
+from docw import remote as rm
+from docw import tuning
+from docw import utils
+
+do = utils.lazy_import('digitalocean')
+
+SNAPSHOT_POLL_INTERVAL = 10
+
+def wait_for_action(action):
+  while 'in-progress' == action.status:
+    time.sleep(SNAPSHOT_POLL_INTERVAL)
+    action.load()
+
+  if 'completed' != action.status:
+    raise ValueError('Error: action %s of droplet %s is %s.' % (action.type, action.resource_id, action.status))
+
+def get_smallest_size(user_conf):
+  """
+  Returns the size slug with the smallest disk available in the configured region: a snapshot boots only droplets
+  whose disk is at least as large as the one it was taken from.
+  """
+  size_specs = tuning.get_size_specs(user_conf)
+  candidates = [ slug for slug, spec in size_specs.items() if tuning.is_available(spec, user_conf['region']) ]
+  if not candidates:
+    raise ValueError('Error: no droplet size is available in %s.' % user_conf['region'])
+
+  return min(candidates, key=lambda slug: (size_specs[slug]['disk'], size_specs[slug]['price_hourly'], slug))
+
+def process(user_conf, args):
+  """
+  Provisions a droplet for given role (of the smallest size by default, so that droplets of any size boot
+  from the snapshot), installs its packages and stores a snapshot of it.
+
+  usage: docw bake <role> [size]
+  """
+  if not args or args[0] not in create.ROLE_ORDER:
+    raise ValueError('Error: usage: docw bake (%s) [size]' % '|'.join(create.ROLE_ORDER))
+
+  role = args[0]
+  size_slug = args[1] if 1 < len(args) else get_smallest_size(user_conf)
+  package_settings = create.get_package_settings(user_conf, role)
+  hostname = '%s%s-%d' % (dr.BAKE_PREFIX, role, int(time.time()))
+  snapshot_name = 'docw-%s-%s' % (role, package_settings['version'])
+
+  inventory = iv.get_inventory(user_conf)
+  hostname_to_droplet_ids, failures = dr.create_droplets(user_conf, [ { 'name': hostname,
+                                                                       'image': user_conf['image'],
+                                                                       'region': user_conf['region'],
+                                                                       'timezone': user_conf['timezone'],
+                                                                       'size_slug': size_slug,
+                                                                       'user_data': create.get_user_data(user_conf),
+                                                                       'tags': [ dr.get_cluster_tag(hostname) ],
+  } ])
+  if failures:
+    raise ValueError('Error: failed to create %s: %s' % (hostname, failures[hostname]))
+
+  droplet_id = hostname_to_droplet_ids[hostname]
+  ssh_hashes = []
+  try:
+    create.wait_for_droplets(inventory, [ droplet_id ], tag_name=dr.get_cluster_tag(hostname))
+    droplet = do.Droplet.get_object(user_conf['token'], droplet_id)
+
+    hostname_to_ssh_hashes, failures = hk.harvest_host_keys({ hostname: droplet.ip_address }, port=int(user_conf.get('ssh-port', 22)))
+    if failures:
+      raise ValueError('Error: failed to read the host key of %s: %s' % (hostname, failures[hostname]))
+    ssh_hashes = hostname_to_ssh_hashes[hostname]
+    hk.add_known_hosts(user_conf['known_hosts_path'], ssh_hashes)
+
+    try:
+      create.configure_packages(hostname, rm.get_host(user_conf, droplet.ip_address), dict(package_settings, role=role))
+    finally:
+      rm.close_host(droplet.ip_address)
+
+    print('taking snapshot %s.' % snapshot_name)
+    action = droplet.take_snapshot(snapshot_name, return_dict=False, power_off=True)
+    wait_for_action(action)
+
+    droplet.load()
+    image_id = droplet.snapshot_ids[-1]
+    images.record_image(role, package_settings['version'], user_conf['region'], image_id)
+    md.invalidate(user_conf, 'images')
+    print('%s image %s is recorded to %s' % (role, image_id, images.DEFAULT_IMAGES_FILE))
+  finally:
+    do.Droplet(token=user_conf['token'], id=droplet_id).destroy()
+    inventory.invalidate('droplets')
+    if ssh_hashes:
+      destroy.update_ssh_hashes(user_conf['known_hosts_path'], ssh_hashes)
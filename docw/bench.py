@@ -0,0 +1,384 @@
+import io, re, sys, time
+
+from docw import create
+from docw import hadoop as hd
+from docw import journal as jn
+from docw import logs as lg
+from docw import reconfigure
+from docw import remote as rm
+from docw import scheduler as sc
+from docw import trace as tr
+from docw import tuning
+from docw import zookeeper as zk
+
+# in the order they run: terasort sorts the output of teragen.
+WORKLOADS = [ 'teragen', 'terasort', 'dfsio', 'nnbench', 'zookeeper' ]
+HADOOP_WORKLOADS = [ 'teragen', 'terasort', 'dfsio', 'nnbench' ]
+DEFAULT_DATA_GB = 1
+# teragen writes rows of 100 bytes.
+ROW_BYTES = 100
+DFSIO_FILES_PER_SLAVE = 2
+NNBENCH_MAPS_PER_SLAVE = 2
+NNBENCH_FILES_PER_MAP = 1000
+# create, get & delete of a znode each.
+ZOOKEEPER_OPERATIONS = 1000
+# seconds to wait for the datanodes to join, and for the zookeeper quorum, after starting the daemons.
+START_TIMEOUT = 300
+# hdfs directory of the benchmark data, removed before & after each run.
+BASE_DIR = '/docw-bench'
+
+JAR_TEMPLATES = {
+  'examples': '{install_path}/share/hadoop/mapreduce/hadoop-mapreduce-examples-{version}.jar',
+  'tests': '{install_path}/share/hadoop/mapreduce/hadoop-mapreduce-client-jobclient-{version}-tests.jar',
+}
+
+CLEAN_TEMPLATE = '{install_path}/bin/hdfs dfs -rm -r -f -skipTrash {base_dir}'
+
+TERAGEN_TEMPLATE = '''{install_path}/bin/hadoop jar {examples_jar} teragen -Dmapreduce.job.maps={maps} {rows} {base_dir}/teragen'''
+
+TERASORT_TEMPLATE = '''{install_path}/bin/hadoop jar {examples_jar} terasort -Dmapreduce.job.reduces={reduces} {base_dir}/teragen {base_dir}/terasort'''
+
+DFSIO_TEMPLATE = '''{install_path}/bin/hadoop jar {tests_jar} TestDFSIO -Dtest.build.data={base_dir}/dfsio -{operation} -nrFiles {files} -size {file_mb}MB -resFile /tmp/docw-dfsio.log'''
+
+# every map starts at the same time, a few seconds later than the job is submitted.
+NNBENCH_TEMPLATE = '''{install_path}/bin/hadoop jar {tests_jar} nnbench -operation {operation} -maps {maps} -reduces 1 -blockSize 1 -bytesToWrite 0 \
+-numberOfFiles {files} -replicationFactorPerFile 1 -readFileAfterOpen true -baseDir {base_dir}/nnbench -startTime $(( $(date +%s) + 10 ))'''
+
+# the latency each server measured, reset before the operations.
+ZOOKEEPER_TEMPLATE = '''for host in {hostnames}; do echo srst | nc $host {port} > /dev/null; done
+start=$(date +%s%N)
+for i in $(seq 1 {operations}); do
+  echo "create /docw-bench-$i x"
+  echo "get /docw-bench-$i"
+  echo "delete /docw-bench-$i"
+done | {install_path}/bin/zkCli.sh -server {servers} > /dev/null 2>&1
+end=$(date +%s%N)
+echo "elapsed ms: $(( (end - start) / 1000000 ))"
+for host in {hostnames}; do echo "$host $(echo srvr | nc $host {port} | grep Latency)"; done'''
+
+# workload, metric, header of the comparison table; the higher the better, except for latencies.
+COLUMNS = [
+  ('teragen', 'mb_per_sec', 'teragen MB/s'),
+  ('terasort', 'mb_per_sec', 'terasort MB/s'),
+  ('dfsio', 'write_mb_per_sec', 'dfsio write MB/s'),
+  ('dfsio', 'read_mb_per_sec', 'dfsio read MB/s'),
+  ('nnbench', 'create_tps', 'nn create/s'),
+  ('nnbench', 'open_tps', 'nn open/s'),
+  ('zookeeper', 'ops_per_sec', 'zk ops/s'),
+  ('zookeeper', 'avg_latency_ms', 'zk avg ms'),
+]
+
+def run_script(host, hostname, phase, message, script):
+  """
+  Runs given script as a phase of given host, and returns its elapsed seconds and output.
+  """
+  output = io.BytesIO()
+  start_time = time.time()
+  create.run_phase(None, hostname, phase, message, host.run, script, output=output)
+  return time.time() - start_time, output.getvalue().decode('utf-8', 'replace')
+
+def parse(output, pattern, workload):
+  """
+  Returns the float values of the groups of given pattern, found in given output.
+  """
+  match = re.search(pattern, output)
+  if not match:
+    raise ValueError('Error: %s printed no \'%s\'.' % (workload, pattern))
+  return [ float(value) for value in match.groups() ]
+
+def get_props(host_config, slaves, hadoop_tuning, data_gb):
+  props = dict(host_config, base_dir=BASE_DIR)
+  return dict(props,
+              examples_jar=JAR_TEMPLATES['examples'].format(**props),
+              tests_jar=JAR_TEMPLATES['tests'].format(**props),
+              rows=int(data_gb * 1024 ** 3 / ROW_BYTES),
+              maps=hadoop_tuning['map_task_total'],
+              reduces=hadoop_tuning['reduce_task_total'],
+              dfsio_files=DFSIO_FILES_PER_SLAVE * slaves,
+              nnbench_maps=NNBENCH_MAPS_PER_SLAVE * slaves)
+
+def teragen(host, hostname, props):
+  elapsed, _ = run_script(host, hostname, 'teragen', 'TeraGen of %d rows' % props['rows'], TERAGEN_TEMPLATE.format(**props))
+  return { 'elapsed_sec': round(elapsed, 2), 'mb_per_sec': round(props['rows'] * ROW_BYTES / 1024 ** 2 / elapsed, 2) }
+
+def terasort(host, hostname, props):
+  elapsed, _ = run_script(host, hostname, 'terasort', 'TeraSort of %d rows' % props['rows'], TERASORT_TEMPLATE.format(**props))
+  return { 'elapsed_sec': round(elapsed, 2), 'mb_per_sec': round(props['rows'] * ROW_BYTES / 1024 ** 2 / elapsed, 2) }
+
+def dfsio(host, hostname, props):
+  file_mb = max(1, props['rows'] * ROW_BYTES // 1024 ** 2 // props['dfsio_files'])
+  metrics = dict()
+  for operation in ('write', 'read'):
+    _, output = run_script(host, hostname, 'dfsio', 'TestDFSIO %s of %d x %d mb' % (operation, props['dfsio_files'], file_mb),
+                           DFSIO_TEMPLATE.format(operation=operation, files=props['dfsio_files'], file_mb=file_mb, **props))
+    metrics['%s_mb_per_sec' % operation], = parse(output, r'Throughput mb/sec:\s*([\d.]+)', 'TestDFSIO')
+    metrics['%s_io_rate' % operation], = parse(output, r'Average IO rate mb/sec:\s*([\d.]+)', 'TestDFSIO')
+
+  host.run(DFSIO_TEMPLATE.format(operation='clean', files=0, file_mb=0, **props))
+  return metrics
+
+def nnbench(host, hostname, props):
+  files = NNBENCH_FILES_PER_MAP
+  metrics = dict()
+  for operation, tps_pattern, latency_pattern, key in (
+      ('create_write', r'TPS: Create/Write/Close:\s*([\d.]+)', r'Avg Lat \(ms\): Create/Write:\s*([\d.]+)', 'create'),
+      ('open_read', r'TPS: Open/Read:\s*([\d.]+)', r'Avg Lat \(ms\): Open:\s*([\d.]+)', 'open')):
+    _, output = run_script(host, hostname, 'nnbench', 'NNBench %s of %d x %d files' % (operation, props['nnbench_maps'], files),
+                           NNBENCH_TEMPLATE.format(**dict(props, operation=operation, maps=props['nnbench_maps'], files=files)))
+    metrics['%s_tps' % key], = parse(output, tps_pattern, 'NNBench')
+    metrics['%s_latency_ms' % key], = parse(output, latency_pattern, 'NNBench')
+
+  return metrics
+
+def zookeeper(host, hostname, props):
+  servers = ','.join([ '%s:%d' % (server, zk.CLIENT_PORT) for server in props['hostnames'] ])
+  _, output = run_script(host, hostname, 'zk-bench', '%d znode create/get/delete' % ZOOKEEPER_OPERATIONS,
+                         ZOOKEEPER_TEMPLATE.format(hostnames=' '.join(props['hostnames']), port=zk.CLIENT_PORT, servers=servers,
+                                                   operations=ZOOKEEPER_OPERATIONS, install_path=props['install_path']))
+  elapsed_ms, = parse(output, r'elapsed ms:\s*(\d+)', 'zookeeper')
+  latencies = [ [ float(value) for value in match ] for match in re.findall(r'Latency min/avg/max:\s*(\d+)/(\d+)/(\d+)', output) ]
+  if not latencies:
+    raise ValueError('Error: zookeeper servers reported no latency.')
+
+  return { 'ops_per_sec': round(3 * ZOOKEEPER_OPERATIONS * 1000 / max(1, elapsed_ms), 2),
+           'avg_latency_ms': max([ latency[1] for latency in latencies ]),
+           'max_latency_ms': max([ latency[2] for latency in latencies ]),
+  }
+
+WORKLOAD_FUNCS = {
+  'teragen': teragen,
+  'terasort': terasort,
+  'dfsio': dfsio,
+  'nnbench': nnbench,
+  'zookeeper': zookeeper,
+}
+
+def get_layout(user_conf, journal):
+  """
+  Returns (hosts summary, tuning values, host configs, hadoop master, hadoop slaves, zookeeper servers) of the cluster as it is.
+  """
+  cluster = journal.cluster()
+  hosts = journal.hosts()
+  droplet_settings, host_configs = create.get_host_settings(user_conf, cluster['name'], cluster['settings'], create.get_existing(hosts))
+  reconfigure.validate(host_configs, droplet_settings, hosts)
+
+  sizes = { setting['name']: setting['size_slug'] for setting in droplet_settings }
+  masters = sorted(set([ host_config['master'] for host_config in host_configs.values() if 'hadoop' == host_config['role'] ]))
+  slaves = sorted([ hostname for hostname, host_config in host_configs.items() if 'hadoop' == host_config['role'] and hostname not in masters ],
+                  key=create.get_droplet_index)
+  servers = sorted([ hostname for hostname, host_config in host_configs.items() if 'zookeeper' == host_config['role'] ],
+                   key=create.get_droplet_index)
+
+  summary = dict()
+  size_specs = tuning.get_size_specs(user_conf)
+  values = dict()
+  if masters:
+    summary['hadoop-master'] = sizes[masters[0]]
+    summary['hadoop'] = { slug: [ sizes[hostname] for hostname in slaves ].count(slug) for slug in set([ sizes[hostname] for hostname in slaves ]) }
+    slave_specs = [ size_specs[sizes[hostname]] for hostname in slaves ]
+    # the cluster-wide values of get_hadoop_tuning.
+    values['hadoop'] = dict(tuning.get_cluster_tuning([ tuning.get_node_resources(spec) for spec in slave_specs ]),
+                            **tuning.get_hdfs_tuning(slave_specs))
+    values['hadoop']['short_circuit'] = 'true' == user_conf.get('hdfs.short-circuit', 'false')
+  if servers:
+    summary['zookeeper'] = { slug: [ sizes[hostname] for hostname in servers ].count(slug) for slug in set([ sizes[hostname] for hostname in servers ]) }
+    zk_tuning = tuning.get_zookeeper_tuning([ size_specs[sizes[hostname]] for hostname in servers ])[0]
+    values['zookeeper'] = { key: zk_tuning[key] for key in ('voters', 'tick_time', 'init_limit', 'sync_limit') }
+
+  return summary, values, host_configs, masters[0] if masters else None, slaves, servers
+
+def start_daemons(user_conf, hosts, host_configs, master, slaves, servers):
+  """
+  Starts hdfs, yarn and the zookeeper servers which are not running, and waits until they serve requests.
+  """
+  scheduler = sc.get_scheduler(user_conf)
+  try:
+    for hostname in servers:
+      scheduler.submit(hostname, create.run_phase, scheduler, hostname, 'start', 'Starting zookeeper',
+                       create.configure_user_packages, rm.get_host(user_conf, hosts[hostname]['ip']),
+                       zk.start_cmds(START_TIMEOUT, **host_configs[hostname]))
+    if master:
+      scheduler.submit(master, create.run_phase, scheduler, master, 'start', 'Starting hdfs & yarn',
+                       create.configure_user_packages, rm.get_host(user_conf, hosts[master]['ip']),
+                       hd.start_cmds(len(slaves), START_TIMEOUT, **host_configs[master]))
+    _, failures = scheduler.wait()
+  finally:
+    scheduler.shutdown()
+
+  if failures:
+    for hostname, error in sorted(failures.items()):
+      print('Error: failed to start the daemons of %s: %s' % (hostname, error), file=sys.stderr)
+    raise ValueError('Error: %d hosts did not start their daemons.' % len(failures))
+
+def run(user_conf, journal, workloads, data_gb, label):
+  """
+  Runs given workloads on the cluster and returns the run to record: its hosts, tuning values and metrics.
+  """
+  hosts = journal.hosts()
+  summary, values, host_configs, master, slaves, servers = get_layout(user_conf, journal)
+
+  skipped = [ workload for workload in workloads if (workload in HADOOP_WORKLOADS and not master) or ('zookeeper' == workload and not servers) ]
+  if skipped:
+    print('%s: %s skipped: no hosts to run them.' % (journal.cluster()['name'], ', '.join(skipped)))
+  workloads = [ workload for workload in workloads if workload not in skipped ]
+  if not workloads:
+    raise ValueError('Error: nothing to run.')
+
+  start_daemons(user_conf, hosts, host_configs, master if set(workloads) & set(HADOOP_WORKLOADS) else None, slaves,
+                servers if 'zookeeper' in workloads else [])
+
+  # hadoop workloads run on the master, the zookeeper one on the first server.
+  targets = dict()
+  if master:
+    targets.update({ workload: (master, get_props(host_configs[master], len(slaves), values['hadoop'], data_gb)) for workload in HADOOP_WORKLOADS })
+    master_host = rm.get_host(user_conf, hosts[master]['ip'])
+    master_host.run(CLEAN_TEMPLATE.format(**targets['teragen'][1]))
+  if servers:
+    targets['zookeeper'] = (servers[0], dict(host_configs[servers[0]], hostnames=servers))
+
+  results = dict()
+  start_time = time.time()
+  try:
+    for workload in workloads:
+      hostname, props = targets[workload]
+      try:
+        results[workload] = WORKLOAD_FUNCS[workload](rm.get_host(user_conf, hosts[hostname]['ip']), hostname, props)
+      except Exception as e:
+        # the other workloads are still worth running & recording.
+        print('Error: %s failed: %s' % (workload, e), file=sys.stderr)
+        results[workload] = { 'error': str(e) }
+  finally:
+    if master:
+      master_host.run(CLEAN_TEMPLATE.format(**targets['teragen'][1]), check=False)
+
+  return { 'time': int(start_time),
+           'label': label,
+           'data_gb': data_gb,
+           'hosts': summary,
+           'tuning': values,
+           'results': results,
+           'elapsed_sec': round(time.time() - start_time, 2),
+  }
+
+def describe_hosts(summary):
+  """
+  Returns e.g. 'm:4gb 3x8gb zk:3x1gb' for the hosts summary of a run.
+  """
+  items = []
+  if 'hadoop-master' in summary:
+    items.append('m:%s' % summary['hadoop-master'])
+    items.extend([ '%dx%s' % (count, slug) for slug, count in sorted(summary['hadoop'].items()) ])
+  if 'zookeeper' in summary:
+    items.append('zk:' + ','.join([ '%dx%s' % (count, slug) for slug, count in sorted(summary['zookeeper'].items()) ]))
+  return ' '.join(items)
+
+def report(runs, out=sys.stdout):
+  """
+  Prints given (cluster name, run) pairs as a table, with the change of each metric against the first run.
+  """
+  columns = [ column for column in COLUMNS if [ run for _, run in runs if column[1] in run['results'].get(column[0], dict()) ] ]
+
+  print('%-3s %-16s %-12s %-16s %-28s %s' % ('#', 'cluster', 'label', 'time', 'hosts', ' '.join([ '%18s' % header for _, _, header in columns ])), file=out)
+  baseline = runs[0][1]['results']
+  for index, (cluster_name, run) in enumerate(runs):
+    cells = []
+    for workload, metric, _ in columns:
+      value = run['results'].get(workload, dict()).get(metric)
+      base = baseline.get(workload, dict()).get(metric)
+      if value is None:
+        cells.append('%18s' % '-')
+      elif 0 < index and base:
+        cells.append('%18s' % ('%.1f (%+.0f%%)' % (value, 100.0 * (value - base) / base)))
+      else:
+        cells.append('%18.1f' % value)
+    print('%-3d %-16s %-12s %-16s %-28s %s' % (index, cluster_name, run.get('label') or '-', time.strftime('%Y-%m-%d %H:%M', time.localtime(run['time'])),
+                                               describe_hosts(run['hosts']), ' '.join(cells)), file=out)
+
+def get_runs(cluster_desc_files):
+  """
+  Returns (cluster name, run) pairs recorded in given cluster descriptions, in the order given.
+  """
+  runs = []
+  for cluster_desc_file in cluster_desc_files:
+    cluster_desc = jn.read_cluster_desc(cluster_desc_file)
+    name = cluster_desc.get(jn.CLUSTER_KEY, dict()).get('name', cluster_desc_file)
+    runs.extend([ (name, run) for run in cluster_desc.get(jn.BENCH_KEY, dict()).get('runs', []) ])
+  return runs
+
+def parse_args(args):
+  usage = 'Error: usage: docw bench <cluster>.json [--workloads %s] [--data GB] [--label text] | docw bench <cluster>.json --compare [<cluster>.json ...]' % ','.join(WORKLOADS)
+  options = { '--workloads': ','.join(WORKLOADS), '--data': str(DEFAULT_DATA_GB), '--label': None }
+  positional = []
+  compare = False
+  args = list(args)
+  while args:
+    arg = args.pop(0)
+    if '--compare' == arg:
+      compare = True
+    elif arg in options:
+      if not args:
+        raise ValueError(usage)
+      options[arg] = args.pop(0)
+    else:
+      positional.append(arg)
+
+  if not positional or (1 < len(positional) and not compare):
+    raise ValueError(usage)
+
+  workloads = options['--workloads'].split(',')
+  unknown = [ workload for workload in workloads if workload not in WORKLOADS ]
+  if unknown:
+    raise ValueError('Error: unknown workloads: %s' % ', '.join(unknown))
+  # terasort sorts the output of teragen.
+  if 'terasort' in workloads and 'teragen' not in workloads:
+    workloads.append('teragen')
+
+  try:
+    data_gb = float(options['--data'])
+  except ValueError:
+    raise ValueError(usage)
+  if data_gb <= 0:
+    raise ValueError(usage)
+
+  return positional, compare, [ workload for workload in WORKLOADS if workload in workloads ], data_gb, options['--label']
+
+def process(user_conf, args):
+  """
+  usage: docw bench <cluster>.json [--workloads teragen,terasort,dfsio,nnbench,zookeeper] [--data GB] [--label text]
+         docw bench <cluster>.json --compare [<cluster>.json ...]
+
+  Starts the daemons which are not running, runs given workloads (all, by default) against the given amount of data
+  and records their throughput & latency in the cluster description, along with the droplet sizes and tuning values
+  the cluster runs with. With --compare, prints the runs recorded in given descriptions, against the first one.
+  """
+  cluster_desc_files, compare, workloads, data_gb, label = parse_args(args)
+  if compare:
+    runs = get_runs(cluster_desc_files)
+    if not runs:
+      raise ValueError('Error: %s have no benchmark runs.' % ', '.join(cluster_desc_files))
+    report(runs)
+    return 0
+
+  cluster_desc_file = cluster_desc_files[0]
+  cluster_desc = jn.read_cluster_desc(cluster_desc_file)
+  if jn.CLUSTER_KEY not in cluster_desc:
+    raise ValueError('Error: %s has no cluster settings to benchmark.' % cluster_desc_file)
+
+  journal = jn.Journal(cluster_desc_file, cluster_desc)
+  cluster = journal.cluster()
+  create.start_trace(user_conf, cluster['name'])
+  create.start_logs(user_conf, cluster['name'])
+  try:
+    run_desc = run(user_conf, journal, workloads, data_gb, label)
+  finally:
+    rm.close_all()
+    tr.stop()
+    lg.stop()
+
+  runs = cluster_desc.get(jn.BENCH_KEY, dict()).get('runs', []) + [ run_desc ]
+  journal.update(jn.BENCH_KEY, runs=runs)
+  journal.save()
+
+  # this run, against the first one recorded.
+  report([ (cluster['name'], run) for run in runs[:1] + runs[1:][-1:] ])
+  return 0
@@ -0,0 +1,46 @@
+import hashlib
+
+def get_hash(content):
+  if isinstance(content, str):
+    content = content.encode('utf-8')
+  return hashlib.sha256(content).hexdigest()
+
+class ConfigStore(object):
+  """
+  Rendered config files of a cluster, each kept once by its content hash.
+
+  Hosts refer to their files by hash, so that the file shared by every host (or by every host of a size)
+  is rendered, hashed & held in memory only once.
+  """
+  def __init__(self):
+    self.contents = dict()
+    self.rendered = dict()
+
+  def add(self, content):
+    """
+    Stores given content and returns its hash.
+    """
+    content_hash = get_hash(content)
+    self.contents.setdefault(content_hash, content)
+    return content_hash
+
+  def render(self, func, **props):
+    """
+    Returns the hash of func(**props), calling it only for props not rendered yet. props are hashable values.
+    """
+    key = (func.__module__, func.__name__, tuple(sorted(props.items())))
+    if key not in self.rendered:
+      self.rendered[key] = self.add(func(**props))
+    return self.rendered[key]
+
+  def files(self, hashes):
+    """
+    Returns dict of path -> content for given dict of path -> hash.
+    """
+    return { path: self.contents[content_hash] for path, content_hash in hashes.items() }
+
+def get_changes(config_hashes, recorded_hashes):
+  """
+  Returns the paths whose hash differs from the recorded one (or which are not recorded).
+  """
+  return sorted([ path for path, content_hash in config_hashes.items() if recorded_hashes.get(path) != content_hash ])
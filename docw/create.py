@@ -1,18 +1,25 @@
-import importlib, json, os, tempfile, threading, time
+import importlib, json, os, sys, tempfile, threading, time
 
 from contextlib import closing
 import itertools as it
 
-import digitalocean as do
-import pexpect as pe
-import paramiko as pm
-import scp
-
+from docw import aptcache as ac
+from docw import configs as cs
+from docw import distribute as dt
+from docw import droplets as dr
 from docw import hadoop as hd
+from docw import hostkeys as hk
+from docw import images
+from docw import logs as lg
+from docw import remote as rm
+from docw import scheduler as sc
+from docw import trace as tr
+from docw import tuning
+from docw import inventory as iv
+from docw import journal as jn
 from docw import zookeeper as zk
 
 ROLE_ORDER = [ 'hadoop', 'zookeeper' ]
-SIZE_SLUG_ORDER = [ '512mb', '1gb', '2gb', '4gb', '8gb', '16gb' ]
 CLOUDCONFIG_TEMPLATE = """#cloud-config
 
 users:
@@ -24,30 +31,82 @@ users:
       - {public-key}
 
 timezone: {timezone}"""
-SSH_NEWKEY_MSG = 'Are you sure you want to continue connecting (yes/no)?'
-SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'scripts')
+ACTIVATION_POLL_INTERVAL = 5
 
 def get_droplet_name(cluster_name, index):
   return '%s-%d' % (cluster_name, index)
 
+def get_droplet_index(hostname):
+  return int(hostname[hostname.rindex('-') + 1:])
+
+def get_namer(cluster_name, existing):
+  """
+  Returns function (role, size_slug, master) -> hostname, which names the hosts of a cluster in the order they are laid out.
+
+  A host takes the name of an existing host of the same role, size & master flag which is not taken yet, otherwise
+  the lowest index no existing host uses; so the hosts of a cluster keep their names when it is scaled or resumed.
+  Without existing hosts, hosts are numbered from 0 in order.
+  """
+  available = dict()
+  for hostname in sorted(existing.keys(), key=get_droplet_index):
+    host_desc = existing[hostname]
+    available.setdefault((host_desc['role'], host_desc['size'], host_desc.get('master', False)), []).append(hostname)
+  used = set([ get_droplet_index(hostname) for hostname in existing.keys() ])
+  counter = ( index for index in it.count(0) if index not in used )
+
+  def name(role, size_slug, master=False):
+    hostnames = available.get((role, size_slug, master))
+    if hostnames:
+      return hostnames.pop(0)
+    return get_droplet_name(cluster_name, next(counter))
+
+  return name
+
+def get_existing(hosts):
+  """
+  Returns the host descriptions of given cluster description which record their role & size, for get_host_settings.
+  """
+  return { hostname: host_desc for hostname, host_desc in hosts.items() if 'role' in host_desc and 'size' in host_desc }
+
 def get_user_data(settings):
   return CLOUDCONFIG_TEMPLATE.format(**settings)
 
-def get_size_slugs(cluster_conf, role):
+def get_size_slugs(cluster_conf, role, size_specs):
   """
-  Returns list of size_slug required for given cluster_conf and role, in decreasing order.
+  Returns list of size_slug required for given cluster_conf and role, in decreasing order of memory & vcpus.
   """
   ret = []
   for hosts in (hosts for group in cluster_conf if role == group['role'] for hosts in group['hosts']):
+    if hosts['size'] not in size_specs:
+      raise ValueError('Error: unknown droplet size: %s' % hosts['size'])
     for _ in range(0, hosts['count']):
       ret.append(hosts['size'])
 
-  ret.sort(key=lambda x: SIZE_SLUG_ORDER.index(x))
+  ret.sort(key=lambda x: (size_specs[x]['memory'], size_specs[x]['vcpus']))
   ret.reverse()
   
   return ret
 
-def get_host_settings(user_conf, cluster_name, cluster_conf):
+def get_package_settings(user_conf, role):
+  """
+  Returns install path, repository and version of the package for given role.
+  """
+  settings = { 'install_path': os.path.join('/', 'home', user_conf['username'], user_conf['install'], role),
+               'data_path': os.path.join('/', 'home', user_conf['username'], user_conf.get('data', 'data'), role),
+               'repository': user_conf['repository.%s.%s' % (role, user_conf['region'])],
+               'version': user_conf['version.%s' % role],
+  }
+  
+  if 'zookeeper' == role:
+    # the transaction log goes to a directory of its own: e.g. on a volume, if configured.
+    if user_conf.get('zookeeper.data-log'):
+      settings['data_log_path'] = os.path.join('/', 'home', user_conf['username'], user_conf['zookeeper.data-log'])
+    else:
+      settings['data_log_path'] = os.path.join(settings['data_path'], 'txlog')
+  
+  return settings
+
+def get_host_settings(user_conf, cluster_name, cluster_conf, existing=None):
   """
   Returns list of droplet settings and dict of host configs.
   
@@ -75,6 +134,10 @@ def get_host_settings(user_conf, cluster_name, cluster_conf):
             '/home/dongjinleekr/opt/hadoop/etc/hadoop/core-site.xml': '...',
             '/home/dongjinleekr/opt/hadoop/etc/hadoop/mapred-site.xml': '...',
             ...
+          },
+          'config_hashes': {
+            '/home/dongjinleekr/opt/hadoop/etc/hadoop/core-site.xml': '3a5f...',
+            ...
           }
         },
         'droplet-1': {
@@ -86,6 +149,10 @@ def get_host_settings(user_conf, cluster_name, cluster_conf):
             '/home/dongjinleekr/opt/hadoop/etc/hadoop/core-site.xml': '...',
             '/home/dongjinleekr/opt/hadoop/etc/hadoop/mapred-site.xml': '...',
             ...
+          },
+          'config_hashes': {
+            '/home/dongjinleekr/opt/hadoop/etc/hadoop/core-site.xml': '3a5f...',
+            ...
           }
         },
       })
@@ -99,6 +166,9 @@ def get_host_settings(user_conf, cluster_name, cluster_conf):
     
     @type cluster_conf: listret
     @param cluster_conf: 
+    
+    @type existing: dict
+    @param existing: hostname -> description of the hosts the cluster already has, which keep their names (see get_namer).
 
   Returns:
     @return: pair of dict
@@ -109,88 +179,133 @@ def get_host_settings(user_conf, cluster_name, cluster_conf):
   user_data = get_user_data(user_conf)
   roles = set([ group['role'] for group in cluster_conf ])
   
-  counter = it.count(0)
+  size_specs = tuning.get_size_specs(user_conf)
+  store = cs.ConfigStore()
+  
+  name = get_namer(cluster_name, existing or dict())
   for role in sorted(roles, key=lambda r: ROLE_ORDER.index(r)):
-    size_slugs = get_size_slugs(cluster_conf, role)
-    install_path = os.path.join('/', 'home', user_conf['username'], user_conf['install'], role)
-    repository = user_conf['repository.%s.%s' % (role, user_conf['region'])]
-    version = user_conf['version.%s' % role]
+    size_slugs = get_size_slugs(cluster_conf, role, size_specs)
+    package_settings = get_package_settings(user_conf, role)
+    install_path = package_settings['install_path']
+    data_path = package_settings['data_path']
+    repository = package_settings['repository']
+    version = package_settings['version']
     
     if 'hadoop' == role:
-      # create dedicated master host
-      size_slugs.insert(0, '4gb')
-      hd_droplet_settings = [ { 'name': get_droplet_name(cluster_name, next(counter)),
-                                'image': user_conf['image'],
+      # create dedicated master host: of the size given in the template, or scaled to the number of slaves.
+      master_sizes = [ group['master'] for group in cluster_conf if role == group['role'] and 'master' in group ]
+      master_size = master_sizes[0] if master_sizes else tuning.get_master_size(len(size_slugs), size_specs, user_conf['region'])
+      if master_size not in size_specs:
+        raise ValueError('Error: unknown droplet size: %s' % master_size)
+      size_slugs.insert(0, master_size)
+    
+    # boot from the baked image of this role, if any, and if it fits the disk of every droplet.
+    baked_image = images.find_image(user_conf, role, min([ size_specs[size_slug]['disk'] for size_slug in size_slugs ]))
+    image = baked_image or user_conf['image']
+    tags = [ dr.get_cluster_tag(cluster_name), dr.get_role_tag(cluster_name, role) ]
+    
+    if 'hadoop' == role:
+      hd_droplet_settings = [ { 'name': name(role, size_slug, 0 == index),
+                                'image': image,
                                 'region': user_conf['region'],
                                 'timezone': user_conf['timezone'],
                                 'size_slug': size_slug,
                                 'user_data': user_data,
-                           } for size_slug in size_slugs ]
+                                'tags': tags,
+                           } for index, size_slug in enumerate(size_slugs) ]
       master_hostname = hd_droplet_settings[0]['name']
       slave_hostnames = [ setting['name'] for setting in hd_droplet_settings[1:] ]
           
-      map_task_total = sum([ hd.HADOOP_CONFIG_VALUES[size_slug]['map_task_per_node'] for size_slug in size_slugs[1:] ])
-      reduce_task_total = sum([ hd.HADOOP_CONFIG_VALUES[size_slug]['reduce_task_per_node'] for size_slug in size_slugs[1:] ])
+      # containers, heaps & task slots of each host, from its size.
+      tunings = tuning.get_hadoop_tuning(size_specs[size_slugs[0]], [ size_specs[size_slug] for size_slug in size_slugs[1:] ])
       
       config_path = os.path.join(install_path, 'etc', 'hadoop')
       core_site_path = os.path.join(config_path, 'core-site.xml')
       mapred_site_path = os.path.join(config_path, 'mapred-site.xml')
       hdfs_site_path = os.path.join(config_path, 'hdfs-site.xml')
       yarn_site_path = os.path.join(config_path, 'yarn-site.xml')
+      capacity_scheduler_path = os.path.join(config_path, 'capacity-scheduler.xml')
       master_path = os.path.join(config_path, 'master')
       slaves_path = os.path.join(config_path, 'slaves')
+      exclude_path = os.path.join(config_path, 'excludes')
       
-      core_site_value = hd.core_site_config(master=master_hostname)
-      hdfs_site_value = hd.hdfs_site_config(master=master_hostname)
-      master_value = master_hostname
-      slaves_value = '\n'.join(slave_hostnames)
+      # files shared by hosts are rendered once: hosts refer to them by hash.
+      core_site_hash = store.render(hd.core_site_config, master=master_hostname)
+      capacity_scheduler_hash = store.render(hd.capacity_scheduler_config)
+      master_hash = store.add(master_hostname)
+      slaves_hash = store.add('\n'.join(slave_hostnames))
+      # hosts being decommissioned (see: docw scale); empty otherwise.
+      exclude_hash = store.add('')
+      short_circuit = 'true' == user_conf.get('hdfs.short-circuit', 'false')
     
       hd_host_configs = dict()
       
-      for setting in hd_droplet_settings:
+      for setting, node_tuning in zip(hd_droplet_settings, tunings):
+        config_hashes = {
+          core_site_path: core_site_hash,
+          mapred_site_path: store.render(hd.mapred_site_config, master=master_hostname, **node_tuning),
+          hdfs_site_path: store.render(hd.hdfs_site_config, master=master_hostname, data_path=data_path,
+                                       exclude_path=exclude_path, short_circuit=short_circuit, **node_tuning),
+          yarn_site_path: store.render(hd.yarn_site_config, master=master_hostname, exclude_path=exclude_path, **node_tuning),
+          capacity_scheduler_path: capacity_scheduler_hash,
+          master_path: master_hash,
+          slaves_path: slaves_hash,
+          exclude_path: exclude_hash,
+        }
         hd_host_configs[setting['name']] = {
           'role': 'hadoop',
+          'master': master_hostname,
           'install_path': install_path,
+          'data_path': data_path,
+          'exclude_path': exclude_path,
           'repository': repository,
           'version': version,
-          'config': {
-            core_site_path: core_site_value,
-            mapred_site_path: hd.mapred_site_config(master=master_hostname,
-                                                    map_task_total=map_task_total,
-                                                    reduce_task_total=reduce_task_total,
-                                                    **dict(hd.HADOOP_CONFIG_VALUES[setting['size_slug']])),
-            hdfs_site_path: hdfs_site_value,
-            yarn_site_path: hd.yarn_site_config(master=master_hostname,
-                                                map_task_total=map_task_total,
-                                                reduce_task_total=reduce_task_total,
-                                                **dict(hd.HADOOP_CONFIG_VALUES[setting['size_slug']])),
-            master_path: master_value,
-            slaves_path: slaves_value,
-          }
+          'baked': baked_image is not None,
+          'config': store.files(config_hashes),
+          'config_hashes': config_hashes,
       }
       
       droplet_settings.extend(hd_droplet_settings)
       host_configs.update(hd_host_configs)
     elif 'zookeeper' == role:
-      # todo: the number of server is odd?
-      zk_droplet_settings = [ { 'name': get_droplet_name(cluster_name, next(counter)),
+      zk_droplet_settings = [ { 'name': name(role, size_slug),
+                                'image': image,
+                                'region': user_conf['region'],
+                                'timezone': user_conf['timezone'],
                                 'size_slug': size_slug,
                                 'user_data': user_data,
+                                'tags': tags,
                            } for size_slug in size_slugs ]
 
+      zk_hostnames = tuple([ setting['name'] for setting in zk_droplet_settings ])
+      
+      # voters & observers, timings and heap of each server, from the ensemble size & droplet sizes.
+      tunings = tuning.get_zookeeper_tuning([ size_specs[size_slug] for size_slug in size_slugs ])
+      
+      data_log_path = package_settings['data_log_path']
+      
       zkconfig_path = os.path.join(install_path, 'conf', 'zoo.cfg')
-      zkconfig_value = zk.config([ setting['name'] for setting in zk_droplet_settings ])
+      java_env_path = os.path.join(install_path, 'conf', 'java.env')
+      myid_path = os.path.join(data_path, 'myid')
       
       zk_host_configs = dict()
-      for setting in zk_droplet_settings:
+      for index, (setting, node_tuning) in enumerate(zip(zk_droplet_settings, tunings)):
+        config_hashes = {
+          zkconfig_path: store.render(zk.config, hosts=zk_hostnames, data_path=data_path, data_log_path=data_log_path, **node_tuning),
+          java_env_path: store.render(zk.java_env, heap_mb=node_tuning['heap_mb']),
+          # the id of the server, as in the server.N lines of zoo.cfg.
+          myid_path: store.add('%d\n' % (index + 1)),
+        }
         zk_host_configs[setting['name']] = {
           'role': 'zookeeper',
           'install_path': install_path,
+          'data_path': data_path,
+          'data_log_path': data_log_path,
           'repository': repository,
           'version': version,
-          'config': {
-            zkconfig_path: zkconfig_value,
-          }
+          'baked': baked_image is not None,
+          'config': store.files(config_hashes),
+          'config_hashes': config_hashes,
         }
 
       droplet_settings.extend(zk_droplet_settings)
@@ -198,14 +313,22 @@ def get_host_settings(user_conf, cluster_name, cluster_conf):
 
   return droplet_settings, host_configs
 
-def is_droplet_limit_sufficient(mngr, hostnames):
-  limit = mngr.get_account().droplet_limit
-  exists = len(mngr.get_all_droplets())
+def is_droplet_limit_sufficient(inventory, hostnames):
+  limit = inventory.account().droplet_limit
+  exists = inventory.droplet_count()
   
   return limit - exists >= len(hostnames)
 
-def all_hostnames_available(mngr, hostnames):
-  exists = set([ droplet.name for droplet in mngr.get_all_droplets() ])
+def all_hostnames_available(inventory, cluster_name, hostnames):
+  """
+  Returns whether no droplet of the account, tagged for the cluster or not, has any of given hostnames.
+
+  All droplets are listed only if the account has droplets other than the ones tagged for the cluster.
+  """
+  droplets = inventory.droplets(tag_name=dr.get_cluster_tag(cluster_name))
+  if inventory.droplet_count() > len(droplets):
+    droplets = inventory.droplets()
+  exists = set([ droplet.name for droplet in droplets ])
   
   if set.intersection(exists, set(hostnames)):
     return False
@@ -214,29 +337,50 @@ def all_hostnames_available(mngr, hostnames):
 
 def update_hosts(hostname_to_ips):
   '''
-  Add given hostname-ip set into /etc/hosts.
+  Add given hostname-ip set into /etc/hosts, skipping the ones it already has.
   '''
   with open('/etc/hosts', 'rt') as f:
     r = f.read()
-    s = '\n'.join([ '%s %s' % (public_ip, hostname) for hostname, public_ip in hostname_to_ips.items() ])
+    existing = set([ line.strip() for line in r.split('\n') ])
+    s = '\n'.join([ '%s %s' % (public_ip, hostname) for hostname, public_ip in hostname_to_ips.items()
+                     if '%s %s' % (public_ip, hostname) not in existing ])
     g_fd, g_path = tempfile.mkstemp()
     with closing(os.fdopen(g_fd, 'wt')) as g:
-      g.write(r + s + '\n')
+      g.write(r + (s + '\n' if s else ''))
 
   os.system('sudo mv %s /etc/hosts' % g_path)
   os.system('sudo service nscd restart')
 
-def get_ssh_client():
-  client = pm.SSHClient()
-  client.load_system_host_keys()
-  client.set_missing_host_key_policy(pm.AutoAddPolicy())
+def wait_for_droplets(inventory, droplet_ids, on_active=None, tag_name=None):
+  """
+  Blocks until all given droplets are active, calling on_active(droplet) as soon as each of them gets active.
   
-  return client
+  With tag_name, only the droplets with that tag are listed while polling.
+  """
+  waiting = set(droplet_ids)
+  print('waiting for new droplets are activated.', end='', flush=True)
+  while waiting:
+    time.sleep(ACTIVATION_POLL_INTERVAL)
+    print('.', end='', flush=True)
+    active_droplets = [ droplet for droplet in inventory.droplets(max_age=0, tag_name=tag_name) if droplet.id in waiting and 'active' == droplet.status ]
+    for droplet in active_droplets:
+      if on_active:
+        on_active(droplet)
+    waiting = waiting - set([ droplet.id for droplet in active_droplets ])
+  print('completed.')
 
-def configure_ssh(scp_client, public_key_path, private_key_path, host_hashes_path):
-  scp_client.put(public_key_path, './.ssh/')
-  scp_client.put(private_key_path, './.ssh/')
-  scp_client.put(host_hashes_path, './.ssh/known_hosts')
+def get_host_hashes(hostname, ip, private_ip, port=22):
+  """
+  Returns known_hosts entries of given host, waiting for its ssh server to come up.
+  """
+  return hk.get_known_hosts_lines([ name for name in [ hostname, ip, private_ip ] if name ], hk.fetch_host_key(ip, port), port)
+
+def configure_ssh(host, public_key_path, private_key_path):
+  host.put_file(public_key_path, '.ssh/%s' % os.path.basename(public_key_path), mode='644')
+  host.put_file(private_key_path, '.ssh/%s' % os.path.basename(private_key_path), mode='600')
+
+def configure_known_hosts(host, host_hashes):
+  host.put('.ssh/known_hosts', ''.join([ '%s\n' % host_hash for host_hash in host_hashes ]), mode='644')
 
 ETC_HOSTS_TEMPLATE = '''127.0.0.1 localhost
 
@@ -249,104 +393,139 @@ ff02::2 ip6-allrouters
 
 '''
 
-def configure_hosts_file(ssh_client, scp_client, hostname, hostname_to_ips):
-  hostnames = sorted(hostname_to_ips.keys(), key=lambda x: int(x[x.index('-') + 1:]))
+def configure_hosts_file(host, hostname, hostname_to_ips):
+  hostnames = sorted(hostname_to_ips.keys(), key=get_droplet_index)
   hosts_file_content = ETC_HOSTS_TEMPLATE + '\n'.join([ '%s %s' % (hostname_to_ips[hostname], hostname) for hostname in hostnames ]) + '\n'
   
-  tmp_fd, tmp_path = tempfile.mkstemp()
-  with closing(os.fdopen(tmp_fd, 'wt')) as f:
-    f.write(hosts_file_content)
-  scp_client.put(tmp_path, 'hosts')
-  
-  tmp_fd, tmp_path = tempfile.mkstemp()
-  with closing(os.fdopen(tmp_fd, 'wt')) as f:
-    f.write('mv hosts /etc/hosts')
+  host.put('/etc/hosts', hosts_file_content, sudo=True)
 
-  scp_client.put(tmp_path, './hosts_conf')
-  ssh_client.exec_command("chmod +x ./hosts_conf")
-  
-  _, stdout, _ = ssh_client.exec_command("sudo ./hosts_conf")
-  channel = stdout.channel
-  channel.recv_exit_status()
-
-def configure_system_packages(ssh_client, scp_client, commands):
-  tmp_fd, tmp_path = tempfile.mkstemp()
-  with closing(os.fdopen(tmp_fd, 'wt')) as f:
-    f.write(commands)
+def configure_system_packages(host, commands, check=True):
+  return host.run(commands, sudo=True, check=check)
 
-  scp_client.put(tmp_path, './system_packages_conf')
-  ssh_client.exec_command("chmod +x ./system_packages_conf")
-  
-  _, stdout, _ = ssh_client.exec_command("sudo ./system_packages_conf")
-  channel = stdout.channel
-  channel.recv_exit_status()
+def configure_user_packages(host, commands):
+  return host.run(commands)
 
-def configure_user_packages(ssh_client, scp_client, commands):
-  tmp_fd, tmp_path = tempfile.mkstemp()
+def configure_user_configs(host, configs):
+  host.put_files(configs)
 
-  with closing(os.fdopen(tmp_fd, 'wt')) as f:
-    f.write(commands)
-  
-  scp_client.put(tmp_path, './user_packages_conf')
-  ssh_client.exec_command("chmod +x ./user_packages_conf")
+def run_phase(scheduler, hostname, phase, message, func, *args, journal=None, **kwargs):
+  """
+  Runs one configuration phase of given host, through the scheduler if given, and prints its elapsed time.
   
-  _, stdout, _ = ssh_client.exec_command("./user_packages_conf")
-  channel = stdout.channel
-  channel.recv_exit_status()
-
-def configure_user_configs(scp_client, configs):
-  for path, contents in configs.items():
-    tmp_fd, tmp_path = tempfile.mkstemp()
-    with closing(os.fdopen(tmp_fd, 'wt')) as f:
-      f.write(contents)
-    scp_client.put(tmp_path, path)
-
-def configure_host(hostname, host_config, user_conf, hostname_to_ips, host_hashes_path):
-  print('%s: Configuration started.' % hostname)
-  ssh_client = get_ssh_client()
-  ssh_key = pm.RSAKey.from_private_key_file(user_conf['private_key_path'])
-  ssh_client.connect(hostname=hostname,
-                     username=user_conf['username'],
-                     pkey=ssh_key)
-  scp_client = scp.SCPClient(ssh_client.get_transport())
+  With a journal, a phase which is already recorded is skipped (returning None) and a completed one is recorded.
+  """
+  if journal and journal.done(hostname, phase):
+    print('%s: %s skipped: already completed.' % (hostname, message))
+    return None
   
-  # update ssh files
   start_time = time.time()
-  configure_ssh(scp_client, user_conf['public_key_path'], user_conf['private_key_path'], host_hashes_path)
+  with tr.span(phase, host=hostname), lg.capture(hostname, phase):
+    if scheduler:
+      ret = scheduler.call(phase, func, *args, **kwargs)
+    else:
+      ret = func(*args, **kwargs)
   elapsed_time = time.time() - start_time
-  print('%s: updating ./ssh completed: %.2f sec' % (hostname, elapsed_time))
+  print('%s: %s completed: %.2f sec' % (hostname, message, elapsed_time))
   
-  # update /etc/hosts
-  start_time = time.time()
-  configure_hosts_file(ssh_client, scp_client, hostname, hostname_to_ips)
-  elapsed_time = time.time() - start_time
-  print('%s: updating /etc/hosts completed: %.2f sec' % (hostname, elapsed_time))
+  if journal:
+    journal.record(hostname, phase)
   
+  return ret
+
+def configure_packages(hostname, host, host_config, distributor=None, apt_cache=None, scheduler=None, journal=None):
   module = importlib.import_module('docw.{module}'.format(module=host_config['role']))
   
+  # point apt to the package cache: not journaled, since the cache may be served by another host this time.
+  if apt_cache and not (journal and journal.done(hostname, 'system_packages')):
+    commands = apt_cache.host_cmds(hostname)
+    if commands:
+      status = run_phase(scheduler, hostname, 'apt_cache', 'Configuring apt cache', configure_system_packages, host, commands, check=False)
+      apt_cache.host_configured(hostname, 0 == status)
+  
   # install system packages
-  start_time = time.time()
   commands = getattr(module, 'system_packages_cmds')()
-  configure_system_packages(ssh_client, scp_client, commands)
-  elapsed_time = time.time() - start_time
-  print('%s: Installing system packages completed: %.2f sec' % (hostname, elapsed_time))
+  run_phase(scheduler, hostname, 'system_packages', 'Installing system packages', configure_system_packages, host, commands, journal=journal)
+  
+  # relay the package tarball
+  if distributor:
+    run_phase(scheduler, hostname, 'relay', 'Relaying package tarball', distributor.deliver, hostname, host, host_config, journal=journal)
   
   # install the package
-  start_time = time.time()
   commands = getattr(module, 'user_packages_cmds')(**host_config)
-  configure_user_packages(ssh_client, scp_client, commands)
-  elapsed_time = time.time() - start_time
-  print('%s: Installing user packages completed: %.2f sec' % (hostname, elapsed_time))
-  
-  # upload config files
-  start_time = time.time()
-  configure_user_configs(scp_client, host_config['config'])
-  elapsed_time = time.time() - start_time
-  print('%s: Installing user config files completed: %.2f sec' % (hostname, elapsed_time))
+  run_phase(scheduler, hostname, 'user_packages', 'Installing user packages', configure_user_packages, host, commands, journal=journal)
+
+def provision_host(hostname, host_config, user_conf, ip, private_ip, hostname_to_ssh_hashes, distributor=None, apt_cache=None, scheduler=None, journal=None):
+  """
+  Runs the phases of given host which don't need the view of the whole cluster, as soon as it is active.
+  """
+  try:
+    print('%s: Provisioning started.' % hostname)
+    
+    # add ssh footprint
+    if journal and journal.done(hostname, 'ssh_footprint'):
+      hostname_to_ssh_hashes[hostname] = journal.host(hostname)['ssh_hashes']
+      print('%s: adding ssh footprint skipped: already completed.' % hostname)
+    else:
+      hostname_to_ssh_hashes[hostname] = run_phase(scheduler, hostname, 'ssh_footprint', 'adding ssh footprint',
+                                                   get_host_hashes, hostname, ip, private_ip, int(user_conf.get('ssh-port', 22)))
+      if journal:
+        journal.record(hostname, 'ssh_footprint', ssh_hashes=hostname_to_ssh_hashes[hostname])
+    host = rm.get_host(user_conf, ip)
+    
+    # update ssh files
+    run_phase(scheduler, hostname, 'ssh', 'updating ./ssh', configure_ssh,
+              host, user_conf['public_key_path'], user_conf['private_key_path'], journal=journal)
+    
+    if host_config.get('baked'):
+      print('%s: Installing packages skipped: booted from baked image.' % hostname)
+    else:
+      configure_packages(hostname, host, host_config, distributor, apt_cache, scheduler, journal)
+    
+    print('%s: Provisioning completed.' % hostname)
+  finally:
+    if apt_cache:
+      # never leave other hosts waiting for a cache which won't come up.
+      apt_cache.host_configured(hostname, False)
 
-  ssh_client.close()
+def finalize_host(hostname, host_config, user_conf, hostname_to_ips, hostname_to_private_ips, host_hashes, scheduler=None, journal=None):
+  """
+  Runs the phases of given host which need the view of the whole cluster: known_hosts, /etc/hosts & config files.
+  
+  The host is reached by its public ip, but its /etc/hosts resolves the other hosts to their private ips,
+  so that the traffic between hosts (and config files, which refer to hostnames) stays in the private network.
+  """
+  host = rm.get_host(user_conf, hostname_to_ips[hostname])
+  
+  # update known_hosts
+  run_phase(scheduler, hostname, 'known_hosts', 'updating known_hosts', configure_known_hosts, host, host_hashes, journal=journal)
+  
+  # update /etc/hosts
+  hostname_to_node_ips = { name: hostname_to_private_ips.get(name) or ip for name, ip in hostname_to_ips.items() }
+  run_phase(scheduler, hostname, 'hosts', 'updating /etc/hosts', configure_hosts_file, host, hostname, hostname_to_node_ips, journal=journal)
+  
+  # upload config files, recording their hashes for 'docw reconfigure'
+  if journal and journal.done(hostname, 'configs'):
+    print('%s: Installing user config files skipped: already completed.' % hostname)
+  else:
+    run_phase(scheduler, hostname, 'configs', 'Installing user config files', configure_user_configs, host, host_config['config'])
+    if journal:
+      journal.record(hostname, 'configs', configs=host_config['config_hashes'])
+  
   print('%s: Configuration completed.' % hostname)
 
+def start_trace(user_conf, cluster_name):
+  if 'true' == user_conf.get('trace', 'true'):
+    trace_filename = '%s.trace.jsonl' % cluster_name
+    tr.start(trace_filename)
+    print('trace is recorded to %s' % trace_filename)
+
+def start_logs(user_conf, cluster_name):
+  # the output of remote commands, per host & phase.
+  if 'true' == user_conf.get('logs', 'true'):
+    logs_dirname = os.path.join(os.path.expanduser(user_conf.get('logs-dir', lg.DEFAULT_LOGS_DIR)), cluster_name)
+    lg.start(logs_dirname)
+    print('remote output is logged to %s' % logs_dirname)
+
 def process(user_conf, args):
   cluster_name = args[0]
   cluster_config = os.path.abspath(args[1])
@@ -354,76 +533,132 @@ def process(user_conf, args):
     cluster_settings = json.loads(file.read())
   droplet_settings, host_configs = get_host_settings(user_conf, cluster_name, cluster_settings)
   
-  mngr = do.Manager(**user_conf)
+  start_trace(user_conf, cluster_name)
+  start_logs(user_conf, cluster_name)
+  try:
+    create_cluster(user_conf, cluster_name, cluster_settings, droplet_settings, host_configs)
+  finally:
+    tr.stop()
+    lg.stop()
+
+def create_droplets(user_conf, journal, droplet_settings, host_configs):
+  """
+  Creates droplets of given settings and records them to the journal, so that they are destroyable whatever happens next.
+  """
+  hostname_to_droplet_ids, failures = dr.create_droplets(user_conf, droplet_settings)
+  iv.get_inventory(user_conf).invalidate('droplets')
+  
+  size_slugs = { setting['name']: setting['size_slug'] for setting in droplet_settings }
+  for hostname, droplet_id in hostname_to_droplet_ids.items():
+    host_config = host_configs[hostname]
+    journal.update(hostname, id=droplet_id, role=host_config['role'], size=size_slugs[hostname],
+                   master=hostname == host_config.get('master'), baked=host_config.get('baked', False))
+  journal.save()
+  
+  if failures:
+    for hostname, error in sorted(failures.items()):
+      print('Error: failed to create %s: %s' % (hostname, error), file=sys.stderr)
+    
+    raise ValueError('Error: %d of %d droplets were not created. created droplets are stored to %s, run \'docw resume %s\' to retry.'
+                     % (len(failures), len(droplet_settings), journal.path, journal.path))
+
+def create_cluster(user_conf, cluster_name, cluster_settings, droplet_settings, host_configs):
+  inventory = iv.get_inventory(user_conf)
   
   # validate
   hostnames = [ setting['name'] for setting in droplet_settings ]
 
-  if False == is_droplet_limit_sufficient(mngr, hostnames):
+  if False == is_droplet_limit_sufficient(inventory, hostnames):
     raise ValueError('Error: you cannot create %d droplets now.' % len(hostnames))
   
-  if False == all_hostnames_available(mngr, hostnames):
+  if False == all_hostnames_available(inventory, cluster_name, hostnames):
     raise ValueError('Error: Duplicated droplet name.')
   
   # create droplets
-  hostname_to_droplet_ids = dict()
-  for setting in droplet_settings:
-    droplet = do.Droplet(token=user_conf['token'],
-                          ssh_keys=[ user_conf['public-key'] ],
-                          private_ip_address=True,
-                          private_networking=True,
-                          **setting)
-    droplet.create()
-    hostname_to_droplet_ids[setting['name']] = droplet.id
-  
-  # wait until all droplets are activated
-  waiting = set(hostname_to_droplet_ids.values())
-  print('waiting for new droplets are activated.', end='', flush=True)
-  while waiting:
-    time.sleep(5)
-    print('.', end='', flush=True)
-    active_droplet_ids = set([ droplet.id for droplet in mngr.get_all_droplets() if 'active' == droplet.status ])
-    waiting = waiting - active_droplet_ids
-  print('completed.')
+  created_time = time.time()
+  journal = jn.Journal('%s.json' % cluster_name, { jn.CLUSTER_KEY: { 'name': cluster_name, 'settings': cluster_settings } })
+  create_droplets(user_conf, journal, droplet_settings, host_configs)
   
-  # inspect ip addresses
-  hostname_to_ips = dict([ (droplet.name, droplet.ip_address)
-                for droplet in mngr.get_all_droplets() if droplet.id in hostname_to_droplet_ids.values() ])
+  provision_cluster(user_conf, journal, host_configs, created_time)
+
+def finalize_cluster(user_conf, journal, host_configs, hostname_to_ips, hostname_to_private_ips, hostname_to_ssh_hashes, scheduler):
+  """
+  Runs the phases which need the view of the whole cluster on every host, once all of them are provisioned.
+  """
+  hostnames = list(host_configs.keys())
   
-  # add to /etc/hosts
-  update_hosts(hostname_to_ips)
+  # barrier: the rest needs the view of the whole cluster. the operator reaches the hosts by their public ips.
+  with tr.span('update_etc_hosts'):
+    update_hosts(hostname_to_ips)
+  host_hashes = [ ssh_hash for hostname in hostnames for ssh_hash in hostname_to_ssh_hashes[hostname] ]
+  with tr.span('update_known_hosts'):
+    hk.add_known_hosts(user_conf['known_hosts_path'], host_hashes)
+  journal.save()
+  print('cluster description is stored to %s' % journal.path)
   
-  # write cluster file
-  cluster_desc_filename = '%s.json' % cluster_name
-  cluster_desc = { hostname: { 'id': hostname_to_droplet_ids[hostname],
-                    'ip': hostname_to_ips[hostname] } for hostname in hostnames }
-  with open(cluster_desc_filename, 'w') as f:
-    json.dump(cluster_desc, f)
+  for hostname in hostnames:
+    scheduler.submit(hostname, finalize_host,
+                     hostname, host_configs[hostname], user_conf, hostname_to_ips, hostname_to_private_ips, host_hashes, scheduler, journal)
+  _, failures = scheduler.wait()
+  
+  if failures:
+    for hostname, error in sorted(failures.items()):
+      print('Error: failed to configure %s: %s' % (hostname, error), file=sys.stderr)
+    raise ValueError('Error: %d of %d hosts were not configured, run \'docw resume %s\' to retry.' % (len(failures), len(hostnames), journal.path))
 
-  print('cluster description is stored to %s' % cluster_desc_filename)
+def restore_baked(journal, host_configs):
+  """
+  Droplets keep the image they were created with, whatever is baked (or deleted) since: baked hosts never record
+  the package phases, so installing the packages again would wipe their config files.
+  """
+  for hostname, host_desc in journal.hosts().items():
+    if hostname in host_configs:
+      host_configs[hostname]['baked'] = host_desc.get('baked', False)
+
+def provision_cluster(user_conf, journal, host_configs, created_time):
+  """
+  Provisions & configures the droplets recorded in the journal, skipping the phases it already records.
+  """
+  inventory = iv.get_inventory(user_conf)
+  hostnames = list(host_configs.keys())
+  hostname_to_droplet_ids = { hostname: host_desc['id'] for hostname, host_desc in journal.hosts().items() }
+  restore_baked(journal, host_configs)
+  
+  # fetch package tarballs while droplets are booting
+  distributor = dt.Distributor(user_conf, { hostname: host_config for hostname, host_config in host_configs.items()
+                                            if not journal.done(hostname, 'relay') })
+  threading.Thread(target=distributor.prepare, name='distributor').start()
+  apt_cache = ac.AptCache(user_conf)
+  scheduler = sc.get_scheduler(user_conf)
   
-  # add ssh footprint
+  # provision each host as soon as its droplet is active
+  hostname_to_ips = dict()
+  hostname_to_private_ips = dict()
   hostname_to_ssh_hashes = dict()
-  for hostname in hostname_to_ips.keys():
-    child = pe.spawn('/usr/bin/ssh-copy-id -i %s %s@%s' % (user_conf['public_key_path'], user_conf['username'], hostname))
-    child.expect(SSH_NEWKEY_MSG)
-    child.sendline('yes\r')
-    child.expect(pe.EOF, timeout=None)
-  
-    with open(user_conf['known_hosts_path']) as f:
-      hostname_to_ssh_hashes[hostname] = [ ssh_hash.strip() for ssh_hash in f.readlines()[-2:]]
-      # update cluster file
-      cluster_desc[hostname]['ssh_hashes'] = hostname_to_ssh_hashes[hostname]
-      with open(cluster_desc_filename, 'w') as g:
-        json.dump(cluster_desc, g)
-
-  tmp_hashes_fd, tmp_hashes_path = tempfile.mkstemp()
-  with closing(os.fdopen(tmp_hashes_fd, 'wt')) as f:
-    f.write('\n'.join([ ssh_hash for ssh_hashes in hostname_to_ssh_hashes.values() for ssh_hash in ssh_hashes ]))
-
-  # do configuration
-  threads = [ threading.Thread(target=configure_host,
-                               args=(hostname, host_configs[hostname], user_conf, hostname_to_ips, tmp_hashes_path),
-                               name=hostname) for hostname in hostname_to_ips.keys() ]
-  [ thread.start() for thread in threads ]
-  [ thread.join() for thread in threads ]
\ No newline at end of file
+  distributor.hostname_to_private_ips = hostname_to_private_ips
+  distributor.hostname_to_ssh_hashes = hostname_to_ssh_hashes
+  apt_cache.hostname_to_private_ips = hostname_to_private_ips
+  
+  def on_active(droplet):
+    tr.record('activation', created_time, time.time() - created_time, host=droplet.name)
+    hostname_to_ips[droplet.name] = droplet.ip_address
+    hostname_to_private_ips[droplet.name] = droplet.private_ip_address
+    journal.update(droplet.name, ip=droplet.ip_address, private_ip=droplet.private_ip_address)
+    scheduler.submit(droplet.name, provision_host,
+                     droplet.name, host_configs[droplet.name], user_conf, droplet.ip_address, droplet.private_ip_address,
+                     hostname_to_ssh_hashes, distributor, apt_cache, scheduler, journal)
+  
+  try:
+    wait_for_droplets(inventory, hostname_to_droplet_ids.values(), on_active, dr.get_cluster_tag(journal.cluster()['name']))
+    _, failures = scheduler.wait()
+    
+    if failures:
+      for hostname, error in sorted(failures.items()):
+        print('Error: failed to provision %s: %s' % (hostname, error), file=sys.stderr)
+      raise ValueError('Error: %d of %d hosts were not provisioned, run \'docw resume %s\' to retry.' % (len(failures), len(hostnames), journal.path))
+    
+    finalize_cluster(user_conf, journal, host_configs, hostname_to_ips, hostname_to_private_ips, hostname_to_ssh_hashes, scheduler)
+  finally:
+    journal.save()
+    scheduler.shutdown()
+    rm.close_all()
@@ -1,10 +1,22 @@
-import json, os, shutil, tempfile
+import os, shutil, sys, tempfile, time, urllib.parse
 
 from contextlib import closing
 
-import digitalocean as do
+from docw import droplets as dr
+from docw import inventory as iv
+from docw import journal as jn
+from docw import scheduler as sc
+from docw import utils
+
+do = utils.lazy_import('digitalocean')
+
+# seconds between two checks whether the destroyed droplets are gone.
+CONFIRM_INTERVAL = 2
+# seconds to wait until the destroyed droplets are gone.
+CONFIRM_TIMEOUT = 300
 
 def update_ssh_hashes(known_hosts_path, ssh_hashes):
+  ssh_hashes = set(ssh_hashes)
   with open(known_hosts_path, 'rt') as f:
     g_fd, g_path = tempfile.mkstemp()
     with closing(os.fdopen(g_fd, 'wt')) as g:
@@ -29,26 +41,132 @@ def update_hosts(hostname_to_ips):
   os.system('sudo mv %s /etc/hosts' % g_path)
   os.system('sudo service nscd restart')
 
+def destroy_droplet(token, droplet_id):
+  """
+  Requests the deletion of given droplet. A droplet which doesn't exist counts as destroyed.
+  """
+  try:
+    do.Droplet(token=token, id=droplet_id).destroy()
+  except do.NotFoundError:
+    pass
+
+def destroy_tagged(token, tag_name):
+  """
+  Requests the deletion of every droplet with given tag, with a single request.
+  """
+  do.Manager(token=token).get_data('droplets/?%s' % urllib.parse.urlencode({ 'tag_name': tag_name }), type=do.baseapi.DELETE)
+
+def is_destroyed(token, droplet_id):
+  try:
+    do.Droplet(token=token, id=droplet_id).get_data('droplets/%s' % droplet_id)
+    return False
+  except do.NotFoundError:
+    return True
+
+def is_tag_empty(token, tag_name):
+  return not do.Manager(token=token).get_all_droplets(tag_name=tag_name)
+
+def destroy_droplets(user_conf, droplet_ids, tag_names=()):
+  """
+  Destroys given droplets & the droplets with given tags concurrently, and waits until they are gone.
+
+  Droplets are checked one by one and tags with a tag-filtered listing, never listing the whole account.
+
+  Returns:
+    @return: dict of droplet id or tag -> exception, for the ones which were not destroyed.
+  """
+  token = user_conf['token']
+  scheduler = sc.get_scheduler(user_conf)
+  try:
+    for droplet_id in droplet_ids:
+      scheduler.submit(droplet_id, scheduler.call, 'destroy', destroy_droplet, token, droplet_id)
+    for tag_name in tag_names:
+      scheduler.submit(tag_name, scheduler.call, 'destroy', destroy_tagged, token, tag_name)
+    _, failures = scheduler.wait()
+
+    # confirm
+    waiting = (set(droplet_ids) | set(tag_names)) - set(failures.keys())
+    deadline = time.time() + CONFIRM_TIMEOUT
+    while waiting:
+      for key in waiting:
+        scheduler.submit(key, scheduler.call, 'confirm', is_tag_empty if key in tag_names else is_destroyed, token, key)
+      results, errors = scheduler.wait()
+      waiting = set([ key for key in waiting if not results.get(key) ])
+
+      if waiting and time.time() > deadline:
+        for key in waiting:
+          failures[key] = errors.get(key) or ValueError('Error: %s is not gone after %d sec.' % (key, CONFIRM_TIMEOUT))
+        break
+      if waiting:
+        time.sleep(CONFIRM_INTERVAL)
+  finally:
+    scheduler.shutdown()
+    iv.get_inventory(user_conf).invalidate('droplets')
+
+  return failures
+
+def get_cluster_desc(user_conf, arg):
+  """
+  Returns (path of cluster description or None, cluster description) of given argument,
+  which is either a cluster description or the name of a cluster whose description is lost.
+  """
+  for path in [ arg, '%s.json' % arg ]:
+    if os.path.isfile(path):
+      return os.path.abspath(path), jn.read_cluster_desc(path)
+
+  # rebuild what can be rebuilt from the cluster tag.
+  droplets = iv.get_inventory(user_conf).droplets(max_age=0, tag_name=dr.get_cluster_tag(arg))
+  if not droplets:
+    raise ValueError('Error: neither %s nor a cluster named %s exists.' % (arg, arg))
+
+  cluster_desc = { droplet.name: { 'id': droplet.id, 'ip': droplet.ip_address } for droplet in droplets }
+  cluster_desc[jn.CLUSTER_KEY] = { 'name': arg }
+  return None, cluster_desc
+
 def process(user_conf, args):
-  cluster_desc_file = os.path.abspath(args[0])
-  with open(cluster_desc_file) as f:
-    cluster_desc = json.loads(f.read())
-  
+  """
+  usage: docw destroy (<cluster>.json|<cluster>) [(<cluster>.json|<cluster>) ...]
+  """
+  if not args:
+    raise ValueError('Error: usage: docw destroy (<cluster>.json|<cluster>) [(<cluster>.json|<cluster>) ...]')
+
+  cluster_descs = [ get_cluster_desc(user_conf, arg) for arg in args ]
+
+  # destroy droplets of every cluster at once: a tagged cluster with a single request, the others droplet by droplet.
+  droplet_ids = set()
+  tag_names = set()
+  for _, cluster_desc in cluster_descs:
+    if jn.CLUSTER_KEY in cluster_desc:
+      tag_names.add(dr.get_cluster_tag(cluster_desc[jn.CLUSTER_KEY]['name']))
+    else:
+      droplet_ids.update([ host_desc['id'] for host_desc in jn.get_hosts(cluster_desc).values() ])
+
+  start_time = time.time()
+  failures = destroy_droplets(user_conf, droplet_ids, tag_names)
+  print('%d clusters destroyed: %.2f sec' % (len(cluster_descs), time.time() - start_time))
+
+  def is_failed(cluster_desc):
+    if jn.CLUSTER_KEY in cluster_desc:
+      return dr.get_cluster_tag(cluster_desc[jn.CLUSTER_KEY]['name']) in failures
+    return bool([ host_desc for host_desc in jn.get_hosts(cluster_desc).values() if host_desc['id'] in failures ])
+
+  destroyed = [ (path, cluster_desc) for path, cluster_desc in cluster_descs if not is_failed(cluster_desc) ]
+  host_descs = { hostname: host_desc for _, cluster_desc in destroyed for hostname, host_desc in jn.get_hosts(cluster_desc).items() }
+
   # update ~/.ssh/known_hosts
   update_ssh_hashes(user_conf['known_hosts_path'],
-                    [ ssh_hash for host_desc in cluster_desc.values() if 'ssh_hashes' in host_desc
+                    [ ssh_hash for host_desc in host_descs.values() if 'ssh_hashes' in host_desc
                       for ssh_hash in host_desc['ssh_hashes'] ])
-  
+
   # update /etc/hosts
-  update_hosts({ hostname: host_desc['ip'] for hostname, host_desc in cluster_desc.items() })
-  
-  # destroy droplets
-  droplet_ids = set([ host_desc['id'] for host_desc in cluster_desc.values() ])
-  mngr = do.Manager(**user_conf)
-  
-  for droplet in mngr.get_all_droplets():
-    if droplet.id in droplet_ids:
-      droplet.destroy()
+  update_hosts({ hostname: host_desc['ip'] for hostname, host_desc in host_descs.items() if 'ip' in host_desc })
 
   # remove
-  os.remove(cluster_desc_file)
\ No newline at end of file
+  for path, _ in destroyed:
+    if path:
+      os.remove(path)
+
+  if failures:
+    for key, error in sorted(failures.items(), key=lambda x: str(x[0])):
+      print('Error: failed to destroy %s: %s' % (key, error), file=sys.stderr)
+    raise ValueError('Error: %d of %d clusters were not destroyed; their cluster descriptions are kept.' % (len(cluster_descs) - len(destroyed), len(cluster_descs)))
@@ -0,0 +1,214 @@
+import hashlib, os, re, shutil, threading, urllib.request
+
+from docw import trace as tr
+
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.docw/cache')
+# directory (relative to the home directory of each droplet) where the tarballs are kept.
+REMOTE_CACHE_DIR = '.docw'
+# the maximum number of hosts which pull the tarball from a single source at the same time.
+DEFAULT_FANOUT = 2
+# checksum files published by apache, in order of preference, with the algorithms read from each.
+# hadoop 2.x publishes a single .mds file, which holds the digests of several algorithms.
+CHECKSUM_SUFFIXES = [ ('.sha512', [ 'sha512' ]),
+                      ('.mds', [ 'sha512', 'sha256', 'sha1', 'md5' ]),
+                      ('.sha256', [ 'sha256' ]),
+                      ('.sha1', [ 'sha1' ]),
+                      ('.md5', [ 'md5' ]) ]
+# the apache archive keeps the checksums of every release, which mirrors often don't carry.
+DIST_URL = 'https://archive.apache.org/dist/'
+DIST_PATHS = { 'hadoop': 'hadoop/common', 'zookeeper': 'zookeeper' }
+OPERATOR = None
+# pulls a tarball from another host, trusting only that host's key.
+RELAY_TEMPLATE = '''cat > {dir}/known_hosts.relay <<'EOF'
+{known_hosts}
+EOF
+scp -q -P {port} -o BatchMode=yes -o UserKnownHostsFile={dir}/known_hosts.relay {username}@{address}:{path} {path}.part && mv {path}.part {path}'''
+
+def get_tarball_name(role, version):
+  return '{role}-{version}.tar.gz'.format(role=role, version=version)
+
+def get_tarball_url(repository, role, version):
+  return '{repository}/{role}-{version}/{tarball}'.format(repository=repository, role=role, version=version,
+                                                          tarball=get_tarball_name(role, version))
+
+def get_dist_url(role, version):
+  return get_tarball_url(DIST_URL + DIST_PATHS[role], role, version) if role in DIST_PATHS else None
+
+def relay_cmds(known_hosts, username, address, port, path):
+  """
+  Returns the commands which pull given path from given host, over the ssh port of the droplets.
+  """
+  return RELAY_TEMPLATE.format(known_hosts='\n'.join(known_hosts), username=username, address=address, port=port, path=path, dir=REMOTE_CACHE_DIR)
+
+def get_remote_tarball_path(role, version):
+  return os.path.join(REMOTE_CACHE_DIR, get_tarball_name(role, version))
+
+def parse_checksum(text, algorithm):
+  """
+  Extracts the hex digest of given algorithm from a checksum file in one of the formats apache publishes:
+  'digest  filename' (sha*sum), 'ALGO (filename) = digest' (bsd), 'filename: dd dd ...' (gpg --print-md) or
+  the 'filename: ALGO = dd dd ...' lines of the digests of an .mds file (gpg --print-mds).
+  """
+  length = hashlib.new(algorithm).digest_size * 2
+  # gpg wraps long digests onto indented lines.
+  for entry in re.findall(r'^\S.*(?:\n[ \t]+\S.*)*', text, re.M):
+    match = re.match(r'^[^:=(]*:\s*([\w-]+)\s*=(.*)$', entry, re.S) or re.match(r'^([\w-]+)\s*\(.*\)\s*=(.*)$', entry, re.S)
+    if match:
+      if algorithm != match.group(1).replace('-', '').lower():
+        continue
+      candidate = match.group(2)
+    elif re.match(r'^[^\s:]+:', entry):
+      candidate = entry[entry.index(':') + 1:]
+    else:
+      candidate = entry.split()[0]
+
+    digest = re.sub(r'\s', '', candidate).lower()
+    if re.match('^[0-9a-f]{%d}$' % length, digest):
+      return digest
+
+  raise ValueError('Error: can\'t parse %s checksum: %s' % (algorithm, text.strip()))
+
+def fetch_checksum(urls):
+  """
+  Returns pair of (algorithm, hex digest) published for the tarball of given urls, trying them in order.
+  """
+  for url in urls:
+    for suffix, algorithms in CHECKSUM_SUFFIXES:
+      try:
+        with urllib.request.urlopen(url + suffix, timeout=30) as f:
+          text = f.read().decode('utf-8', 'replace')
+      except IOError:
+        continue
+
+      for algorithm in algorithms:
+        try:
+          return algorithm, parse_checksum(text, algorithm)
+        except ValueError:
+          continue
+
+  raise ValueError('Error: no checksum is published for %s' % urls[0])
+
+def get_file_checksum(path, algorithm):
+  digest = hashlib.new(algorithm)
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      digest.update(chunk)
+
+  return digest.hexdigest()
+
+def fetch_tarball(url, checksum, cache_dir=DEFAULT_CACHE_DIR):
+  """
+  Downloads given url into the local cache unless a verified copy is already there, and returns its path.
+  """
+  algorithm, digest = checksum
+  path = os.path.join(cache_dir, os.path.basename(url))
+
+  if os.path.exists(path) and digest == get_file_checksum(path, algorithm):
+    return path
+
+  os.makedirs(cache_dir, exist_ok=True)
+  tmp_path = path + '.part'
+  print('downloading %s.' % url)
+  with urllib.request.urlopen(url) as f, open(tmp_path, 'wb') as g:
+    shutil.copyfileobj(f, g)
+
+  if digest != get_file_checksum(tmp_path, algorithm):
+    os.remove(tmp_path)
+    raise ValueError('Error: checksum mismatch: %s' % url)
+
+  os.replace(tmp_path, path)
+  return path
+
+class Distributor(object):
+  """
+  Relays package tarballs to the hosts of a cluster.
+
+  Each tarball is fetched & verified once, uploaded to the first host which asks for it,
+  and then pulled by the other hosts from the hosts which already hold it, over the private network.
+  Since every holder serves at most 'fanout' hosts at once, the copies spread as a tree.
+  """
+  def __init__(self, user_conf, host_configs, fanout=DEFAULT_FANOUT):
+    self.user_conf = user_conf
+    # hosts pull from each other via these addresses & known_hosts entries, once they are known.
+    self.hostname_to_private_ips = dict()
+    self.hostname_to_ssh_hashes = dict()
+    self.prepared = threading.Event()
+    self.fanout = fanout
+    self.condition = threading.Condition()
+    self.packages = dict()
+    self.local_paths = dict()
+    self.holders = dict()
+    self.sending = dict()
+
+    for host_config in host_configs.values():
+      key = (host_config['role'], host_config['version'])
+      if not host_config.get('baked') and key not in self.packages:
+        self.packages[key] = get_tarball_url(host_config['repository'], *key)
+        self.holders[key] = []
+
+  def prepare(self):
+    """
+    Fetches & verifies every tarball on the operator machine.
+    
+    A package which can't be fetched is dropped, so that its hosts download it from the mirror by themselves.
+    """
+    try:
+      for key, url in list(self.packages.items()):
+        try:
+          with tr.span('fetch_tarball', package='%s-%s' % key):
+            checksum = fetch_checksum([ checksum_url for checksum_url in (get_dist_url(*key), url) if checksum_url ])
+            self.local_paths[key] = fetch_tarball(url, checksum)
+        except Exception as e:
+          print('Warning: can\'t fetch %s (%s), hosts will download it by themselves.' % (url, e))
+          del self.packages[key]
+    finally:
+      self.prepared.set()
+
+  def acquire_source(self, key):
+    with self.condition:
+      while True:
+        candidates = [ holder for holder in self.holders[key] if self.sending.get((key, holder), 0) < self.fanout ]
+        if not self.holders[key] and 0 == self.sending.get((key, OPERATOR), 0):
+          candidates = [ OPERATOR ]
+        if candidates:
+          source = min(candidates, key=lambda holder: self.sending.get((key, holder), 0))
+          self.sending[(key, source)] = self.sending.get((key, source), 0) + 1
+          return source
+        self.condition.wait()
+
+  def release_source(self, key, source, hostname=None):
+    with self.condition:
+      self.sending[(key, source)] -= 1
+      if hostname is not None:
+        self.holders[key].append(hostname)
+      self.condition.notify_all()
+
+  def deliver(self, hostname, host, host_config):
+    """
+    Places the tarball of given host's package into its remote cache directory.
+    """
+    self.prepared.wait()
+    key = (host_config['role'], host_config['version'])
+    if key not in self.packages:
+      return
+
+    remote_path = get_remote_tarball_path(*key)
+    host.execute('mkdir -p %s' % REMOTE_CACHE_DIR)
+
+    source = self.acquire_source(key)
+    delivered = False
+    try:
+      if source is not OPERATOR:
+        delivered = 0 == host.run(relay_cmds(self.hostname_to_ssh_hashes.get(source, []),
+                                             self.user_conf['username'],
+                                             self.hostname_to_private_ips.get(source) or source,
+                                             int(self.user_conf.get('ssh-port', 22)),
+                                             remote_path), check=False)
+        if not delivered:
+          print('%s: Warning: pulling %s from %s failed, uploading it.' % (hostname, remote_path, source))
+
+      if not delivered:
+        host.put_file(self.local_paths[key], remote_path)
+        delivered = True
+    finally:
+      self.release_source(key, source, hostname if delivered else None)
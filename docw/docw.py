@@ -6,10 +6,10 @@ Created on Jan 27, 2015
 
 import sys, os, importlib
 
-import digitalocean as do
+from docw import metadata as md
 
 def printHelp():
-  helpMsg = 'Usage: docw (create|destroy) [command-args]'
+  helpMsg = 'Usage: docw (create|resume|reconfigure|scale|bench|destroy|list|plan|bake|profile) [--refresh] [command-args]'
   print(helpMsg)
 
 default_config = {
@@ -19,7 +19,19 @@ default_config = {
   'region': 'sfo1',
   'timezone': 'US/Pacific',
   'install': 'opt',
+  'data': 'data',
   'ssh-dir': os.path.expanduser('~/.ssh'),
+  'ssh-port': '22',
+  'apt-cache': 'none',
+  'concurrency': '32',
+  'retries': '1',
+  'trace': 'true',
+  'logs': 'true',
+  'logs-dir': os.path.expanduser('~/.docw/logs'),
+  'log-tail': '20',
+  'metadata-ttl': '86400',
+  'hdfs.short-circuit': 'false',
+  'zookeeper.data-log': '',
   # package versions
   'version.hadoop': '2.5.2',
   'version.zookeeper': '3.4.6',
@@ -62,13 +74,45 @@ timezone=US/Pacific
 
 # Package installation path of each droplet (base: home directory)
 install=opt
+
+# Data path of each droplet, e.g. hdfs blocks (base: home directory)
+data=data
+
+# Apt package cache: none, first (run apt-cacher-ng on the first droplet) or url of an existing cache (e.g. http://10.0.0.2:3142)
+apt-cache=none
+
+# The maximum number of hosts configured at the same time, and of each phase (e.g. concurrency.system_packages=8).
+# phases: ssh_footprint, ssh, apt_cache, system_packages, relay, user_packages, known_hosts, hosts, configs
+concurrency=32
+
+# The number of retries of a failed phase
+retries=1
+
+# Record timing of every phase to [cluster-name].trace.jsonl (true|false). see: docw profile
+trace=true
+
+# Write the output of remote commands to [logs-dir]/[cluster-name]/[host]/[phase].log (true|false),
+# and the number of its last lines shown when a command fails.
+logs=true
+logs-dir=~/.docw/logs
+log-tail=20
+
+# Seconds for which regions, droplet sizes & images are cached in ~/.docw/cache.json (run with --refresh to read them again)
+metadata-ttl=86400
+
+# HDFS short-circuit local reads: clients on a datanode read its blocks directly from the disk (true|false)
+hdfs.short-circuit=false
+
+# ZooKeeper transaction log path of each droplet (base: home directory), e.g. the mount point of a volume.
+# If empty, it goes to txlog under the zookeeper data path.
+zookeeper.data-log=
 '''
 
 def read_user_config(path):
   with open(path, 'r') as f:
     return { line.split('=')[0].strip(): line.split('=')[1].strip() for line in f.readlines() if 2 == len(line.split('='))}
 
-def get_user_conf():
+def get_user_conf(refresh=False):
   if not os.path.exists(DEFAULT_DOCW_CONF_DIR):
     os.mkdir(DEFAULT_DOCW_CONF_DIR)
     with open(DEFAULT_DOCW_CONF_FILE, 'w') as f:
@@ -85,10 +129,10 @@ def get_user_conf():
 
   user_config = read_user_config(DEFAULT_DOCW_CONF_FILE)
   config = dict(default_config, **user_config)
+  config['refresh'] = 'true' if refresh else 'false'
   
-  # validate token & region
-  mngr = do.Manager(token=config['token'])
-  regions = set([ region.slug for region in mngr.get_all_regions() ])
+  # validate token & region, against the cached regions if they are fresh.
+  regions = set([ region['slug'] for region in md.regions(config) ])
   
   if config['region'] not in regions:
     raise ValueError("Error: Invalid region - %s" % config['region'])
@@ -105,7 +149,9 @@ def get_user_conf():
   
   return config
 
-COMMANDS = { 'create', 'destroy' }
+COMMANDS = { 'create', 'resume', 'reconfigure', 'scale', 'bench', 'destroy', 'list', 'plan', 'bake', 'profile' }
+# commands which don't need the user configuration (nor the network)
+LOCAL_COMMANDS = { 'profile' }
 
 def main():
   if len(sys.argv) < 2:
@@ -113,11 +159,17 @@ def main():
     return 1
   
   command = sys.argv[1]
-  user_conf = get_user_conf()
+  if command not in COMMANDS:
+    printHelp()
+    return 1
+  
+  # --refresh reads regions, sizes & images from the api, ignoring their cache.
+  args = [ arg for arg in sys.argv[2:] if '--refresh' != arg ]
+  user_conf = None if command in LOCAL_COMMANDS else get_user_conf(len(args) < len(sys.argv[2:]))
   
   module = importlib.import_module('docw.{module}'.format(module=command))
   func = getattr(module, 'process')
-  return func(user_conf, sys.argv[2:])
+  return func(user_conf, args)
 
 if __name__ == '__main__':
   sys.exit(main())
\ No newline at end of file
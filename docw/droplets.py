@@ -0,0 +1,140 @@
+import concurrent.futures as cf
+import itertools as it
+
+from docw import trace as tr
+from docw import utils
+
+do = utils.lazy_import('digitalocean')
+
+# the maximum number of names accepted by a single multi-droplet create request.
+MULTI_CREATE_LIMIT = 10
+# the maximum number of concurrent single-droplet create requests.
+DEFAULT_CREATE_WORKERS = 8
+# prefix of the tags given to the droplets of a cluster: 'docw:<cluster>' and 'docw:<cluster>:<role>'.
+TAG_PREFIX = 'docw:'
+# the hostname prefix of the droplets bake provisions, which are tagged as clusters of their own.
+BAKE_PREFIX = 'docw-bake-'
+
+def get_cluster_tag(cluster_name):
+  return '%s%s' % (TAG_PREFIX, cluster_name)
+
+def get_role_tag(cluster_name, role):
+  return '%s%s:%s' % (TAG_PREFIX, cluster_name, role)
+
+def get_cluster_name(tag_name):
+  """
+  Returns the cluster name of given cluster tag, or None if it is not a cluster tag.
+  """
+  if not tag_name.startswith(TAG_PREFIX) or ':' in tag_name[len(TAG_PREFIX):]:
+    return None
+
+  return tag_name[len(TAG_PREFIX):]
+
+def get_ssh_key_id(user_conf):
+  """
+  Returns the id of the user's public key in the account, registering it if it is not there yet.
+  """
+  public_key = user_conf['public-key'].split()[:2]
+  with tr.span('ssh_key', category='api'):
+    for key in do.Manager(token=user_conf['token']).get_all_sshkeys():
+      if public_key == key.public_key.split()[:2]:
+        return key.id
+
+    key = do.SSHKey(token=user_conf['token'], name='docw-%s' % user_conf['username'], public_key=user_conf['public-key'])
+    key.create()
+    return key.id
+
+def get_create_kwargs(user_conf, ssh_key_id):
+  return { 'token': user_conf['token'],
+           'ssh_keys': [ ssh_key_id ],
+           'private_ip_address': True,
+           'private_networking': True,
+  }
+
+def group_droplet_settings(droplet_settings):
+  """
+  Groups droplet settings which differ only in their names, keeping the given order.
+  """
+  groups = []
+  keys = []
+  for setting in droplet_settings:
+    key = sorted([ (k, str(v)) for k, v in setting.items() if 'name' != k ])
+    if key in keys:
+      groups[keys.index(key)].append(setting)
+    else:
+      keys.append(key)
+      groups.append([ setting ])
+
+  return groups
+
+def chunks(iterable, size):
+  iterator = iter(iterable)
+  chunk = list(it.islice(iterator, size))
+  while chunk:
+    yield chunk
+    chunk = list(it.islice(iterator, size))
+
+def create_single(user_conf, ssh_key_id, setting):
+  droplet = do.Droplet(**dict(get_create_kwargs(user_conf, ssh_key_id), **setting))
+  with tr.span('create', host=setting['name'], category='api'):
+    droplet.create()
+  return droplet.id
+
+def create_multiple(user_conf, ssh_key_id, settings):
+  common = dict(settings[0])
+  del common['name']
+  with tr.span('create_multiple', category='api', count=len(settings)):
+    droplets = do.Droplet.create_multiple(names=[ setting['name'] for setting in settings ],
+                                          **dict(get_create_kwargs(user_conf, ssh_key_id), **common))
+
+  return { droplet.name: droplet.id for droplet in droplets }
+
+def create_droplets(user_conf, droplet_settings, workers=DEFAULT_CREATE_WORKERS):
+  """
+  Creates droplets for given settings, using multi-droplet create requests where possible.
+
+  Settings which can't be created in bulk (or whose bulk request failed) are created
+  one by one, with at most 'workers' requests in flight. A failed request doesn't abort the others.
+
+  Args:
+    @type user_conf: dict
+    @param user_conf: user configuration.
+
+    @type droplet_settings: list
+    @param droplet_settings: droplet settings, as returned by create.get_host_settings.
+
+  Returns:
+    @return: pair of dict (hostname -> droplet id, hostname -> exception)
+  """
+  hostname_to_droplet_ids = dict()
+  failures = dict()
+  remaining = []
+  if not droplet_settings:
+    return hostname_to_droplet_ids, failures
+
+  # resolved once: each request naming the raw key would look it up (or register it) again.
+  ssh_key_id = get_ssh_key_id(user_conf)
+
+  for group in group_droplet_settings(droplet_settings):
+    if 1 == len(group) or not hasattr(do.Droplet, 'create_multiple'):
+      remaining.extend(group)
+      continue
+
+    for chunk in chunks(group, MULTI_CREATE_LIMIT):
+      try:
+        hostname_to_droplet_ids.update(create_multiple(user_conf, ssh_key_id, chunk))
+      except Exception as e:
+        print('Warning: bulk creation of %s failed (%s), retrying one by one.' % (', '.join([ setting['name'] for setting in chunk ]), e))
+        remaining.extend(chunk)
+
+  if remaining:
+    with cf.ThreadPoolExecutor(max_workers=max(1, min(workers, len(remaining)))) as executor:
+      futures = { executor.submit(create_single, user_conf, ssh_key_id, setting): setting['name'] for setting in remaining }
+      for future in cf.as_completed(futures):
+        hostname = futures[future]
+        try:
+          hostname_to_droplet_ids[hostname] = future.result()
+        except Exception as e:
+          failures[hostname] = e
+
+  return hostname_to_droplet_ids, failures
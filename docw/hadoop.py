@@ -1,62 +1,110 @@
 #!/usr/bin/python3
 
-from lxml import etree as et
-
-HADOOP_CONFIG_VALUES = {
-  '4gb': {
-    'container_heap_max': 2048,
-    'map_task_heap_max': 1024,
-    'reduce_task_heap_max': 1024,
-    'map_jvm_heap_max': 896,
-    'reduce_jvm_heap_max': 896,
-    'map_task_per_node': 2,
-    'reduce_task_per_node': 2,
-  },
-  '8gb': {
-    'container_heap_max': 4096,
-    'map_task_heap_max': 1024,
-    'reduce_task_heap_max': 1024,
-    'map_jvm_heap_max': 896,
-    'reduce_jvm_heap_max': 896,
-    'map_task_per_node': 4,
-    'reduce_task_per_node': 4,
-  },
-  '16gb': {
-    'container_heap_max': 8192,
-    'map_task_heap_max': 1024,
-    'reduce_task_heap_max': 1024,
-    'map_jvm_heap_max': 896,
-    'reduce_jvm_heap_max': 896,
-    'map_task_per_node': 8,
-    'reduce_task_per_node': 8,
-  },
-}
+import os
+
+from docw import utils
+
+et = utils.lazy_import('lxml.etree')
 
 INSTALLER_TEMPLATE = '''# Make directory
 
 mkdir -p $(dirname {install_path})
+mkdir -p {data_path}
 
 # Download & Install
 
-wget {repository}/hadoop-{version}/hadoop-{version}.tar.gz
-tar -xvf hadoop-{version}.tar.gz
+# the tarball may have been relayed from other hosts already.
+mkdir -p ${{HOME}}/.docw
+if [ ! -f ${{HOME}}/.docw/hadoop-{version}.tar.gz ]; then
+  wget -O ${{HOME}}/.docw/hadoop-{version}.tar.gz.part {repository}/hadoop-{version}/hadoop-{version}.tar.gz && \\
+    mv ${{HOME}}/.docw/hadoop-{version}.tar.gz.part ${{HOME}}/.docw/hadoop-{version}.tar.gz
+fi
+tar -xvf ${{HOME}}/.docw/hadoop-{version}.tar.gz
+rm -rf {install_path}
 mv hadoop-{version} {install_path}
-rm hadoop-{version}.tar.gz
 cp /usr/lib/libsnappy.so {install_path}/lib/native/
 
 sed -i -e '/^export\ JAVA_HOME/s/^.*$/export\ JAVA_HOME=\/usr\/lib\/jvm\/java-7-oracle/' {install_path}/etc/hadoop/hadoop-env.sh
 
 # Set env variables
 
-echo '' >> ${{HOME}}/.bashrc
-echo "export HADOOP_PREFIX={install_path}" >> ${{HOME}}/.bashrc
-echo 'export HADOOP_CONF_DIR=${{HADOOP_PREFIX}}/etc/hadoop' >> ${{HOME}}/.bashrc
-echo 'export HADOOP_MAPRED_HOME=${{HADOOP_PREFIX}}' >> ${{HOME}}/.bashrc
-echo 'export HADOOP_COMMON_HOME=${{HADOOP_PREFIX}}' >> ${{HOME}}/.bashrc
-echo 'export HADOOP_HDFS_HOME=${{HADOOP_PREFIX}}' >> ${{HOME}}/.bashrc
-echo 'export HADOOP_YARN_HOME=${{HADOOP_PREFIX}}' >> ${{HOME}}/.bashrc
-echo '' >> ${{HOME}}/.bashrc
-echo 'export PATH=$PATH:${{HADOOP_PREFIX}}/bin:${{HADOOP_PREFIX}}/sbin' >> ${{HOME}}/.bashrc'''
+# (skipped if already set, so that the installer can be re-run)
+if ! grep -q 'export HADOOP_PREFIX=' ${{HOME}}/.bashrc; then
+  echo '' >> ${{HOME}}/.bashrc
+  echo "export HADOOP_PREFIX={install_path}" >> ${{HOME}}/.bashrc
+  echo 'export HADOOP_CONF_DIR=${{HADOOP_PREFIX}}/etc/hadoop' >> ${{HOME}}/.bashrc
+  echo 'export HADOOP_MAPRED_HOME=${{HADOOP_PREFIX}}' >> ${{HOME}}/.bashrc
+  echo 'export HADOOP_COMMON_HOME=${{HADOOP_PREFIX}}' >> ${{HOME}}/.bashrc
+  echo 'export HADOOP_HDFS_HOME=${{HADOOP_PREFIX}}' >> ${{HOME}}/.bashrc
+  echo 'export HADOOP_YARN_HOME=${{HADOOP_PREFIX}}' >> ${{HOME}}/.bashrc
+  echo '' >> ${{HOME}}/.bashrc
+  echo 'export PATH=$PATH:${{HADOOP_PREFIX}}/bin:${{HADOOP_PREFIX}}/sbin' >> ${{HOME}}/.bashrc
+fi'''
+
+# daemons which read each config file, in the order they are restarted.
+CONFIG_DAEMONS = {
+  'core-site.xml': [ 'namenode', 'secondarynamenode', 'datanode', 'resourcemanager', 'nodemanager' ],
+  'hdfs-site.xml': [ 'namenode', 'secondarynamenode', 'datanode' ],
+  'yarn-site.xml': [ 'resourcemanager', 'nodemanager' ],
+  'capacity-scheduler.xml': [ 'resourcemanager' ],
+}
+DAEMON_ORDER = [ 'namenode', 'secondarynamenode', 'datanode', 'resourcemanager', 'nodemanager' ]
+YARN_DAEMONS = { 'resourcemanager', 'nodemanager' }
+
+# daemons are found by the '-Dproc_<daemon>' option of their jvm; the ones not running are left alone.
+RESTART_TEMPLATE = '''if pgrep -f -- '-Dproc_{daemon} ' > /dev/null; then
+  {install_path}/sbin/{script} stop {daemon}
+  {install_path}/sbin/{script} start {daemon}
+fi'''
+
+# writes the excludes file of the master, and makes the running namenode & resourcemanager read it again.
+EXCLUDE_TEMPLATE = '''printf '%s' '{hostnames}' > {exclude_path}
+if pgrep -f -- '-Dproc_namenode ' > /dev/null; then
+  {install_path}/bin/hdfs dfsadmin -refreshNodes
+fi
+if pgrep -f -- '-Dproc_resourcemanager ' > /dev/null; then
+  {install_path}/bin/yarn rmadmin -refreshNodes
+fi'''
+
+# exit status of DECOMMISSION_WAIT_TEMPLATE when no namenode runs, so no block can be moved away.
+NAMENODE_NOT_RUNNING = 3
+# waits until the namenode reports every given datanode decommissioned, i.e. their blocks are replicated elsewhere.
+DECOMMISSION_WAIT_TEMPLATE = '''if ! pgrep -f -- '-Dproc_namenode ' > /dev/null; then
+  exit {not_running}
+fi
+while true; do
+  report=$({install_path}/bin/hdfs dfsadmin -report | awk '/^Hostname:/ {{ host = $2 }} /^Decommission Status/ {{ print host, $NF }}')
+  pending=0
+  for hostname in {hostnames}; do
+    echo "$report" | grep -qx "$hostname Decommissioned" || pending=1
+  done
+  if [ 0 -eq $pending ]; then
+    exit 0
+  fi
+  if [ $SECONDS -ge {timeout} ]; then
+    exit 1
+  fi
+  sleep {interval}
+done'''
+
+# starts hdfs & yarn from the master, formatting hdfs on the first start, and waits until every datanode joined.
+START_TEMPLATE = '''if [ ! -d {data_path}/namenode/current ]; then
+  {install_path}/bin/hdfs namenode -format -nonInteractive
+fi
+if ! pgrep -f -- '-Dproc_namenode ' > /dev/null; then
+  {install_path}/sbin/start-dfs.sh
+fi
+if ! pgrep -f -- '-Dproc_resourcemanager ' > /dev/null; then
+  {install_path}/sbin/start-yarn.sh
+fi
+until [ $({install_path}/bin/hdfs dfsadmin -report 2> /dev/null | grep -c '^Name:') -ge {datanodes} ]; do
+  if [ $SECONDS -ge {timeout} ]; then
+    echo 'datanodes did not join in {timeout} sec.'
+    exit 1
+  fi
+  sleep 3
+done
+{install_path}/bin/hdfs dfsadmin -safemode wait'''
 
 def toXML(props):
   root_node = et.Element('configuration')
@@ -74,33 +122,122 @@ def core_site_config(**props):
   })
 
 def mapred_site_config(**props):
+  """
+  Returns mapred-site.xml for given tuning values (see tuning.get_hadoop_tuning).
+  """
   return toXML({ 'mapreduce.framework.name': 'yarn'.format(**props),
                 'mapreduce.jobtracker.address': '{master}:54311'.format(**props),
-                'mapreduce.map.memory.mb': '{map_task_heap_max}'.format(**props),
-                'mapreduce.reduce.memory.mb': '{reduce_task_heap_max}'.format(**props),
-                'mapreduce.map.java.opts': '-Xmx{map_jvm_heap_max}m'.format(**props),
-                'mapreduce.reduce.java.opts': '-Xmx{reduce_jvm_heap_max}m'.format(**props),
-                'mapreduce.job.maps': '{map_task_per_node}'.format(**props),
-                'mapreduce.job.reduces': '{reduce_task_per_node}'.format(**props),
-                'mapreduce.tasktracker.map.tasks.maximum': '{map_task_total}'.format(**props),
-                'mapreduce.tasktracker.reduce.tasks.maximum': '{reduce_task_total}'.format(**props),
+                'mapreduce.map.memory.mb': '{map_mb}'.format(**props),
+                'mapreduce.reduce.memory.mb': '{reduce_mb}'.format(**props),
+                'mapreduce.map.java.opts': '-Xmx{map_heap_mb}m'.format(**props),
+                'mapreduce.reduce.java.opts': '-Xmx{reduce_heap_mb}m'.format(**props),
+                'mapreduce.map.cpu.vcores': '1',
+                'mapreduce.reduce.cpu.vcores': '1',
+                'mapreduce.task.io.sort.mb': '{sort_mb}'.format(**props),
+                'yarn.app.mapreduce.am.resource.mb': '{am_mb}'.format(**props),
+                'yarn.app.mapreduce.am.command-opts': '-Xmx{am_heap_mb}m'.format(**props),
+                'mapreduce.job.maps': '{map_task_total}'.format(**props),
+                'mapreduce.job.reduces': '{reduce_task_total}'.format(**props),
+                'mapreduce.tasktracker.map.tasks.maximum': '{map_task_per_node}'.format(**props),
+                'mapreduce.tasktracker.reduce.tasks.maximum': '{reduce_task_per_node}'.format(**props),
   })
 
 def hdfs_site_config(**props):
-  return toXML({ 'dfs.replication': '3',
-                'dfs.secondary.http.address': '{master}:50090'.format(**props),
-                'dfs.permissions': 'false'.format(**props),
-  })
+  """
+  Returns hdfs-site.xml for given tuning values (see tuning.get_hadoop_tuning).
+
+  With short_circuit, clients on a datanode read its blocks directly from the disk, through a domain socket.
+  """
+  props = dict({ 'short_circuit': False }, **props)
+  config = { 'dfs.replication': '{replication}'.format(**props),
+             'dfs.namenode.replication.min': '1',
+             'dfs.blocksize': '{block_size_mb}m'.format(**props),
+             'dfs.namenode.handler.count': '{namenode_handlers}'.format(**props),
+             'dfs.datanode.handler.count': '{datanode_handlers}'.format(**props),
+             'dfs.namenode.name.dir': 'file://{data_path}/namenode'.format(**props),
+             'dfs.namenode.checkpoint.dir': 'file://{data_path}/namesecondary'.format(**props),
+             'dfs.datanode.data.dir': 'file://{data_path}/datanode'.format(**props),
+             'dfs.secondary.http.address': '{master}:50090'.format(**props),
+             'dfs.permissions': 'false'.format(**props),
+             'dfs.hosts.exclude': '{exclude_path}'.format(**props),
+  }
+
+  if props['short_circuit']:
+    config.update({ 'dfs.client.read.shortcircuit': 'true',
+                    'dfs.domain.socket.path': '{data_path}/dn_socket'.format(**props),
+    })
+
+  return toXML(config)
 
 def yarn_site_config(**props):
+  """
+  Returns yarn-site.xml for given tuning values (see tuning.get_hadoop_tuning).
+  """
   return toXML({ 'yarn.nodemanager.aux-services': 'mapreduce_shuffle',
                 'yarn.nodemanager.aux-services.mapreduce.shuffle.class': 'org.apache.hadoop.mapred.ShuffleHandler',
-                'yarn.nodemanager.resource.memory-mb': '{container_heap_max}'.format(**props),
+                'yarn.nodemanager.resource.memory-mb': '{nm_memory_mb}'.format(**props),
+                'yarn.nodemanager.resource.cpu-vcores': '{nm_vcores}'.format(**props),
+                'yarn.scheduler.minimum-allocation-mb': '{scheduler_min_mb}'.format(**props),
+                'yarn.scheduler.maximum-allocation-mb': '{scheduler_max_mb}'.format(**props),
+                'yarn.scheduler.maximum-allocation-vcores': '{scheduler_max_vcores}'.format(**props),
                 'yarn.resourcemanager.resource-tracker.address': '{master}:8025'.format(**props),
                 'yarn.resourcemanager.scheduler.address': '{master}:8030'.format(**props),
                 'yarn.resourcemanager.address': '{master}:8040'.format(**props),
+                'yarn.resourcemanager.nodes.exclude-path': '{exclude_path}'.format(**props),
+  })
+
+def capacity_scheduler_config(**props):
+  """
+  Returns capacity-scheduler.xml with a single queue, which schedules containers by both memory & vcores.
+  """
+  return toXML({ 'yarn.scheduler.capacity.maximum-applications': '10000',
+                'yarn.scheduler.capacity.maximum-am-resource-percent': '0.1',
+                'yarn.scheduler.capacity.resource-calculator': 'org.apache.hadoop.yarn.util.resource.DominantResourceCalculator',
+                'yarn.scheduler.capacity.root.queues': 'default',
+                'yarn.scheduler.capacity.root.default.capacity': '100',
+                'yarn.scheduler.capacity.root.default.user-limit-factor': '1',
+                'yarn.scheduler.capacity.root.default.maximum-capacity': '100',
+                'yarn.scheduler.capacity.root.default.state': 'RUNNING',
+                'yarn.scheduler.capacity.root.default.acl_submit_applications': '*',
+                'yarn.scheduler.capacity.root.default.acl_administer_queue': '*',
+                'yarn.scheduler.capacity.node-locality-delay': '40',
   })
 
+def get_daemons(paths):
+  """
+  Returns the daemons which read given config files. mapred-site.xml, master & slaves are read by clients & scripts only.
+  """
+  daemons = set([ daemon for path in paths for daemon in CONFIG_DAEMONS.get(os.path.basename(path), []) ])
+  return [ daemon for daemon in DAEMON_ORDER if daemon in daemons ]
+
+def restart_cmds(paths, **props):
+  """
+  Returns the commands restarting the daemons running on the host which read given config files, or None.
+  """
+  daemons = get_daemons(paths)
+  if not daemons:
+    return None
+
+  return '\n'.join([ RESTART_TEMPLATE.format(daemon=daemon,
+                                             script='yarn-daemon.sh' if daemon in YARN_DAEMONS else 'hadoop-daemon.sh',
+                                             **props) for daemon in daemons ])
+
+def exclude_cmds(hostnames, **props):
+  """
+  Returns the commands run on the master which exclude given hosts from hdfs & yarn (none, to include all of them again).
+  """
+  return EXCLUDE_TEMPLATE.format(hostnames='\n'.join(hostnames), **props)
+
+def decommission_wait_cmds(hostnames, timeout, interval, **props):
+  return DECOMMISSION_WAIT_TEMPLATE.format(hostnames=' '.join(hostnames), timeout=timeout, interval=interval,
+                                           not_running=NAMENODE_NOT_RUNNING, **props)
+
+def start_cmds(datanodes, timeout, **props):
+  """
+  Returns the commands run on the master which start the daemons not running yet, and wait for given number of datanodes.
+  """
+  return START_TEMPLATE.format(datanodes=datanodes, timeout=timeout, **props)
+
 def system_packages_cmds():
   return '''apt-get update
 apt-get -y install build-essential software-properties-common python-software-properties
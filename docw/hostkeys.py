@@ -0,0 +1,81 @@
+import concurrent.futures as cf
+import os, socket, time
+
+from docw import utils
+
+pm = utils.lazy_import('paramiko')
+
+DEFAULT_HARVEST_WORKERS = 32
+# new droplets may become active before their sshd accepts connections.
+DEFAULT_HARVEST_TIMEOUT = 300
+HARVEST_RETRY_INTERVAL = 3
+
+def fetch_host_key(address, port=22, timeout=DEFAULT_HARVEST_TIMEOUT):
+  """
+  Returns the host key of given address, retrying until the ssh server is reachable or timeout expires.
+  """
+  deadline = time.time() + timeout
+  while True:
+    try:
+      sock = socket.create_connection((address, port), timeout=10)
+      transport = pm.Transport(sock)
+      try:
+        transport.start_client(timeout=10)
+        return transport.get_remote_server_key()
+      finally:
+        transport.close()
+    except (socket.error, pm.SSHException, EOFError):
+      if time.time() > deadline:
+        raise
+      time.sleep(HARVEST_RETRY_INTERVAL)
+
+def get_known_hosts_lines(names, key, port=22):
+  """
+  Returns hashed known_hosts entries of given key, one for each of given names.
+  """
+  if 22 != port:
+    names = [ '[%s]:%d' % (name, port) for name in names ]
+
+  return [ '%s %s %s' % (pm.HostKeys.hash_host(name), key.get_name(), key.get_base64()) for name in names ]
+
+def harvest_host_keys(hostname_to_ips, hostname_to_aliases=None, port=22, workers=DEFAULT_HARVEST_WORKERS, timeout=DEFAULT_HARVEST_TIMEOUT):
+  """
+  Collects host keys of given hosts concurrently.
+
+  Entries are made for the hostname, the ip and every alias (e.g. private ip) of each host.
+
+  Returns:
+    @return: pair of dict (hostname -> list of known_hosts entries, hostname -> exception)
+  """
+  hostname_to_ssh_hashes = dict()
+  failures = dict()
+
+  if not hostname_to_ips:
+    return hostname_to_ssh_hashes, failures
+
+  with cf.ThreadPoolExecutor(max_workers=max(1, min(workers, len(hostname_to_ips)))) as executor:
+    futures = { executor.submit(fetch_host_key, ip, port, timeout): hostname for hostname, ip in hostname_to_ips.items() }
+    for future in cf.as_completed(futures):
+      hostname = futures[future]
+      try:
+        names = [ hostname, hostname_to_ips[hostname] ] + [ alias for alias in (hostname_to_aliases or dict()).get(hostname, []) if alias ]
+        hostname_to_ssh_hashes[hostname] = get_known_hosts_lines(names, future.result(), port)
+      except Exception as e:
+        failures[hostname] = e
+
+  return hostname_to_ssh_hashes, failures
+
+def add_known_hosts(known_hosts_path, ssh_hashes):
+  """
+  Appends given entries to known_hosts file with a single atomic write, skipping the ones it already has.
+  """
+  content = ''
+  if os.path.exists(known_hosts_path):
+    with open(known_hosts_path, 'rt') as f:
+      content = f.read()
+
+  if content and not content.endswith('\n'):
+    content += '\n'
+
+  existing = set([ line.strip() for line in content.split('\n') ])
+  utils.write_file_atomic(known_hosts_path, content + ''.join([ '%s\n' % ssh_hash for ssh_hash in ssh_hashes if ssh_hash not in existing ]))
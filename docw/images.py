@@ -0,0 +1,55 @@
+import json, os
+
+from docw import metadata as md
+from docw import utils
+
+DEFAULT_IMAGES_FILE = os.path.expanduser('~/.docw/images.json')
+
+def get_image_key(role, version, region):
+  return '%s:%s:%s' % (role, version, region)
+
+def read_images(path=DEFAULT_IMAGES_FILE):
+  """
+  Returns dict of baked images: 'role:version:region' -> image id.
+  """
+  if not os.path.exists(path):
+    return dict()
+
+  with open(path) as f:
+    return json.loads(f.read())
+
+def find_image(user_conf, role, disk=None):
+  """
+  Returns the baked image id for given role, matching the configured version and region, or None.
+
+  With disk (gb, of the smallest droplet to boot from it), an image whose snapshot needs a larger disk is not used:
+  droplets can't be created from it.
+  """
+  key = get_image_key(role, user_conf['version.%s' % role], user_conf['region'])
+  image_id = read_images().get(key)
+  if image_id is None:
+    return None
+
+  # snapshots may have been deleted since they were baked (or the cache was written): read them live.
+  try:
+    account_images = { image['id']: image for image in md.images(user_conf, max_age=0) }
+  except Exception as e:
+    print('Warning: can\'t read the images of the account (%s), assuming %s image %s exists.' % (e, role, image_id))
+    return image_id
+
+  if image_id not in account_images:
+    print('Warning: baked %s image %s does not exist anymore, installing packages instead.' % (role, image_id))
+    return None
+
+  min_disk_size = account_images[image_id].get('min_disk_size')
+  if disk is not None and min_disk_size and disk < min_disk_size:
+    print('Warning: baked %s image %s needs a disk of %d gb, larger than %d gb of the smallest droplet, installing packages instead.'
+          % (role, image_id, min_disk_size, disk))
+    return None
+
+  return image_id
+
+def record_image(role, version, region, image_id, path=DEFAULT_IMAGES_FILE):
+  images = read_images(path)
+  images[get_image_key(role, version, region)] = image_id
+  utils.write_json_atomic(path, images)
@@ -0,0 +1,123 @@
+import threading, time
+
+from docw import trace as tr
+from docw import utils
+
+do = utils.lazy_import('digitalocean')
+
+# seconds for which a fetched resource is reused.
+DEFAULT_TTLS = {
+  'account': 300,
+  'regions': 3600,
+  'sizes': 3600,
+  'images': 3600,
+  'droplets': 5,
+  'tags': 5,
+}
+
+class Inventory(object):
+  """
+  Caches DigitalOcean resources for a single docw run.
+
+  Concurrent requests for the same resource are coalesced into one API call,
+  and a fetched resource is reused until its ttl expires or it is invalidated.
+  """
+  def __init__(self, user_conf, ttls=None):
+    self.mngr = do.Manager(token=user_conf['token'])
+    self.ttls = dict(DEFAULT_TTLS, **(ttls or dict()))
+    self.lock = threading.Lock()
+    self.entries = dict()
+    self.pending = dict()
+
+  def get(self, key, fetch, max_age=None):
+    """
+    Returns cached value of given key if it is not older than max_age seconds, otherwise calls fetch.
+    """
+    if max_age is None:
+      max_age = self.ttls[key if isinstance(key, str) else key[0]]
+
+    not_before = None
+    while True:
+      with self.lock:
+        entry = self.entries.get(key)
+        if entry and (time.time() - entry[0] <= max_age or (not_before is not None and entry[0] >= not_before)):
+          return entry[1]
+
+        event = self.pending.get(key)
+        owner = event is None
+        if owner:
+          event = self.pending[key] = threading.Event()
+
+      if not owner:
+        # another thread is fetching the same resource: wait for its result.
+        not_before = time.time()
+        event.wait()
+        continue
+
+      try:
+        with tr.span(key if isinstance(key, str) else ':'.join([ str(k) for k in key ]), category='api'):
+          value = fetch()
+        with self.lock:
+          self.entries[key] = (time.time(), value)
+        return value
+      finally:
+        with self.lock:
+          del self.pending[key]
+        event.set()
+
+  def invalidate(self, *keys):
+    """
+    Drops cached values of given keys, or of all keys if none given.
+    """
+    with self.lock:
+      if not keys:
+        self.entries.clear()
+      for key in keys:
+        for k in [ k for k in self.entries.keys() if k == key or (isinstance(k, tuple) and k[0] == key) ]:
+          del self.entries[k]
+
+  def account(self, max_age=None):
+    return self.get('account', self.mngr.get_account, max_age)
+
+  def regions(self, max_age=None):
+    return self.get('regions', self.mngr.get_all_regions, max_age)
+
+  def sizes(self, max_age=None):
+    return self.get('sizes', self.mngr.get_all_sizes, max_age)
+
+  def images(self, max_age=None):
+    """
+    Returns the private images (snapshots) of the account.
+    """
+    return self.get('images', lambda: self.mngr.get_images(private=True), max_age)
+
+  def droplets(self, max_age=None, tag_name=None):
+    """
+    Returns droplets of the account, or only the ones with given tag.
+    """
+    if tag_name is None:
+      return self.get('droplets', self.mngr.get_all_droplets, max_age)
+
+    return self.get(('droplets', 'tag', tag_name), lambda: self.mngr.get_all_droplets(tag_name=tag_name), max_age)
+
+  def droplet_count(self, max_age=None):
+    """
+    Returns the number of droplets in the account, reading a single one-item page instead of listing them.
+    """
+    return self.get(('droplets', 'count'), lambda: self.mngr.get_data('droplets/', params={ 'per_page': 1, 'page': 1 })['meta']['total'], max_age)
+
+  def tags(self, max_age=None):
+    return self.get('tags', self.mngr.get_all_tags, max_age)
+
+_inventories = dict()
+_inventories_lock = threading.Lock()
+
+def get_inventory(user_conf):
+  """
+  Returns the inventory shared by every module in this run, for the token of given user configuration.
+  """
+  with _inventories_lock:
+    if user_conf['token'] not in _inventories:
+      _inventories[user_conf['token']] = Inventory(user_conf)
+
+    return _inventories[user_conf['token']]
@@ -0,0 +1,109 @@
+import json, threading, time
+
+from docw import utils
+
+# top-level key of cluster description which holds the cluster settings, not a host.
+CLUSTER_KEY = '_cluster'
+# top-level key of cluster description which holds the results of 'docw bench'.
+BENCH_KEY = '_bench'
+# minimum seconds between two writes of the journal while phases keep completing.
+FLUSH_INTERVAL = 1.0
+
+def read_cluster_desc(path):
+  with open(path) as f:
+    return json.loads(f.read())
+
+def get_hosts(cluster_desc):
+  """
+  Returns dict of hostname -> host description in given cluster description.
+  """
+  return { hostname: host_desc for hostname, host_desc in cluster_desc.items() if not hostname.startswith('_') }
+
+class Journal(object):
+  """
+  Cluster description which also records the completed phases of each host.
+
+  ex) {
+        '_cluster': { 'name': 'tinycluster', 'settings': [ ... ] },
+        'tinycluster-0': { 'id': 1234, 'size': '4gb', 'ip': '1.2.3.4', 'private_ip': '10.0.0.4', 'ssh_hashes': [ ... ], 'phases': [ 'ssh_footprint', 'ssh', ... ],
+                           'configs': { '/home/dongjinleekr/opt/hadoop/etc/hadoop/core-site.xml': '3a5f...', ... } },
+        ...
+      }
+
+  A phase is recorded only after it completed, so 'docw resume' re-runs the phases which are not recorded.
+  'configs' holds the hash of each config file installed on the host, which 'docw reconfigure' compares against.
+  """
+  def __init__(self, path, cluster_desc=None):
+    self.path = path
+    self.cluster_desc = cluster_desc or dict()
+    self.lock = threading.Lock()
+    self.write_lock = threading.Lock()
+    self.saved_time = 0
+    self.dirty = True
+
+  def cluster(self):
+    with self.lock:
+      return dict(self.cluster_desc.get(CLUSTER_KEY, dict()))
+
+  def hosts(self):
+    with self.lock:
+      return { hostname: dict(host_desc) for hostname, host_desc in get_hosts(self.cluster_desc).items() }
+
+  def host(self, hostname):
+    with self.lock:
+      return dict(self.cluster_desc.get(hostname, dict()))
+
+  def update(self, hostname, **values):
+    with self.lock:
+      self.cluster_desc.setdefault(hostname, dict()).update(values)
+      self.dirty = True
+
+  def done(self, hostname, phase):
+    with self.lock:
+      return phase in self.cluster_desc.get(hostname, dict()).get('phases', [])
+
+  def record(self, hostname, phase, **values):
+    """
+    Marks given phase of given host completed, along with the values it produced.
+    """
+    with self.lock:
+      host_desc = self.cluster_desc.setdefault(hostname, dict())
+      host_desc.update(values)
+      if phase not in host_desc.setdefault('phases', []):
+        host_desc['phases'].append(phase)
+      self.dirty = True
+
+    self.save(force=False)
+
+  def forget(self, phases, hostnames=None):
+    """
+    Drops given phases of given hosts (all hosts if not given), so that they run again.
+    """
+    with self.lock:
+      for hostname, host_desc in get_hosts(self.cluster_desc).items():
+        if hostnames is None or hostname in hostnames:
+          host_desc['phases'] = [ phase for phase in host_desc.get('phases', []) if phase not in phases ]
+      self.dirty = True
+
+  def remove(self, hostnames):
+    """
+    Drops given hosts, e.g. the ones destroyed by 'docw scale'.
+    """
+    with self.lock:
+      for hostname in hostnames:
+        self.cluster_desc.pop(hostname, None)
+      self.dirty = True
+
+  def save(self, force=True):
+    """
+    Writes the journal atomically. Unless forced, writes at most once in FLUSH_INTERVAL.
+    """
+    with self.write_lock:
+      with self.lock:
+        if not self.dirty or (not force and time.time() - self.saved_time < FLUSH_INTERVAL):
+          return
+        content = json.dumps(self.cluster_desc)
+        self.dirty = False
+        self.saved_time = time.time()
+
+      utils.write_file_atomic(self.path, content)
@@ -0,0 +1,60 @@
+import os
+
+from docw import droplets as dr
+from docw import inventory as iv
+from docw import scheduler as sc
+
+def get_roles(cluster_name, droplets):
+  """
+  Returns dict of role -> the number of given droplets with that role, read from their role tags.
+  """
+  prefix = dr.get_role_tag(cluster_name, '')
+  roles = dict()
+  for droplet in droplets:
+    for tag_name in droplet.tags:
+      if tag_name.startswith(prefix):
+        roles[tag_name[len(prefix):]] = roles.get(tag_name[len(prefix):], 0) + 1
+
+  return roles
+
+def get_cluster_names(tag_names):
+  """
+  Returns sorted names of the clusters of given tags, without the droplets bake provisions.
+  """
+  cluster_names = [ dr.get_cluster_name(tag_name) for tag_name in tag_names ]
+
+  return sorted([ cluster_name for cluster_name in cluster_names if cluster_name and not cluster_name.startswith(dr.BAKE_PREFIX) ])
+
+def process(user_conf, args):
+  """
+  usage: docw list
+
+  Lists the clusters in the account, found by their tags; works without their cluster descriptions.
+  """
+  inventory = iv.get_inventory(user_conf)
+  cluster_names = get_cluster_names([ tag.name for tag in inventory.tags(max_age=0) ])
+
+  scheduler = sc.get_scheduler(user_conf)
+  try:
+    results, failures = scheduler.map(lambda cluster_name: inventory.droplets(max_age=0, tag_name=dr.get_cluster_tag(cluster_name)), cluster_names)
+  finally:
+    scheduler.shutdown()
+
+  print('%-24s %8s %8s  %-24s %s' % ('cluster', 'droplets', 'active', 'roles', 'description'))
+  for cluster_name in cluster_names:
+    droplets = results.get(cluster_name)
+    if not droplets:
+      # tags outlive their droplets.
+      continue
+
+    roles = get_roles(cluster_name, droplets)
+    print('%-24s %8d %8d  %-24s %s' % (cluster_name,
+                                       len(droplets),
+                                       len([ droplet for droplet in droplets if 'active' == droplet.status ]),
+                                       ', '.join([ '%s x %d' % (role, count) for role, count in sorted(roles.items()) ]),
+                                       '%s.json' % cluster_name if os.path.exists('%s.json' % cluster_name) else '-'))
+
+  if failures:
+    raise ValueError('Error: failed to list droplets of %s.' % ', '.join(sorted(failures.keys())))
+
+  return 0
@@ -0,0 +1,79 @@
+import os, threading, time
+
+from contextlib import contextmanager
+
+DEFAULT_LOGS_DIR = os.path.expanduser('~/.docw/logs')
+
+class PhaseLogs(object):
+  """
+  Writes the output of the remote commands of each phase of each host to [directory]/[host]/[phase].log.
+
+  Retries of a phase append to the same file. Logs without directory record nothing.
+  """
+  def __init__(self, directory=None):
+    self.directory = directory
+
+  def get_path(self, host, phase):
+    return os.path.join(self.directory, host, '%s.log' % phase)
+
+  @contextmanager
+  def capture(self, host, phase):
+    """
+    Sends the output of the remote commands run by this thread, until exit, to the log of given host & phase.
+    """
+    previous = getattr(_local, 'file', None)
+    if not self.directory:
+      _local.file = None
+      try:
+        yield
+      finally:
+        _local.file = previous
+      return
+
+    path = self.get_path(host, phase)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as f:
+      _local.file = f
+      try:
+        yield
+      finally:
+        _local.file = previous
+
+_logs = PhaseLogs()
+# the log file of the phase each thread runs.
+_local = threading.local()
+
+def start(directory):
+  """
+  Starts writing the remote output of this run under given directory.
+  """
+  global _logs
+  _logs = PhaseLogs(directory)
+  return _logs
+
+def stop():
+  global _logs
+  _logs = PhaseLogs()
+
+def capture(host, phase):
+  return _logs.capture(host, phase)
+
+def current():
+  """
+  Returns the log file (a binary file object) of the phase this thread runs, or None.
+  """
+  return getattr(_local, 'file', None)
+
+def begin(command):
+  """
+  Marks the start of given command in the current log, if any.
+  """
+  f = current()
+  if f:
+    f.write(('# %s: %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), command)).encode('utf-8'))
+
+def end(status):
+  f = current()
+  if f:
+    f.write(('\n# exit status %d\n' % status).encode('utf-8'))
+    f.flush()
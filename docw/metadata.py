@@ -0,0 +1,97 @@
+import hashlib, json, os, threading, time
+
+from docw import inventory as iv
+from docw import utils
+
+DEFAULT_CACHE_FILE = os.path.expanduser('~/.docw/cache.json')
+# seconds for which account metadata is reused across runs, unless 'metadata-ttl' is configured.
+DEFAULT_TTL = 86400
+
+_lock = threading.Lock()
+# keys refreshed by this run: --refresh reads each of them from the api only once.
+_refreshed = set()
+
+def get_account_key(token):
+  # the token itself is never written to the cache.
+  return hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+
+def read_cache(path=DEFAULT_CACHE_FILE):
+  if not os.path.exists(path):
+    return dict()
+
+  try:
+    with open(path) as f:
+      return json.loads(f.read())
+  except ValueError:
+    return dict()
+
+def get(user_conf, key, fetch, path=DEFAULT_CACHE_FILE, max_age=None):
+  """
+  Returns the metadata of given key cached for the account of given user configuration, calling fetch if it is
+  older than max_age (by default, 'metadata-ttl') seconds or if --refresh is given. fetch returns json-serializable values.
+
+  If the api can't be read, an expired value is used rather than none.
+  """
+  account_key = get_account_key(user_conf['token'])
+  ttl = int(user_conf.get('metadata-ttl', DEFAULT_TTL)) if max_age is None else max_age
+  refresh = 'true' == user_conf.get('refresh', 'false') and key not in _refreshed
+
+  entry = read_cache(path).get(account_key, dict()).get(key)
+  if entry and not refresh and time.time() - entry['time'] <= ttl:
+    return entry['value']
+
+  try:
+    value = fetch()
+  except Exception as e:
+    if entry is None:
+      raise
+    print('Warning: can\'t read %s (%s), using the ones cached %d sec ago.' % (key, e, time.time() - entry['time']))
+    return entry['value']
+
+  with _lock:
+    cache = read_cache(path)
+    cache.setdefault(account_key, dict())[key] = { 'time': time.time(), 'value': value }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    utils.write_json_atomic(path, cache)
+    _refreshed.add(key)
+
+  return value
+
+def invalidate(user_conf, key, path=DEFAULT_CACHE_FILE):
+  with _lock:
+    cache = read_cache(path)
+    if cache.get(get_account_key(user_conf['token']), dict()).pop(key, None) is not None:
+      utils.write_json_atomic(path, cache)
+
+def regions(user_conf):
+  """
+  Returns list of { 'slug', 'name', 'available', 'sizes' } of the regions.
+  """
+  def fetch():
+    return [ { 'slug': region.slug, 'name': region.name, 'available': region.available, 'sizes': region.sizes }
+             for region in iv.get_inventory(user_conf).regions() ]
+
+  return get(user_conf, 'regions', fetch)
+
+def sizes(user_conf):
+  """
+  Returns list of { 'slug', 'memory', 'vcpus', 'disk', 'price_hourly', 'regions', 'available' } of the droplet sizes.
+  """
+  def fetch():
+    return [ { 'slug': size.slug, 'memory': size.memory, 'vcpus': size.vcpus, 'disk': size.disk,
+               'price_hourly': size.price_hourly, 'regions': size.regions, 'available': getattr(size, 'available', True) }
+             for size in iv.get_inventory(user_conf).sizes() ]
+
+  return get(user_conf, 'sizes', fetch)
+
+def images(user_conf, max_age=None):
+  """
+  Returns list of { 'id', 'name', 'regions', 'min_disk_size' } of the private images (snapshots) of the account.
+
+  With max_age 0, the images are read from the api and the cache is updated.
+  """
+  def fetch():
+    return [ { 'id': image.id, 'name': image.name, 'regions': image.regions, 'min_disk_size': getattr(image, 'min_disk_size', None) }
+             for image in iv.get_inventory(user_conf).images(max_age) ]
+
+  return get(user_conf, 'images', fetch, max_age=max_age)
@@ -0,0 +1,127 @@
+import json
+
+from docw import tuning
+
+TARGETS = [ 'maps', 'reduces', 'hdfs', 'budget' ]
+DEFAULT_MAX_SLAVES = 100
+# share of a datanode's disk left to hdfs, after the os, packages & intermediate data.
+HDFS_DISK_RATIO = 0.75
+# alternatives printed after the chosen plan.
+ALTERNATIVES = 5
+HOURS_PER_MONTH = 672
+
+def get_plan(size_specs, region, master_slug, slave_slug, slaves):
+  """
+  Returns the capacity & cost of a cluster of given master and given number of slaves of a single size.
+  """
+  master_slug = master_slug or tuning.get_master_size(slaves, size_specs, region)
+  slave_spec = size_specs[slave_slug]
+  node_tuning = tuning.get_hadoop_tuning(size_specs[master_slug], [ slave_spec ])[1]
+
+  return { 'master': master_slug,
+           'slave': slave_slug,
+           'slaves': slaves,
+           'maps': node_tuning['map_task_per_node'] * slaves,
+           'reduces': max(1, int(tuning.REDUCE_SLOTS_RATIO * node_tuning['reduce_task_per_node'] * slaves)),
+           'hdfs': int(slave_spec['disk'] * HDFS_DISK_RATIO * slaves / min(tuning.MAX_REPLICATION, slaves)),
+           'price_hourly': size_specs[master_slug]['price_hourly'] + slave_spec['price_hourly'] * slaves,
+  }
+
+def search(size_specs, region, target, value, slave_slugs, max_slaves, master_slug=None):
+  """
+  Returns plans meeting given target, the best first: for every slave size, the fewest slaves reaching
+  the target (maps, reduces, hdfs), or the most slaves within the budget.
+  """
+  plans = []
+  for slave_slug in slave_slugs:
+    best = None
+    for slaves in range(1, max_slaves + 1):
+      plan = get_plan(size_specs, region, master_slug, slave_slug, slaves)
+      if 'budget' == target:
+        if plan['price_hourly'] > value:
+          break
+        best = plan
+      elif plan[target] >= value:
+        best = plan
+        break
+
+    if best:
+      plans.append(best)
+
+  if 'budget' == target:
+    plans.sort(key=lambda plan: (-plan['maps'], -plan['hdfs'], plan['price_hourly']))
+  else:
+    plans.sort(key=lambda plan: (plan['price_hourly'], -plan['maps']))
+
+  return plans
+
+def get_template(plan):
+  return [ { 'role': 'hadoop', 'master': plan['master'], 'hosts': [ { 'size': plan['slave'], 'count': plan['slaves'] } ] } ]
+
+def print_plan(plan, prefix=''):
+  print('%s%d x %s + master %s: %d map slots, %d reduce slots, %d gb hdfs, $%.3f/hour ($%.2f/month)'
+        % (prefix, plan['slaves'], plan['slave'], plan['master'], plan['maps'], plan['reduces'], plan['hdfs'],
+           plan['price_hourly'], plan['price_hourly'] * HOURS_PER_MONTH))
+
+def parse_args(args):
+  options = dict()
+  index = 0
+  while index < len(args):
+    if not args[index].startswith('--') or index + 1 == len(args):
+      raise ValueError('Error: usage: docw plan (--maps N|--reduces N|--hdfs GB|--budget USD/hour) '
+                       '[--sizes slug,...] [--master slug] [--max-slaves N] [--output template.json]')
+    options[args[index][2:]] = args[index + 1]
+    index += 2
+
+  targets = [ target for target in TARGETS if target in options ]
+  if 1 != len(targets):
+    raise ValueError('Error: give exactly one of %s.' % ', '.join([ '--%s' % target for target in TARGETS ]))
+
+  return targets[0], options
+
+def process(user_conf, args):
+  """
+  usage: docw plan (--maps N|--reduces N|--hdfs GB|--budget USD/hour) [--sizes slug,...] [--master slug] [--max-slaves N] [--output template.json]
+
+  Searches slave sizes & counts for the cheapest hadoop cluster reaching given map/reduce slots or hdfs capacity,
+  or the largest one within given hourly budget, and writes its cluster template.
+  """
+  target, options = parse_args(args)
+  value = float(options[target])
+  region = user_conf['region']
+  size_specs = tuning.get_size_specs(user_conf)
+
+  master_slug = options.get('master')
+  if master_slug and master_slug not in size_specs:
+    raise ValueError('Error: unknown droplet size: %s' % master_slug)
+
+  if 'sizes' in options:
+    slave_slugs = options['sizes'].split(',')
+    unknown = [ slug for slug in slave_slugs if slug not in size_specs ]
+    if unknown:
+      raise ValueError('Error: unknown droplet size: %s' % ', '.join(unknown))
+    small = [ slug for slug in slave_slugs if not tuning.is_worker_size(size_specs[slug]) ]
+    if small:
+      raise ValueError('Error: hadoop slaves need %d mb of memory at least: %s' % (tuning.MIN_WORKER_MEMORY, ', '.join(small)))
+  else:
+    slave_slugs = sorted([ slug for slug, spec in size_specs.items() if tuning.is_available(spec, region) and tuning.is_worker_size(spec) ])
+
+  plans = search(size_specs, region, target, value, slave_slugs, int(options.get('max-slaves', DEFAULT_MAX_SLAVES)), master_slug)
+  if not plans:
+    raise ValueError('Error: no cluster of at most %s slaves meets --%s %s.' % (options.get('max-slaves', DEFAULT_MAX_SLAVES), target, options[target]))
+
+  print_plan(plans[0])
+  if 1 < len(plans):
+    print('\nalternatives:')
+    for plan in plans[1:ALTERNATIVES + 1]:
+      print_plan(plan, '  ')
+
+  template = get_template(plans[0])
+  if 'output' in options:
+    with open(options['output'], 'w') as f:
+      f.write(json.dumps(template, indent=2) + '\n')
+    print('\ncluster template is stored to %s' % options['output'])
+  else:
+    print('\n%s' % json.dumps(template, indent=2))
+
+  return 0
@@ -0,0 +1,104 @@
+import json, sys
+
+PERCENTILES = [ 50, 90, 99 ]
+SLOWEST_HOSTS = 5
+
+def read_trace(path):
+  """
+  Returns list of trace events, either from a JSON-lines trace or a Chrome trace (JSON array) file.
+  """
+  with open(path) as f:
+    content = f.read().strip()
+
+  if content.startswith('['):
+    return json.loads(content.rstrip(',') + (']' if not content.endswith(']') else ''))
+
+  return [ json.loads(line) for line in content.split('\n') if line.strip() ]
+
+def percentile(values, p):
+  values = sorted(values)
+  index = int(round((len(values) - 1) * p / 100.0))
+  return values[index]
+
+def get_critical_path(events):
+  """
+  Returns the chain of spans which ends last, walking back from the last span to the one it waited for.
+
+  A host waits only for its own previous span or for the operator ('docw' track: api calls, barriers), so the
+  predecessor of a host's span is the latest-ending of those. A span of the operator may wait for any host,
+  e.g. the barrier before the cluster-wide phases, so its predecessor is the latest-ending span of any track.
+  """
+  events = [ event for event in events if 'X' == event.get('ph') ]
+  if not events:
+    return []
+
+  current = max(events, key=lambda e: e['ts'] + e['dur'])
+  path = [ current ]
+  while True:
+    candidates = [ event for event in events if event['ts'] + event['dur'] <= current['ts'] and event is not current ]
+    if 'docw' != current['tid']:
+      candidates = [ event for event in candidates if event['tid'] in (current['tid'], 'docw') ]
+    if not candidates:
+      break
+    current = max(candidates, key=lambda e: (e['ts'] + e['dur'], e['tid'] == current['tid']))
+    path.append(current)
+
+  path.reverse()
+  return path
+
+def report(events, out=sys.stdout):
+  events = [ event for event in events if 'X' == event.get('ph') ]
+  if not events:
+    print('no spans recorded.', file=out)
+    return
+
+  begin = min([ event['ts'] for event in events ])
+  end = max([ event['ts'] + event['dur'] for event in events ])
+  print('total: %.2f sec, %d spans' % ((end - begin) / 1e6, len(events)), file=out)
+
+  # critical path
+  print('\ncritical path:', file=out)
+  for event in get_critical_path(events):
+    print('  %8.2f +%8.2f sec  %-20s %s' % ((event['ts'] - begin) / 1e6, event['dur'] / 1e6, event['tid'], event['name']), file=out)
+
+  # slowest hosts
+  hosts = dict()
+  for event in events:
+    if 'docw' != event['tid']:
+      start, stop = hosts.get(event['tid'], (event['ts'], event['ts'] + event['dur']))
+      hosts[event['tid']] = (min(start, event['ts']), max(stop, event['ts'] + event['dur']))
+
+  print('\nslowest hosts:', file=out)
+  for host, (start, stop) in sorted(hosts.items(), key=lambda x: x[1][1], reverse=True)[:SLOWEST_HOSTS]:
+    print('  %-20s done at %8.2f sec (busy for %.2f sec)' % (host, (stop - begin) / 1e6, (stop - start) / 1e6), file=out)
+
+  # per-phase percentiles
+  phases = dict()
+  for event in events:
+    phases.setdefault((event['cat'], event['name']), []).append(event['dur'] / 1e6)
+
+  print('\nper-phase durations (sec):', file=out)
+  print('  %-8s %-24s %6s %9s %9s %9s %9s' % ('category', 'name', 'count', 'p50', 'p90', 'p99', 'max'), file=out)
+  for (category, name), durations in sorted(phases.items(), key=lambda x: sum(x[1]), reverse=True):
+    print('  %-8s %-24s %6d %9.2f %9.2f %9.2f %9.2f' % ((category, name, len(durations)) +
+                                                        tuple([ percentile(durations, p) for p in PERCENTILES ]) +
+                                                        (max(durations), )), file=out)
+
+def process(user_conf, args):
+  """
+  usage: docw profile <trace> [--chrome <output>]
+  """
+  if not args:
+    raise ValueError('Error: usage: docw profile <trace> [--chrome <output>]')
+
+  events = read_trace(args[0])
+
+  if '--chrome' in args[1:]:
+    output = args[args.index('--chrome') + 1]
+    with open(output, 'w') as f:
+      json.dump({ 'traceEvents': events }, f)
+    print('chrome trace is stored to %s' % output)
+    return 0
+
+  report(events)
+  return 0
@@ -0,0 +1,126 @@
+import importlib, json, sys
+
+from docw import configs as cs
+from docw import create
+from docw import journal as jn
+from docw import logs as lg
+from docw import remote as rm
+from docw import scheduler as sc
+from docw import trace as tr
+
+def get_changes(host_configs, hosts):
+  """
+  Returns dict of hostname -> paths of its config files whose hash differs from the one recorded in its description.
+  """
+  changes = dict()
+  for hostname, host_config in host_configs.items():
+    paths = cs.get_changes(host_config['config_hashes'], hosts[hostname].get('configs', dict()))
+    if paths:
+      changes[hostname] = paths
+
+  return changes
+
+def validate(host_configs, droplet_settings, hosts):
+  """
+  Raises if the settings describe other hosts (or sizes) than the cluster has: that is 'docw scale', not reconfigure.
+  """
+  if set(host_configs.keys()) != set(hosts.keys()):
+    raise ValueError('Error: the settings describe hosts other than the cluster: %s.'
+                     % ', '.join(sorted(set(host_configs.keys()) ^ set(hosts.keys()))))
+
+  resized = [ setting['name'] for setting in droplet_settings if hosts[setting['name']].get('size', setting['size_slug']) != setting['size_slug'] ]
+  if resized:
+    raise ValueError('Error: the settings change the size of %s; droplets are not resized by reconfigure.' % ', '.join(sorted(resized)))
+
+  unconfigured = [ hostname for hostname, host_desc in hosts.items() if not host_desc.get('ip') or 'configs' not in host_desc.get('phases', []) ]
+  if unconfigured:
+    raise ValueError('Error: %s are not configured yet, run \'docw resume\' first.' % ', '.join(sorted(unconfigured)))
+
+def push_configs(hostname, host_config, user_conf, ip, paths, restart, scheduler, journal):
+  """
+  Uploads given config files of given host and records the new hashes; with restart, restarts the daemons reading them.
+  """
+  host = rm.get_host(user_conf, ip)
+  files = { path: host_config['config'][path] for path in paths }
+
+  create.run_phase(scheduler, hostname, 'configs', 'Installing %d changed config files' % len(paths), create.configure_user_configs, host, files)
+  # drop the files which are not rendered anymore.
+  journal.record(hostname, 'configs', configs=host_config['config_hashes'])
+
+  if restart:
+    module = importlib.import_module('docw.{module}'.format(module=host_config['role']))
+    commands = getattr(module, 'restart_cmds')(paths, **host_config)
+    if commands:
+      create.run_phase(scheduler, hostname, 'restart', 'Restarting affected daemons', create.configure_user_packages, host, commands)
+
+def push_changes(user_conf, journal, host_configs, changes, restart=False):
+  """
+  Pushes given changes (hostname -> paths, see get_changes) to their hosts in parallel.
+  """
+  hosts = journal.hosts()
+  scheduler = sc.get_scheduler(user_conf)
+  try:
+    for hostname, paths in sorted(changes.items()):
+      scheduler.submit(hostname, push_configs,
+                       hostname, host_configs[hostname], user_conf, hosts[hostname]['ip'], paths, restart, scheduler, journal)
+    _, failures = scheduler.wait()
+
+    if failures:
+      for hostname, error in sorted(failures.items()):
+        print('Error: failed to reconfigure %s: %s' % (hostname, error), file=sys.stderr)
+      raise ValueError('Error: %d of %d hosts were not reconfigured, run \'docw reconfigure %s\' to retry.'
+                       % (len(failures), len(changes), journal.path))
+  finally:
+    journal.save()
+    scheduler.shutdown()
+    rm.close_all()
+
+def parse_args(args):
+  restart = '--restart' in args
+  args = [ arg for arg in args if '--restart' != arg ]
+  if not args or 2 < len(args):
+    raise ValueError('Error: usage: docw reconfigure <cluster>.json [<template>.json] [--restart]')
+
+  return args[0], args[1] if 2 == len(args) else None, restart
+
+def process(user_conf, args):
+  """
+  usage: docw reconfigure <cluster>.json [<template>.json] [--restart]
+
+  Renders the config files again, from the current user configuration and given template (the one the cluster
+  was created with, if not given), and pushes only the files whose hash differs from the recorded one, to all hosts
+  in parallel. With --restart, restarts the running daemons which read a changed file, on the hosts where it changed.
+  """
+  cluster_desc_file, template_file, restart = parse_args(args)
+  cluster_desc = jn.read_cluster_desc(cluster_desc_file)
+  if jn.CLUSTER_KEY not in cluster_desc:
+    raise ValueError('Error: %s has no cluster settings to reconfigure from.' % cluster_desc_file)
+
+  journal = jn.Journal(cluster_desc_file, cluster_desc)
+  cluster = journal.cluster()
+  if template_file:
+    with open(template_file) as f:
+      cluster['settings'] = json.loads(f.read())
+
+  hosts = journal.hosts()
+  droplet_settings, host_configs = create.get_host_settings(user_conf, cluster['name'], cluster['settings'], create.get_existing(hosts))
+  validate(host_configs, droplet_settings, hosts)
+
+  changes = get_changes(host_configs, hosts)
+  if not changes:
+    print('%s: config files are up to date.' % cluster['name'])
+  else:
+    print('%s: %d files to update on %d of %d hosts.' % (cluster['name'], sum([ len(paths) for paths in changes.values() ]), len(changes), len(hosts)))
+
+  if template_file:
+    journal.update(jn.CLUSTER_KEY, settings=cluster['settings'])
+
+  create.start_trace(user_conf, cluster['name'])
+  create.start_logs(user_conf, cluster['name'])
+  try:
+    push_changes(user_conf, journal, host_configs, changes, restart)
+  finally:
+    tr.stop()
+    lg.stop()
+
+  return 0
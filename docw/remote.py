@@ -0,0 +1,161 @@
+import io, os, tarfile, threading, time
+
+from docw import logs as lg
+from docw import utils
+
+pm = utils.lazy_import('paramiko')
+
+CHUNK_SIZE = 32768
+# bytes of command output kept for error messages, of which the last 'log-tail' lines are shown.
+OUTPUT_TAIL_SIZE = 65536
+DEFAULT_LOG_TAIL = 20
+KEEPALIVE_INTERVAL = 30
+
+class RemoteHost(object):
+  """
+  A persistent ssh transport to a single host.
+
+  Every command runs on its own channel of the transport, so several commands may run at once.
+  Scripts & files are streamed over stdin: nothing is written to local temp files.
+  """
+  def __init__(self, user_conf, address):
+    self.address = address
+    self.tail_lines = int(user_conf.get('log-tail', DEFAULT_LOG_TAIL))
+    self.client = pm.SSHClient()
+    self.client.load_system_host_keys()
+    self.client.set_missing_host_key_policy(pm.AutoAddPolicy())
+    self.client.connect(hostname=address,
+                        port=int(user_conf.get('ssh-port', 22)),
+                        username=user_conf['username'],
+                        pkey=pm.RSAKey.from_private_key_file(user_conf['private_key_path']))
+    self.transport = self.client.get_transport()
+    self.transport.set_keepalive(KEEPALIVE_INTERVAL)
+
+  def execute(self, command, stdin=None, check=True, output=None):
+    """
+    Runs given command, feeding stdin (bytes, str or binary file object) if given, and waits for its exit status.
+
+    The output is drained while the command runs, so that the command never blocks on a full channel window;
+    all of it is written to output (a binary file object) if given, and to the log of the current phase (see logs.capture).
+    """
+    if isinstance(stdin, str):
+      stdin = stdin.encode('utf-8')
+    if isinstance(stdin, bytes):
+      stdin = io.BytesIO(stdin)
+
+    log = lg.current()
+    sinks = [ sink for sink in (output, log) if sink ]
+    tail = [ b'' ]
+    def drain(data):
+      tail[0] = (tail[0] + data)[-OUTPUT_TAIL_SIZE:]
+      for sink in sinks:
+        sink.write(data)
+
+    lg.begin(command)
+    status = -1
+    channel = self.transport.open_session()
+    try:
+      channel.set_combine_stderr(True)
+      channel.exec_command(command)
+
+      if stdin is not None:
+        for chunk in iter(lambda: stdin.read(CHUNK_SIZE), b''):
+          channel.sendall(chunk)
+          while channel.recv_ready():
+            drain(channel.recv(CHUNK_SIZE))
+      # commands reading stdin must not wait for input which never comes.
+      channel.shutdown_write()
+
+      for data in iter(lambda: channel.recv(CHUNK_SIZE), b''):
+        drain(data)
+      status = channel.recv_exit_status()
+    finally:
+      channel.close()
+      lg.end(status)
+
+    if check and 0 != status:
+      lines = tail[0].decode('utf-8', 'replace').rstrip('\n').split('\n')[-self.tail_lines:] if 0 < self.tail_lines else []
+      raise ValueError('Error: %s: \'%s\' exited with status %d%s:\n%s'
+                       % (self.address, command, status, ' (full output: %s)' % log.name if log else '', '\n'.join(lines)))
+
+    return status
+
+  def run(self, script, sudo=False, check=True, output=None):
+    """
+    Runs given shell script via 'bash -s'.
+    """
+    return self.execute('sudo bash -s' if sudo else 'bash -s', stdin=script, check=check, output=output)
+
+  def put(self, path, content, mode=None, sudo=False):
+    """
+    Writes given content (bytes, str or binary file object) to the remote path.
+    """
+    command = 'cat > %s' % path
+    if sudo:
+      command = 'sudo tee %s > /dev/null' % path
+    if mode:
+      command = '%s && %schmod %s %s' % (command, 'sudo ' if sudo else '', mode, path)
+    self.execute(command, stdin=content)
+
+  def put_files(self, files, mode=0o644):
+    """
+    Writes given files (path -> content) with a single in-memory tar stream.
+
+    Relative paths are relative to the home directory, as with put.
+    """
+    for base, paths in (('/', [ path for path in files.keys() if os.path.isabs(path) ]),
+                        ('.', [ path for path in files.keys() if not os.path.isabs(path) ])):
+      if paths:
+        self.execute('tar -xf - -C %s' % base, stdin=get_tar_stream({ os.path.relpath(path, base): files[path] for path in paths }, mode))
+
+  def put_file(self, local_path, path, mode=None):
+    with open(local_path, 'rb') as f:
+      self.put(path, f, mode)
+
+  def close(self):
+    self.client.close()
+
+def get_tar_stream(files, mode=0o644):
+  """
+  Returns an uncompressed tar archive of given files (name -> content) as a binary file object.
+  """
+  stream = io.BytesIO()
+  with tarfile.open(fileobj=stream, mode='w') as archive:
+    for name, content in sorted(files.items()):
+      if isinstance(content, str):
+        content = content.encode('utf-8')
+      info = tarfile.TarInfo(name)
+      info.size = len(content)
+      info.mode = mode
+      info.mtime = int(time.time())
+      archive.addfile(info, io.BytesIO(content))
+
+  stream.seek(0)
+  return stream
+
+_hosts = dict()
+_hosts_lock = threading.Lock()
+
+def get_host(user_conf, address):
+  """
+  Returns the pooled connection to given address, connecting on first use.
+  """
+  with _hosts_lock:
+    host = _hosts.get(address)
+    if host is None or not host.transport.is_active():
+      host = _hosts[address] = RemoteHost(user_conf, address)
+
+    return host
+
+def close_host(address):
+  with _hosts_lock:
+    host = _hosts.pop(address, None)
+  if host:
+    host.close()
+
+def close_all():
+  with _hosts_lock:
+    hosts = list(_hosts.values())
+    _hosts.clear()
+  for host in hosts:
+    host.close()
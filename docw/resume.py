@@ -0,0 +1,63 @@
+import time
+
+from docw import create
+from docw import droplets as dr
+from docw import inventory as iv
+from docw import journal as jn
+from docw import logs as lg
+from docw import trace as tr
+
+# phases which depend on the addresses of every host in the cluster.
+CLUSTER_WIDE_PHASES = [ 'known_hosts', 'hosts' ]
+
+def process(user_conf, args):
+  """
+  usage: docw resume <cluster>.json
+
+  Continues an interrupted 'docw create': reuses the droplets recorded in the cluster description,
+  creates the ones which were not created and runs only the phases which are not recorded as completed.
+  """
+  if not args:
+    raise ValueError('Error: usage: docw resume <cluster>.json')
+
+  cluster_desc_file = args[0]
+  cluster_desc = jn.read_cluster_desc(cluster_desc_file)
+  if jn.CLUSTER_KEY not in cluster_desc:
+    raise ValueError('Error: %s has no cluster settings to resume from.' % cluster_desc_file)
+
+  journal = jn.Journal(cluster_desc_file, cluster_desc)
+  cluster_name = journal.cluster()['name']
+  hosts = journal.hosts()
+  droplet_settings, host_configs = create.get_host_settings(user_conf, cluster_name, journal.cluster()['settings'], create.get_existing(hosts))
+
+  # validate
+  inventory = iv.get_inventory(user_conf)
+  droplet_ids = set([ droplet.id for droplet in inventory.droplets(max_age=0, tag_name=dr.get_cluster_tag(cluster_name)) ])
+  gone = [ hostname for hostname, host_desc in hosts.items() if host_desc['id'] not in droplet_ids ]
+  if gone:
+    raise ValueError('Error: droplets of %s do not exist anymore, destroy the cluster and create it again.' % ', '.join(sorted(gone)))
+
+  droplet_settings = [ setting for setting in droplet_settings if setting['name'] not in hosts ]
+  hostnames = [ setting['name'] for setting in droplet_settings ]
+
+  if False == create.is_droplet_limit_sufficient(inventory, hostnames):
+    raise ValueError('Error: you cannot create %d droplets now.' % len(hostnames))
+
+  if False == create.all_hostnames_available(inventory, cluster_name, hostnames):
+    raise ValueError('Error: Duplicated droplet name.')
+
+  create.start_trace(user_conf, cluster_name)
+  create.start_logs(user_conf, cluster_name)
+  try:
+    created_time = time.time()
+
+    if droplet_settings:
+      print('creating droplets which were not created: %s' % ', '.join(hostnames))
+      create.create_droplets(user_conf, journal, droplet_settings, host_configs)
+      # the other hosts don't know the new ones yet.
+      journal.forget(CLUSTER_WIDE_PHASES)
+
+    create.provision_cluster(user_conf, journal, host_configs, created_time)
+  finally:
+    tr.stop()
+    lg.stop()
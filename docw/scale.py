@@ -0,0 +1,257 @@
+import copy, os, re, time
+
+from docw import create
+from docw import destroy
+from docw import hadoop as hd
+from docw import inventory as iv
+from docw import journal as jn
+from docw import logs as lg
+from docw import reconfigure
+from docw import remote as rm
+from docw import resume
+from docw import scheduler as sc
+from docw import trace as tr
+
+# seconds to wait until hdfs re-replicated the blocks of the decommissioned datanodes, and between two checks.
+DECOMMISSION_TIMEOUT = 3600
+DECOMMISSION_POLL_INTERVAL = 10
+
+def get_layout(user_conf, journal):
+  """
+  Returns (droplet settings, host configs) of the cluster as it is, recording the role & size of each host,
+  so that they keep their names whatever is added or removed later (see create.get_namer).
+  """
+  cluster = journal.cluster()
+  hosts = journal.hosts()
+  droplet_settings, host_configs = create.get_host_settings(user_conf, cluster['name'], cluster['settings'], create.get_existing(hosts))
+  reconfigure.validate(host_configs, droplet_settings, hosts)
+
+  for setting in droplet_settings:
+    host_config = host_configs[setting['name']]
+    journal.update(setting['name'], role=host_config['role'], size=setting['size_slug'], master=setting['name'] == host_config.get('master'))
+
+  return droplet_settings, host_configs
+
+def get_slaves(droplet_settings, host_configs):
+  """
+  Returns dict of hostname -> size slug of the hadoop slaves.
+  """
+  return { setting['name']: setting['size_slug'] for setting in droplet_settings
+           if 'hadoop' == host_configs[setting['name']]['role'] and setting['name'] != host_configs[setting['name']]['master'] }
+
+def choose_size(slaves):
+  """
+  Returns the most common size slug of given slaves (hostname -> size slug), the smallest slug on a tie.
+  """
+  if not slaves:
+    raise ValueError('Error: the cluster has no slaves to take the size from: usage: docw scale <cluster>.json +N <size>')
+
+  return max(sorted(set(slaves.values())), key=lambda slug: list(slaves.values()).count(slug))
+
+def choose_victims(cluster_name, slaves, count, size_slug=None):
+  """
+  Returns given number of slaves (of given size, if any) to remove: the last ones first.
+  """
+  candidates = sorted([ hostname for hostname, slug in slaves.items() if size_slug in (None, slug) ], key=create.get_droplet_index, reverse=True)
+  if len(candidates) < count:
+    raise ValueError('Error: %s has %d slaves%s only.' % (cluster_name, len(candidates), ' of %s' % size_slug if size_slug else ''))
+  if len(slaves) == count:
+    raise ValueError('Error: a hadoop cluster needs a slave at least.')
+
+  return candidates[:count]
+
+def add_slaves(cluster_conf, size_slug, count, master_size):
+  """
+  Returns a copy of given cluster template with given number of slaves of given size more, and the master of the size it has.
+  """
+  cluster_conf = copy.deepcopy(cluster_conf)
+  group = [ group for group in cluster_conf if 'hadoop' == group['role'] ][0]
+  group['master'] = master_size
+
+  hosts = [ hosts for hosts in group['hosts'] if size_slug == hosts['size'] ]
+  if hosts:
+    hosts[0]['count'] += count
+  else:
+    group['hosts'].append({ 'size': size_slug, 'count': count })
+
+  return cluster_conf
+
+def remove_slaves(cluster_conf, size_slugs, master_size):
+  """
+  Returns a copy of given cluster template without slaves of given sizes (one per item), and the master of the size it has.
+  """
+  cluster_conf = copy.deepcopy(cluster_conf)
+  groups = [ group for group in cluster_conf if 'hadoop' == group['role'] ]
+  groups[0]['master'] = master_size
+
+  for size_slug in size_slugs:
+    hosts = [ hosts for group in groups for hosts in group['hosts'] if size_slug == hosts['size'] and 0 < hosts['count'] ][0]
+    hosts['count'] -= 1
+
+  for group in groups:
+    group['hosts'] = [ hosts for hosts in group['hosts'] if 0 < hosts['count'] ]
+
+  return cluster_conf
+
+def scale_out(user_conf, journal, count, size_slug, restart):
+  """
+  Creates & provisions given number of slaves, and pushes the config files which changed to the other hosts.
+  """
+  cluster = journal.cluster()
+  droplet_settings, host_configs = get_layout(user_conf, journal)
+  slaves = get_slaves(droplet_settings, host_configs)
+  master = [ host_config['master'] for host_config in host_configs.values() if 'hadoop' == host_config['role'] ][0]
+  # by default, more of the most common slave size.
+  size_slug = size_slug or choose_size(slaves)
+
+  settings = add_slaves(cluster['settings'], size_slug, count, journal.host(master)['size'])
+  hosts = journal.hosts()
+  droplet_settings, host_configs = create.get_host_settings(user_conf, cluster['name'], settings, create.get_existing(hosts))
+  droplet_settings = [ setting for setting in droplet_settings if setting['name'] not in hosts ]
+  hostnames = [ setting['name'] for setting in droplet_settings ]
+
+  # validate
+  inventory = iv.get_inventory(user_conf)
+  if False == create.is_droplet_limit_sufficient(inventory, hostnames):
+    raise ValueError('Error: you cannot create %d droplets now.' % len(hostnames))
+
+  if False == create.all_hostnames_available(inventory, cluster['name'], hostnames):
+    raise ValueError('Error: Duplicated droplet name.')
+
+  # from now on, 'docw resume' completes the new hosts.
+  journal.update(jn.CLUSTER_KEY, settings=settings)
+  journal.save()
+
+  created_time = time.time()
+  print('creating %d slaves of %s: %s' % (count, size_slug, ', '.join(hostnames)))
+  create.create_droplets(user_conf, journal, droplet_settings, host_configs)
+  # the other hosts don't know the new ones yet.
+  journal.forget(resume.CLUSTER_WIDE_PHASES)
+  create.provision_cluster(user_conf, journal, host_configs, created_time)
+
+  changes = reconfigure.get_changes({ hostname: host_configs[hostname] for hostname in hosts }, journal.hosts())
+  print('%s: %d files to update on %d of %d existing hosts.' % (cluster['name'], sum([ len(paths) for paths in changes.values() ]), len(changes), len(hosts)))
+  reconfigure.push_changes(user_conf, journal, host_configs, changes, restart)
+
+  print('%s: start the datanode & nodemanager of %s to use them.' % (cluster['name'], ', '.join(hostnames)))
+
+def decommission(master_host, master_config, hostnames):
+  """
+  Excludes given slaves from hdfs & yarn, and waits until hdfs re-replicated their blocks on the other datanodes.
+  """
+  create.run_phase(None, master_config['master'], 'exclude', 'Excluding %s' % ', '.join(hostnames),
+                   create.configure_user_packages, master_host, hd.exclude_cmds(hostnames, **master_config))
+
+  status = create.run_phase(None, master_config['master'], 'decommission', 'Decommissioning %d datanodes' % len(hostnames),
+                            master_host.run, hd.decommission_wait_cmds(hostnames, DECOMMISSION_TIMEOUT, DECOMMISSION_POLL_INTERVAL, **master_config),
+                            check=False)
+  if 0 == status:
+    return
+
+  # take them back, since they are not removed.
+  master_host.run(hd.exclude_cmds([], **master_config))
+  if hd.NAMENODE_NOT_RUNNING == status:
+    raise ValueError('Error: the namenode is not running, so the blocks on %s can\'t be moved away. start hdfs, or give --force to remove them anyway.'
+                     % ', '.join(hostnames))
+  raise ValueError('Error: %s were not decommissioned in %d sec. give --force to remove them anyway.' % (', '.join(hostnames), DECOMMISSION_TIMEOUT))
+
+def scale_in(user_conf, journal, count, size_slug, force, restart):
+  """
+  Decommissions & destroys given number of slaves (the last ones first), and reconfigures the other hosts.
+  """
+  cluster = journal.cluster()
+  droplet_settings, host_configs = get_layout(user_conf, journal)
+  slaves = get_slaves(droplet_settings, host_configs)
+  master = [ host_config['master'] for host_config in host_configs.values() if 'hadoop' == host_config['role'] ][0]
+
+  victims = choose_victims(cluster['name'], slaves, count, size_slug)
+
+  # the namenode reads the excludes file only if its hdfs-site.xml names it.
+  hdfs_site_path = os.path.join(host_configs[master]['install_path'], 'etc', 'hadoop', 'hdfs-site.xml')
+  if hdfs_site_path in reconfigure.get_changes({ master: host_configs[master] }, journal.hosts()).get(master, []) and not force:
+    raise ValueError('Error: hdfs-site.xml of %s is outdated, run \'docw reconfigure %s --restart\' first.' % (master, journal.path))
+
+  settings = remove_slaves(cluster['settings'], [ slaves[hostname] for hostname in victims ], journal.host(master)['size'])
+  hosts = journal.hosts()
+  remaining = { hostname: host_desc for hostname, host_desc in hosts.items() if hostname not in victims }
+  _, host_configs = create.get_host_settings(user_conf, cluster['name'], settings, create.get_existing(remaining))
+  if set(host_configs.keys()) != set(remaining.keys()):
+    raise ValueError('Error: can\'t lay out %s without %s.' % (cluster['name'], ', '.join(victims)))
+
+  master_host = rm.get_host(user_conf, hosts[master]['ip'])
+  master_config = host_configs[master]
+  if force:
+    print('%s: decommissioning skipped: --force is given.' % master)
+  else:
+    decommission(master_host, master_config, victims)
+
+  print('destroying %s' % ', '.join(victims))
+  failures = destroy.destroy_droplets(user_conf, [ hosts[hostname]['id'] for hostname in victims ])
+  if failures:
+    raise ValueError('Error: failed to destroy %d of %d droplets: %s' % (len(failures), len(victims), ', '.join([ str(key) for key in sorted(failures.keys()) ])))
+
+  destroy.update_ssh_hashes(user_conf['known_hosts_path'], [ ssh_hash for hostname in victims for ssh_hash in hosts[hostname].get('ssh_hashes', []) ])
+  destroy.update_hosts({ hostname: hosts[hostname]['ip'] for hostname in victims if hosts[hostname].get('ip') })
+  journal.remove(victims)
+  journal.update(jn.CLUSTER_KEY, settings=settings)
+  journal.save()
+
+  # the names of the destroyed hosts may be taken by new ones.
+  master_host.run(hd.exclude_cmds([], **master_config))
+
+  # the other hosts forget the destroyed ones.
+  journal.forget(resume.CLUSTER_WIDE_PHASES)
+  scheduler = sc.get_scheduler(user_conf)
+  try:
+    create.finalize_cluster(user_conf, journal, host_configs,
+                            { hostname: host_desc['ip'] for hostname, host_desc in remaining.items() },
+                            { hostname: host_desc.get('private_ip') for hostname, host_desc in remaining.items() },
+                            { hostname: host_desc['ssh_hashes'] for hostname, host_desc in remaining.items() },
+                            scheduler)
+  finally:
+    journal.save()
+    scheduler.shutdown()
+
+  changes = reconfigure.get_changes(host_configs, journal.hosts())
+  print('%s: %d files to update on %d of %d hosts.' % (cluster['name'], sum([ len(paths) for paths in changes.values() ]), len(changes), len(remaining)))
+  reconfigure.push_changes(user_conf, journal, host_configs, changes, restart)
+
+def parse_args(args):
+  options = set([ arg for arg in args if arg in ('--force', '--restart') ])
+  args = [ arg for arg in args if arg not in options ]
+  if len(args) not in (2, 3) or not re.match(r'^[+-][1-9][0-9]*$', args[1]):
+    raise ValueError('Error: usage: docw scale <cluster>.json (+N|-N) [size] [--force] [--restart]')
+
+  return args[0], int(args[1]), args[2] if 3 == len(args) else None, '--force' in options, '--restart' in options
+
+def process(user_conf, args):
+  """
+  usage: docw scale <cluster>.json (+N|-N) [size] [--force] [--restart]
+
+  Adds N hadoop slaves (of given size, or the most common one) to a running cluster, creating & provisioning
+  only the new droplets, or removes N of them (of given size, if given; the last ones first), after hdfs
+  decommissioned them. Either way, only the config files which changed are pushed to the other hosts;
+  with --restart, the daemons reading them are restarted. --force removes slaves without decommissioning them.
+  """
+  cluster_desc_file, delta, size_slug, force, restart = parse_args(args)
+  cluster_desc = jn.read_cluster_desc(cluster_desc_file)
+  if jn.CLUSTER_KEY not in cluster_desc:
+    raise ValueError('Error: %s has no cluster settings to scale.' % cluster_desc_file)
+  if not [ group for group in cluster_desc[jn.CLUSTER_KEY]['settings'] if 'hadoop' == group['role'] ]:
+    raise ValueError('Error: %s has no hadoop hosts to scale.' % cluster_desc_file)
+
+  journal = jn.Journal(cluster_desc_file, cluster_desc)
+  create.start_trace(user_conf, journal.cluster()['name'])
+  create.start_logs(user_conf, journal.cluster()['name'])
+  try:
+    if 0 < delta:
+      scale_out(user_conf, journal, delta, size_slug, restart)
+    else:
+      scale_in(user_conf, journal, -delta, size_slug, force, restart)
+  finally:
+    journal.save()
+    rm.close_all()
+    tr.stop()
+    lg.stop()
+
+  return 0
@@ -0,0 +1,93 @@
+import concurrent.futures as cf
+import threading, time, traceback
+
+DEFAULT_CONCURRENCY = 32
+DEFAULT_RETRIES = 1
+DEFAULT_RETRY_INTERVAL = 10
+
+class Scheduler(object):
+  """
+  Runs per-host tasks on a bounded pool of workers.
+
+  Within a task, each phase may be limited further (e.g. at most K concurrent package installs)
+  and is retried on failure. Failures are collected per host instead of aborting the other hosts.
+  """
+  def __init__(self, concurrency=DEFAULT_CONCURRENCY, phase_limits=None, retries=DEFAULT_RETRIES, retry_interval=DEFAULT_RETRY_INTERVAL):
+    self.executor = cf.ThreadPoolExecutor(max_workers=max(1, concurrency))
+    self.semaphores = { phase: threading.BoundedSemaphore(limit) for phase, limit in (phase_limits or dict()).items() if 0 < limit }
+    self.retries = retries
+    self.retry_interval = retry_interval
+    self.lock = threading.Lock()
+    self.futures = dict()
+
+  def call(self, phase, func, *args, **kwargs):
+    """
+    Calls func as given phase, within the phase's concurrency limit, retrying on failure.
+    """
+    for attempt in range(0, self.retries + 1):
+      semaphore = self.semaphores.get(phase)
+      if semaphore:
+        semaphore.acquire()
+      try:
+        return func(*args, **kwargs)
+      except Exception as e:
+        if attempt == self.retries:
+          raise
+        print('Warning: %s failed (%s), retrying in %d sec.' % (phase, e, self.retry_interval))
+      finally:
+        if semaphore:
+          semaphore.release()
+      time.sleep(self.retry_interval)
+
+  def submit(self, key, func, *args, **kwargs):
+    """
+    Schedules func for given key (e.g. hostname). Tasks start in the order they are submitted.
+    """
+    with self.lock:
+      self.futures[key] = self.executor.submit(func, *args, **kwargs)
+      return self.futures[key]
+
+  def wait(self):
+    """
+    Waits for every submitted task.
+
+    Returns:
+      @return: pair of dict (key -> result, key -> exception)
+    """
+    results = dict()
+    failures = dict()
+
+    with self.lock:
+      futures = dict(self.futures)
+      self.futures.clear()
+
+    for key, future in futures.items():
+      try:
+        results[key] = future.result()
+      except Exception as e:
+        traceback.print_exception(type(e), e, e.__traceback__)
+        failures[key] = e
+
+    return results, failures
+
+  def map(self, func, keys, *args):
+    """
+    Runs func(key, *args) for every key and waits for them.
+    """
+    for key in keys:
+      self.submit(key, func, key, *args)
+
+    return self.wait()
+
+  def shutdown(self):
+    self.executor.shutdown(wait=True)
+
+def get_scheduler(user_conf):
+  """
+  Returns a scheduler configured by 'concurrency', 'concurrency.<phase>' and 'retries' user settings.
+  """
+  phase_limits = { key[len('concurrency.'):]: int(value) for key, value in user_conf.items() if key.startswith('concurrency.') }
+
+  return Scheduler(concurrency=int(user_conf.get('concurrency', DEFAULT_CONCURRENCY)),
+                   phase_limits=phase_limits,
+                   retries=int(user_conf.get('retries', DEFAULT_RETRIES)))
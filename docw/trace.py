@@ -0,0 +1,74 @@
+import json, os, threading, time
+
+from contextlib import contextmanager
+
+class Tracer(object):
+  """
+  Records spans (phases, api calls, ...) as Chrome trace 'complete' events, one JSON object per line.
+
+  Each host gets its own track (tid); spans which don't belong to a host go to the 'docw' track.
+  A tracer without path records nothing.
+  """
+  def __init__(self, path=None):
+    self.path = path
+    self.lock = threading.Lock()
+    self.file = open(path, 'a') if path else None
+
+  def record(self, name, start_time, elapsed_time, host=None, category='phase', **args):
+    if not self.file:
+      return
+
+    event = { 'name': name,
+              'cat': category,
+              'ph': 'X',
+              'ts': int(start_time * 1000000),
+              'dur': int(elapsed_time * 1000000),
+              'pid': os.getpid(),
+              'tid': host or 'docw',
+              'args': args,
+    }
+    with self.lock:
+      self.file.write(json.dumps(event) + '\n')
+      self.file.flush()
+
+  @contextmanager
+  def span(self, name, host=None, category='phase', **args):
+    start_time = time.time()
+    try:
+      yield
+    except Exception as e:
+      args['error'] = str(e)
+      raise
+    finally:
+      self.record(name, start_time, time.time() - start_time, host, category, **args)
+
+  def close(self):
+    with self.lock:
+      if self.file:
+        self.file.close()
+        self.file = None
+
+_tracer = Tracer()
+
+def get_tracer():
+  return _tracer
+
+def start(path):
+  """
+  Starts recording spans of this run to given path.
+  """
+  global _tracer
+  _tracer.close()
+  _tracer = Tracer(path)
+  return _tracer
+
+def stop():
+  global _tracer
+  _tracer.close()
+  _tracer = Tracer()
+
+def span(name, host=None, category='phase', **args):
+  return _tracer.span(name, host, category, **args)
+
+def record(name, start_time, elapsed_time, host=None, category='phase', **args):
+  _tracer.record(name, start_time, elapsed_time, host, category, **args)
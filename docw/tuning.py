@@ -0,0 +1,205 @@
+import math
+
+from docw import metadata as md
+
+# used when the sizes api can't be read: slug -> (memory in mb, vcpus, disk in gb, price hourly in usd)
+FALLBACK_SIZES = {
+  '512mb': (512, 1, 20, 0.00744),
+  '1gb': (1024, 1, 30, 0.01488),
+  '2gb': (2048, 2, 40, 0.02976),
+  '4gb': (4096, 2, 60, 0.05952),
+  '8gb': (8192, 4, 80, 0.11905),
+  '16gb': (16384, 8, 160, 0.2381),
+  '32gb': (32768, 12, 320, 0.47619),
+  '48gb': (49152, 16, 480, 0.71429),
+  '64gb': (65536, 20, 640, 0.95238),
+}
+
+# memory of the hadoop master, by the number of slaves: (up to slaves, memory in mb)
+MASTER_MEMORY = [ (10, 4096), (50, 8192), (200, 16384) ]
+MAX_MASTER_MEMORY = 32768
+
+# memory left to the os & hadoop daemons, by total memory of the node: (up to mb, reserved mb)
+# a worker keeps 1gb at least for the os, the datanode & the nodemanager.
+RESERVED_MEMORY = [ (1024, 256), (2048, 1024), (4096, 1024), (8192, 2048), (16384, 2048), (24576, 4096),
+                    (49152, 6144), (65536, 8192), (98304, 12288), (131072, 24576), (262144, 32768) ]
+MAX_RESERVED_MEMORY = 65536
+# smallest memory of a hadoop worker: the datanode & nodemanager jvms alone would overcommit smaller nodes.
+MIN_WORKER_MEMORY = 2048
+# smallest container, by total memory of the node: (up to mb, container mb)
+MIN_CONTAINER_SIZES = [ (4096, 256), (8192, 512), (24576, 1024) ]
+MAX_MIN_CONTAINER_SIZE = 2048
+# containers per vcpu: a node offers this many yarn vcores per vcpu, and each task takes one.
+CONTAINERS_PER_VCPU = 2
+# share of a container's memory given to the jvm heap, and of the map heap given to the sort buffer.
+HEAP_RATIO = 0.8
+SORT_RATIO = 0.4
+# share of the cluster's reduce slots used by a job, leaving room for failed tasks.
+REDUCE_SLOTS_RATIO = 0.95
+
+# replicas of each block, at most: never more than the number of datanodes.
+MAX_REPLICATION = 3
+# block size, by disk of the smallest datanode: (up to gb, block size in mb)
+BLOCK_SIZES = [ (40, 64), (320, 128) ]
+MAX_BLOCK_SIZE = 256
+MIN_HANDLERS = 10
+# namenode handlers per ln(the number of datanodes), and datanode handlers per vcpu.
+NAMENODE_HANDLERS_PER_LN = 20
+DATANODE_HANDLERS_PER_VCPU = 4
+
+# voters of a zookeeper ensemble, at most: every write waits for a majority of them, so more servers observe instead.
+MAX_VOTERS = 5
+# tick of the ensemble, by memory of its smallest voter: (up to mb, tick ms). small droplets stall longer.
+TICK_TIMES = [ (1024, 3000) ]
+DEFAULT_TICK_TIME = 2000
+# ticks for a follower to connect & sync with the leader (initLimit) and to stay in sync (syncLimit):
+# a base, and more for each other voter the leader serves.
+INIT_LIMIT = 10
+INIT_LIMIT_PER_VOTER = 2
+SYNC_LIMIT = 5
+SYNC_LIMITS_PER_VOTER = 0.5
+MIN_ZOOKEEPER_HEAP = 256
+MAX_ZOOKEEPER_HEAP = 8192
+
+def get_size_specs(user_conf):
+  """
+  Returns dict of size slug -> { 'memory': mb, 'vcpus': count, 'disk': gb, 'price_hourly': usd, 'regions': list or None },
+  read from the sizes api (or its cache, see metadata.sizes) if possible.
+  """
+  specs = { slug: { 'memory': memory, 'vcpus': vcpus, 'disk': disk, 'price_hourly': price_hourly, 'regions': None }
+            for slug, (memory, vcpus, disk, price_hourly) in FALLBACK_SIZES.items() }
+  try:
+    for size in md.sizes(user_conf):
+      specs[size['slug']] = { 'memory': size['memory'], 'vcpus': size['vcpus'], 'disk': size['disk'],
+                              'price_hourly': size['price_hourly'], 'regions': size['regions'] if size['available'] else [] }
+  except Exception as e:
+    print('Warning: can\'t read droplet sizes (%s), using the built-in table.' % e)
+
+  return specs
+
+def is_available(spec, region):
+  return spec['regions'] is None or region in spec['regions']
+
+def lookup(table, memory, default):
+  for limit, value in table:
+    if memory <= limit:
+      return value
+
+  return default
+
+def is_worker_size(spec):
+  return MIN_WORKER_MEMORY <= spec['memory']
+
+def get_node_resources(spec):
+  """
+  Returns the number & size of containers a node with given spec offers, with its total container memory & vcores.
+  """
+  reserved = lookup(RESERVED_MEMORY, spec['memory'], MAX_RESERVED_MEMORY)
+  min_container_mb = lookup(MIN_CONTAINER_SIZES, spec['memory'], MAX_MIN_CONTAINER_SIZE)
+  available = max(min_container_mb, spec['memory'] - reserved)
+  containers = max(1, min(CONTAINERS_PER_VCPU * spec['vcpus'], available // min_container_mb))
+  container_mb = max(min_container_mb, available // containers // 128 * 128)
+
+  return { 'containers': containers,
+           'container_mb': container_mb,
+           'memory_mb': containers * container_mb,
+           'vcores': CONTAINERS_PER_VCPU * spec['vcpus'],
+  }
+
+def get_slots(worker, task_mb):
+  """
+  Returns the number of tasks of given size which run at once on given worker, bound by its memory & vcores.
+  """
+  return max(1, min(worker['memory_mb'] // task_mb, worker['vcores']))
+
+def get_cluster_tuning(workers):
+  """
+  Returns the values shared by every node of a cluster with given worker resources.
+
+  Tasks are sized for the smallest container, so that every task fits on every worker;
+  larger workers run more of them at once, as far as their vcores allow.
+  """
+  map_mb = min([ worker['container_mb'] for worker in workers ])
+  reduce_mb = min(2 * map_mb, min([ worker['memory_mb'] for worker in workers ]))
+  map_heap_mb = int(map_mb * HEAP_RATIO)
+
+  return { 'scheduler_min_mb': map_mb,
+           'scheduler_max_mb': max([ worker['memory_mb'] for worker in workers ]),
+           'scheduler_max_vcores': max([ worker['vcores'] for worker in workers ]),
+           'map_mb': map_mb,
+           'map_heap_mb': map_heap_mb,
+           'reduce_mb': reduce_mb,
+           'reduce_heap_mb': int(reduce_mb * HEAP_RATIO),
+           'am_mb': reduce_mb,
+           'am_heap_mb': int(reduce_mb * HEAP_RATIO),
+           'sort_mb': int(map_heap_mb * SORT_RATIO),
+           'map_task_total': sum([ get_slots(worker, map_mb) for worker in workers ]),
+           'reduce_task_total': max(1, int(REDUCE_SLOTS_RATIO * sum([ get_slots(worker, reduce_mb) for worker in workers ]))),
+  }
+
+def get_master_size(slaves, size_specs, region):
+  """
+  Returns the cheapest size slug available in given region with enough memory for the master of given number of slaves.
+  """
+  memory = lookup(MASTER_MEMORY, slaves, MAX_MASTER_MEMORY)
+  candidates = [ slug for slug, spec in size_specs.items() if spec['memory'] >= memory and is_available(spec, region) ]
+  if not candidates:
+    raise ValueError('Error: no droplet size in %s has %d mb of memory for the master.' % (region, memory))
+
+  return min(candidates, key=lambda slug: (size_specs[slug]['price_hourly'], size_specs[slug]['memory'], slug))
+
+def get_hdfs_tuning(datanode_specs):
+  """
+  Returns hdfs values for given datanodes: replication capped by their number, namenode handlers scaled
+  with it and block size by their smallest disk.
+  """
+  datanodes = len(datanode_specs)
+
+  return { 'replication': max(1, min(MAX_REPLICATION, datanodes)),
+           'block_size_mb': lookup(BLOCK_SIZES, min([ spec['disk'] for spec in datanode_specs ]), MAX_BLOCK_SIZE),
+           'namenode_handlers': max(MIN_HANDLERS, int(NAMENODE_HANDLERS_PER_LN * math.log(max(1, datanodes)))),
+  }
+
+def get_hadoop_tuning(master_spec, slave_specs):
+  """
+  Returns the tuning values of each hadoop node, the master first and then given slaves.
+
+  Each node gets the cluster-wide values along with its own nodemanager memory, vcores, task slots & datanode handlers.
+  """
+  small = [ spec['memory'] for spec in list(slave_specs) or [ master_spec ] if not is_worker_size(spec) ]
+  if small:
+    raise ValueError('Error: hadoop slaves need %d mb of memory at least, not %d mb.' % (MIN_WORKER_MEMORY, min(small)))
+
+  workers = [ get_node_resources(spec) for spec in slave_specs ] or [ get_node_resources(master_spec) ]
+  cluster = dict(get_cluster_tuning(workers), **get_hdfs_tuning(list(slave_specs) or [ master_spec ]))
+
+  tunings = []
+  for spec in [ master_spec ] + list(slave_specs):
+    resources = get_node_resources(spec)
+    tunings.append(dict(cluster,
+                        nm_memory_mb=resources['memory_mb'],
+                        nm_vcores=resources['vcores'],
+                        map_task_per_node=get_slots(resources, cluster['map_mb']),
+                        reduce_task_per_node=get_slots(resources, cluster['reduce_mb']),
+                        datanode_handlers=max(MIN_HANDLERS, DATANODE_HANDLERS_PER_VCPU * spec['vcpus'])))
+
+  return tunings
+
+def get_zookeeper_tuning(specs):
+  """
+  Returns the tuning values of each zookeeper server of given specs, in the order of their ids.
+
+  The first servers (the largest, in the order of get_host_settings) vote, as many as the largest odd number
+  up to MAX_VOTERS; the others are observers, which serve reads and forward writes without voting.
+  """
+  voters = min(MAX_VOTERS, len(specs) if len(specs) % 2 else len(specs) - 1)
+  cluster = { 'voters': voters,
+              'tick_time': lookup(TICK_TIMES, min([ spec['memory'] for spec in specs[:voters] ]), DEFAULT_TICK_TIME),
+              'init_limit': INIT_LIMIT + INIT_LIMIT_PER_VOTER * (voters - 1),
+              'sync_limit': SYNC_LIMIT + int(SYNC_LIMITS_PER_VOTER * (voters - 1)),
+  }
+
+  return [ dict(cluster,
+                observer=voters <= index,
+                heap_mb=min(MAX_ZOOKEEPER_HEAP, max(MIN_ZOOKEEPER_HEAP, spec['memory'] - lookup(RESERVED_MEMORY, spec['memory'], MAX_RESERVED_MEMORY))))
+           for index, spec in enumerate(specs) ]
@@ -0,0 +1,39 @@
+import importlib, json, os, tempfile, threading
+
+def write_file_atomic(path, content):
+  '''
+  Replaces the file at given path with given content, so that readers never see a partial file.
+  '''
+  dirname = os.path.dirname(os.path.abspath(path))
+  fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.%s.' % os.path.basename(path))
+  try:
+    with os.fdopen(fd, 'wt') as f:
+      f.write(content)
+    if os.path.exists(path):
+      os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+    os.replace(tmp_path, path)
+  except:
+    os.remove(tmp_path)
+    raise
+
+def write_json_atomic(path, obj):
+  write_file_atomic(path, json.dumps(obj))
+
+class LazyModule(object):
+  '''
+  Module which is imported on first attribute access, so that commands which never use it don't pay for importing it.
+  '''
+  def __init__(self, name):
+    self._name = name
+    self._module = None
+    self._lock = threading.Lock()
+
+  def __getattr__(self, attr):
+    if self._module is None:
+      with self._lock:
+        if self._module is None:
+          self._module = importlib.import_module(self._name)
+    return getattr(self._module, attr)
+
+def lazy_import(name):
+  return LazyModule(name)
@@ -1,40 +1,106 @@
 #!/usr/bin/python3
 
 import itertools as it
+import os
 
-ORDER = [ 'tickTime', 'initLimit', 'syncLimit', 'clientPort' ]
+ORDER = [ 'tickTime', 'initLimit', 'syncLimit', 'clientPort', 'dataDir', 'dataLogDir',
+          'autopurge.snapRetainCount', 'autopurge.purgeInterval', 'peerType' ]
+CLIENT_PORT = 2181
+QUORUM_PORT = 2888
+ELECTION_PORT = 3888
+# files read by the server: restarted by 'docw reconfigure --restart' when one of them changes.
+SERVER_FILES = [ 'zoo.cfg', 'java.env', 'myid' ]
 
 INSTALLER_TEMPLATE = '''# Make directory
 
 mkdir -p $(dirname {install_path})
+mkdir -p {data_path}
+# the transaction log may be on a volume of its own.
+sudo mkdir -p {data_log_path} && sudo chown $(whoami) {data_log_path}
 
 # Download & Install
 
-wget {repository}/zookeeper-{version}/zookeeper-{version}.tar.gz
-tar -xvf zookeeper-{version}.tar.gz
+# the tarball may have been relayed from other hosts already.
+mkdir -p ${{HOME}}/.docw
+if [ ! -f ${{HOME}}/.docw/zookeeper-{version}.tar.gz ]; then
+  wget -O ${{HOME}}/.docw/zookeeper-{version}.tar.gz.part {repository}/zookeeper-{version}/zookeeper-{version}.tar.gz && \\
+    mv ${{HOME}}/.docw/zookeeper-{version}.tar.gz.part ${{HOME}}/.docw/zookeeper-{version}.tar.gz
+fi
+tar -xvf ${{HOME}}/.docw/zookeeper-{version}.tar.gz
+rm -rf {install_path}
 mv zookeeper-{version} {install_path}
-rm zookeeper-{version}.tar.gz
 
 # Set env variables
 
-echo '' >> ${{HOME}}/.bashrc
-echo "export ZOOKEEPER_INSTALL={install_path}" >> ${{HOME}}/.bashrc
-echo '' >> ${{HOME}}/.bashrc
-echo 'export PATH=$PATH:${{ZOOKEEPER_INSTALL}}/bin' >> ~/.bashrc'''
+# (skipped if already set, so that the installer can be re-run)
+if ! grep -q 'export ZOOKEEPER_INSTALL=' ${{HOME}}/.bashrc; then
+  echo '' >> ${{HOME}}/.bashrc
+  echo "export ZOOKEEPER_INSTALL={install_path}" >> ${{HOME}}/.bashrc
+  echo '' >> ${{HOME}}/.bashrc
+  echo 'export PATH=$PATH:${{ZOOKEEPER_INSTALL}}/bin' >> ~/.bashrc
+fi'''
 
-def config(hosts):
+# the server is found by its main class; it is left alone if not running.
+RESTART_TEMPLATE = '''if pgrep -f QuorumPeerMain > /dev/null; then
+  {install_path}/bin/zkServer.sh restart
+fi'''
+
+# starts the server if it is not running, and waits until it serves requests, i.e. the ensemble has a quorum.
+START_TEMPLATE = '''if ! pgrep -f QuorumPeerMain > /dev/null; then
+  {install_path}/bin/zkServer.sh start
+fi
+until echo srvr | nc localhost {port} | grep -q '^Mode:'; do
+  if [ $SECONDS -ge {timeout} ]; then
+    echo 'zookeeper did not serve requests in {timeout} sec.'
+    exit 1
+  fi
+  sleep 1
+done'''
+
+def config(hosts, **props):
+  """
+  Returns zoo.cfg of the ensemble of given hosts (in the order of their ids) for given tuning values
+  (see tuning.get_zookeeper_tuning): the hosts after the first 'voters' ones are observers.
+
+  Snapshots go to data_path and the transaction log, which is fsynced on every write, to data_log_path.
+  """
   args = {
-    'tickTime': 2000,
-    'initLimit': 10,
-    'syncLimit': 5,
-    'clientPort': 2181,
+    'tickTime': props['tick_time'],
+    'initLimit': props['init_limit'],
+    'syncLimit': props['sync_limit'],
+    'clientPort': CLIENT_PORT,
+    'dataDir': props['data_path'],
+    'dataLogDir': props['data_log_path'],
+    'autopurge.snapRetainCount': 3,
+    'autopurge.purgeInterval': 1,
   }
+  if props.get('observer'):
+    args['peerType'] = 'observer'
   
   oper_conf = '\n'.join([ '%s=%s' % (k, args[k]) for k in sorted(args.keys(), key=lambda x: ORDER.index(x)) ])
   counter = it.count(1)
-  server_conf = '\n'.join([ 'server.%d=%s' % (next(counter), host) for host in hosts ])
+  server_conf = '\n'.join([ 'server.%d=%s:%d:%d%s' % (next(counter), host, QUORUM_PORT, ELECTION_PORT, ':observer' if props['voters'] <= index else '')
+                            for index, host in enumerate(hosts) ])
   
-  return oper_conf + '\n\n' + server_conf
+  return oper_conf + '\n\n' + server_conf + '\n'
+
+def java_env(**props):
+  """
+  Returns conf/java.env, which zkServer.sh sources: a fixed heap, so that the server never swaps nor resizes it.
+  """
+  return 'export JVMFLAGS="-Xms{heap_mb}m -Xmx{heap_mb}m $JVMFLAGS"\n'.format(**props)
+
+def restart_cmds(paths, **props):
+  """
+  Returns the commands restarting the server running on the host if it reads one of given config files, or None.
+  """
+  if not [ path for path in paths if os.path.basename(path) in SERVER_FILES ]:
+    return None
+
+  return RESTART_TEMPLATE.format(**props)
+
+def start_cmds(timeout, **props):
+  return START_TEMPLATE.format(port=CLIENT_PORT, timeout=timeout, **props)
 
 def system_packages_cmds():
   return '''apt-get update
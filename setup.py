@@ -43,13 +43,7 @@ Digitalocean(tm) Cluster Wizard, available in Python 3.0+.
   install_requires=[
     'lxml >= 3.3.3',
     'paramiko >= 1.15.2',
-    'python-digitalocean >= 1.3',
-    'scp',
-    'pexpect >= 3.3',
-  ],
-
-  dependency_links=[
-        "https://github.com/jbardin/scp.py.git"
+    'python-digitalocean >= 1.16',
   ],
 
   entry_points={
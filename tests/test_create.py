@@ -0,0 +1,42 @@
+import unittest
+
+from docw import create
+from docw import droplets as dr
+
+class Droplet(object):
+  def __init__(self, name, tags=()):
+    self.name = name
+    self.tags = list(tags)
+
+class Inventory(object):
+  """
+  The droplets of an account, counting how often all of them are listed.
+  """
+  def __init__(self, droplets):
+    self.all_droplets = droplets
+    self.listed = 0
+
+  def droplets(self, max_age=None, tag_name=None):
+    if tag_name is None:
+      self.listed += 1
+      return list(self.all_droplets)
+    return [ droplet for droplet in self.all_droplets if tag_name in droplet.tags ]
+
+  def droplet_count(self, max_age=None):
+    return len(self.all_droplets)
+
+class HostnamesAvailableTest(unittest.TestCase):
+  def test_tagged(self):
+    inventory = Inventory([ Droplet('c-0', [ dr.get_cluster_tag('c') ]) ])
+    self.assertFalse(create.all_hostnames_available(inventory, 'c', [ 'c-0', 'c-1' ]))
+    self.assertTrue(create.all_hostnames_available(inventory, 'c', [ 'c-1' ]))
+    # the cluster's droplets are all of the account: no need to list them all.
+    self.assertEqual(0, inventory.listed)
+
+  def test_untagged(self):
+    inventory = Inventory([ Droplet('c-0', [ dr.get_cluster_tag('c') ]), Droplet('c-1') ])
+    self.assertFalse(create.all_hostnames_available(inventory, 'c', [ 'c-1' ]))
+    self.assertTrue(create.all_hostnames_available(inventory, 'c', [ 'c-2' ]))
+
+if __name__ == '__main__':
+  unittest.main()
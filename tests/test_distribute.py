@@ -0,0 +1,61 @@
+import hashlib, unittest
+
+from docw import distribute as dt
+
+# the checksum files gpg & coreutils write for a tarball holding b'docw', as apache publishes them.
+CONTENT = b'docw'
+
+MDS = '''hadoop-2.5.2.tar.gz:    MD5 = 68 4E 46 14 A1 64 72 82  37 52 95 B7 6F 09 95 07
+hadoop-2.5.2.tar.gz:   SHA1 = 1A32 CC96 F234 4E6F 4B37  E89C DCAF D8A7 A69A 1E26
+hadoop-2.5.2.tar.gz: RMD160 = DC52 8C76 8822 BF16 C32D  665E D54E C84F 5C00 0FCC
+hadoop-2.5.2.tar.gz: SHA224 = D895F8F2 238704EC D207B350 0497EF20 864A482D
+                              2E4A0635 C6185572
+hadoop-2.5.2.tar.gz: SHA256 = 5C264B6A 0A90BEDB E52D3CCD 69B83956 6659D10B
+                              01681C1A 4B1F1D61 0A31ADD8
+hadoop-2.5.2.tar.gz: SHA384 = 3EA5CE70 36CB55FA 2D9D1789 ED915FF8 D72B595D
+                              F892ADBC F9BD96F2 7239487F 377966B8 D8960BDB
+                              50FFB86A 391F4708
+hadoop-2.5.2.tar.gz: SHA512 = DA9A5EB4 B84FFEC2 77448734 EB7D4B0D 863F8D44
+                              18BD2CBA 9043C0B3 FF317AFE C3855210 507BA300
+                              1433329E 1755CC00 8E8BE78D 32535BF0 CF49CCB7
+                              8328994B
+'''
+
+# gpg --print-md SHA1
+GPG_SHA1 = '''hadoop-2.5.2.tar.gz: 1A32 CC96 F234 4E6F 4B37  E89C DCAF D8A7 A69A 1E26
+'''
+
+# sha512sum
+SHA512SUM = '''da9a5eb4b84ffec277448734eb7d4b0d863f8d4418bd2cba9043c0b3ff317afec3855210507ba3001433329e1755cc008e8be78d32535bf0cf49ccb78328994b  hadoop-2.5.2.tar.gz
+'''
+
+# sha256sum --tag
+BSD_SHA256 = '''SHA256 (hadoop-2.5.2.tar.gz) = 5c264b6a0a90bedbe52d3ccd69b839566659d10b01681c1a4b1f1d610a31add8
+'''
+
+class ParseChecksumTest(unittest.TestCase):
+  def test_mds(self):
+    for algorithm in ('md5', 'sha1', 'sha256', 'sha512'):
+      self.assertEqual(hashlib.new(algorithm, CONTENT).hexdigest(), dt.parse_checksum(MDS, algorithm))
+
+  def test_single_digest(self):
+    self.assertEqual(hashlib.sha1(CONTENT).hexdigest(), dt.parse_checksum(GPG_SHA1, 'sha1'))
+    self.assertEqual(hashlib.sha512(CONTENT).hexdigest(), dt.parse_checksum(SHA512SUM, 'sha512'))
+    self.assertEqual(hashlib.sha256(CONTENT).hexdigest(), dt.parse_checksum(BSD_SHA256, 'sha256'))
+
+  def test_other_algorithm(self):
+    self.assertRaises(ValueError, dt.parse_checksum, SHA512SUM, 'sha256')
+    self.assertRaises(ValueError, dt.parse_checksum, BSD_SHA256, 'sha1')
+
+  def test_dist_url(self):
+    self.assertEqual('https://archive.apache.org/dist/hadoop/common/hadoop-2.5.2/hadoop-2.5.2.tar.gz', dt.get_dist_url('hadoop', '2.5.2'))
+
+class RelayTest(unittest.TestCase):
+  def test_ssh_port(self):
+    cmds = dt.relay_cmds([ '[10.0.0.2]:2222 ssh-rsa AAAA' ], 'docw', '10.0.0.2', 2222, '.docw/hadoop-2.5.2.tar.gz')
+    self.assertIn('scp -q -P 2222 ', cmds)
+    self.assertIn('docw@10.0.0.2:.docw/hadoop-2.5.2.tar.gz .docw/hadoop-2.5.2.tar.gz.part', cmds)
+    self.assertIn('[10.0.0.2]:2222 ssh-rsa AAAA\nEOF', cmds)
+
+if __name__ == '__main__':
+  unittest.main()
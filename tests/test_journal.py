@@ -0,0 +1,79 @@
+import os, tempfile, unittest
+
+from docw import create
+from docw import journal as jn
+from docw import resume
+
+PHASES = [ 'ssh', 'system_packages', 'user_packages', 'known_hosts', 'hosts', 'user_configs' ]
+
+class JournalFileTest(unittest.TestCase):
+  """
+  Writes the journal of a two-host cluster which completed every phase to a temporary file.
+  """
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.directory.name, 'c.json')
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def write(self):
+    journal = jn.Journal(self.path)
+    journal.update(jn.CLUSTER_KEY, name='c', settings=[ { 'role': 'hadoop', 'hosts': [ { 'size': '2gb', 'count': 1 } ] } ])
+    journal.update(jn.BENCH_KEY, runs=[ { 'workload': 'teragen', 'elapsed': 1.0 } ])
+    for hostname in ('c-0', 'c-1'):
+      journal.update(hostname, id=len(hostname), role='hadoop', size='2gb')
+      for phase in PHASES:
+        journal.record(hostname, phase)
+    journal.save()
+    return journal
+
+class JournalTest(JournalFileTest):
+  def test_reload(self):
+    self.write()
+    journal = jn.Journal(self.path, jn.read_cluster_desc(self.path))
+    self.assertEqual('c', journal.cluster()['name'])
+    self.assertEqual([ 'c-0', 'c-1' ], sorted(journal.hosts().keys()))
+    self.assertEqual(PHASES, journal.host('c-1')['phases'])
+    self.assertEqual('teragen', jn.read_cluster_desc(self.path)[jn.BENCH_KEY]['runs'][0]['workload'])
+    self.assertTrue(journal.done('c-0', 'user_configs'))
+    self.assertFalse(journal.done(jn.CLUSTER_KEY, 'user_configs'))
+
+  def test_record_once(self):
+    journal = self.write()
+    journal.record('c-0', 'ssh', ip='1.2.3.4')
+    self.assertEqual(PHASES, journal.host('c-0')['phases'])
+    self.assertEqual('1.2.3.4', journal.host('c-0')['ip'])
+
+  def test_remove(self):
+    journal = self.write()
+    journal.remove([ 'c-1' ])
+    journal.save()
+    self.assertEqual([ 'c-0' ], sorted(jn.get_hosts(jn.read_cluster_desc(self.path)).keys()))
+
+class ResumeTest(JournalFileTest):
+  def run_phases(self, journal, hostname):
+    ran = []
+    for phase in PHASES:
+      create.run_phase(None, hostname, phase, phase, ran.append, phase, journal=journal)
+    return ran
+
+  def test_skips_completed_phases(self):
+    journal = self.write()
+    journal.forget([ 'user_configs' ], [ 'c-1' ])
+    self.assertEqual([], self.run_phases(journal, 'c-0'))
+    self.assertEqual([ 'user_configs' ], self.run_phases(journal, 'c-1'))
+
+  def test_reruns_cluster_wide_phases(self):
+    # as resume does once it created droplets the other hosts don't know yet.
+    self.write()
+    journal = jn.Journal(self.path, jn.read_cluster_desc(self.path))
+    journal.forget(resume.CLUSTER_WIDE_PHASES)
+    journal.update('c-2', id=3, role='hadoop', size='2gb')
+    self.assertEqual(resume.CLUSTER_WIDE_PHASES, self.run_phases(journal, 'c-0'))
+    self.assertEqual(PHASES, self.run_phases(journal, 'c-2'))
+    journal.save()
+    self.assertEqual(PHASES, jn.read_cluster_desc(self.path)['c-2']['phases'])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,16 @@
+import unittest
+
+from docw import droplets as dr
+from docw import list as ls
+
+class ClusterNamesTest(unittest.TestCase):
+  def test_cluster_tags(self):
+    tag_names = [ dr.get_cluster_tag('b'), dr.get_role_tag('b', 'hadoop'), dr.get_cluster_tag('a'), 'web' ]
+    self.assertEqual([ 'a', 'b' ], ls.get_cluster_names(tag_names))
+
+  def test_without_bake(self):
+    tag_names = [ dr.get_cluster_tag('a'), dr.get_cluster_tag('docw-bake-hadoop-1700000000') ]
+    self.assertEqual([ 'a' ], ls.get_cluster_names(tag_names))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,25 @@
+import os, unittest
+
+from docw import profile
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def get_path(events):
+  return [ (event['tid'], event['name']) for event in profile.get_critical_path(events) ]
+
+class CriticalPathTest(unittest.TestCase):
+  def test_stays_on_host(self):
+    # c-1 starts its packages after c-0 finished its own, which it did not wait for: the walk used to hop to c-0.
+    events = profile.read_trace(os.path.join(FIXTURES_DIR, 'hosts.trace.jsonl'))
+    self.assertEqual([ ('docw', 'droplets'), ('c-1', 'activation'), ('c-1', 'system_packages') ], get_path(events))
+
+  def test_operator_waits_for_any_host(self):
+    events = profile.read_trace(os.path.join(FIXTURES_DIR, 'hosts.trace.jsonl'))
+    events.append({ 'name': 'barrier', 'cat': 'barrier', 'ph': 'X', 'ts': 9000000, 'dur': 100000, 'pid': 1, 'tid': 'docw', 'args': {} })
+    self.assertEqual([ ('docw', 'droplets'), ('c-1', 'activation'), ('c-1', 'system_packages'), ('docw', 'barrier') ], get_path(events))
+
+  def test_empty(self):
+    self.assertEqual([], profile.get_critical_path([]))
+
+if __name__ == '__main__':
+  unittest.main()
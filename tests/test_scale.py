@@ -0,0 +1,66 @@
+import unittest
+
+from docw import create
+from docw import scale
+
+CLUSTER_CONF = [ { 'role': 'hadoop', 'hosts': [ { 'size': '2gb', 'count': 3 }, { 'size': '4gb', 'count': 1 } ] },
+                 { 'role': 'zookeeper', 'hosts': [ { 'size': '1gb', 'count': 3 } ] } ]
+
+class SlavesTest(unittest.TestCase):
+  def test_add_slaves(self):
+    cluster_conf = scale.add_slaves(CLUSTER_CONF, '2gb', 2, '8gb')
+    self.assertEqual('8gb', cluster_conf[0]['master'])
+    self.assertEqual([ { 'size': '2gb', 'count': 5 }, { 'size': '4gb', 'count': 1 } ], cluster_conf[0]['hosts'])
+    self.assertEqual(CLUSTER_CONF[1], cluster_conf[1])
+    # the template is left as it is.
+    self.assertEqual(3, CLUSTER_CONF[0]['hosts'][0]['count'])
+    self.assertNotIn('master', CLUSTER_CONF[0])
+
+  def test_add_slaves_of_new_size(self):
+    cluster_conf = scale.add_slaves(CLUSTER_CONF, '8gb', 1, '4gb')
+    self.assertEqual({ 'size': '8gb', 'count': 1 }, cluster_conf[0]['hosts'][-1])
+
+  def test_remove_slaves(self):
+    cluster_conf = scale.remove_slaves(CLUSTER_CONF, [ '2gb', '4gb' ], '4gb')
+    self.assertEqual('4gb', cluster_conf[0]['master'])
+    self.assertEqual([ { 'size': '2gb', 'count': 2 } ], cluster_conf[0]['hosts'])
+    self.assertEqual(CLUSTER_CONF[1], cluster_conf[1])
+    self.assertEqual(2, len(CLUSTER_CONF[0]['hosts']))
+
+class ChooseTest(unittest.TestCase):
+  SLAVES = { 'c-1': '2gb', 'c-2': '4gb', 'c-3': '2gb', 'c-10': '2gb', 'c-11': '4gb' }
+
+  def test_size(self):
+    self.assertEqual('2gb', scale.choose_size(self.SLAVES))
+    # the smallest slug on a tie.
+    self.assertEqual('2gb', scale.choose_size({ 'c-1': '4gb', 'c-2': '2gb' }))
+
+  def test_size_without_slaves(self):
+    self.assertRaises(ValueError, scale.choose_size, {})
+
+  def test_victims(self):
+    self.assertEqual([ 'c-11', 'c-10' ], scale.choose_victims('c', self.SLAVES, 2))
+    self.assertEqual([ 'c-10', 'c-3' ], scale.choose_victims('c', self.SLAVES, 2, '2gb'))
+
+  def test_too_many_victims(self):
+    self.assertRaises(ValueError, scale.choose_victims, 'c', self.SLAVES, 3, '4gb')
+    self.assertRaises(ValueError, scale.choose_victims, 'c', self.SLAVES, 5)
+
+class NamerTest(unittest.TestCase):
+  def test_keeps_names(self):
+    existing = { 'c-0': { 'role': 'hadoop', 'size': '4gb', 'master': True },
+                 'c-1': { 'role': 'hadoop', 'size': '2gb' },
+                 'c-3': { 'role': 'hadoop', 'size': '2gb' } }
+    name = create.get_namer('c', existing)
+    self.assertEqual('c-0', name('hadoop', '4gb', True))
+    self.assertEqual('c-1', name('hadoop', '2gb'))
+    self.assertEqual('c-3', name('hadoop', '2gb'))
+    # new hosts take the lowest free indices.
+    self.assertEqual('c-2', name('hadoop', '2gb'))
+    self.assertEqual('c-4', name('hadoop', '8gb'))
+
+  def test_droplet_index(self):
+    self.assertEqual(12, create.get_droplet_index('my-cluster-12'))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,90 @@
+import threading, time, unittest
+
+from docw import scheduler as sc
+
+class Counter(object):
+  """
+  Counts the calls running at once, and the most of them.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.running = 0
+    self.peak = 0
+
+  def __call__(self, key):
+    with self.lock:
+      self.running += 1
+      self.peak = max(self.peak, self.running)
+    time.sleep(0.02)
+    with self.lock:
+      self.running -= 1
+    return key
+
+class Flaky(object):
+  """
+  Fails the first given number of calls.
+  """
+  def __init__(self, failures):
+    self.failures = failures
+    self.calls = 0
+
+  def __call__(self):
+    self.calls += 1
+    if self.calls <= self.failures:
+      raise IOError('failure %d' % self.calls)
+    return self.calls
+
+class SchedulerTest(unittest.TestCase):
+  def setUp(self):
+    self.scheduler = sc.Scheduler(concurrency=3, phase_limits={ 'install': 2 }, retries=2, retry_interval=0)
+
+  def tearDown(self):
+    self.scheduler.shutdown()
+
+  def test_concurrency(self):
+    counter = Counter()
+    results, failures = self.scheduler.map(counter, range(0, 12))
+    self.assertEqual({ key: key for key in range(0, 12) }, results)
+    self.assertEqual(dict(), failures)
+    self.assertLessEqual(counter.peak, 3)
+    self.assertLess(1, counter.peak)
+
+  def test_phase_limit(self):
+    counter = Counter()
+    results, failures = self.scheduler.map(lambda key: self.scheduler.call('install', counter, key), range(0, 12))
+    self.assertEqual(12, len(results))
+    self.assertLessEqual(counter.peak, 2)
+
+  def test_retries(self):
+    flaky = Flaky(2)
+    self.assertEqual(3, self.scheduler.call('install', flaky))
+
+  def test_gives_up(self):
+    flaky = Flaky(3)
+    self.assertRaises(IOError, self.scheduler.call, 'install', flaky)
+    self.assertEqual(3, flaky.calls)
+
+  def test_failures(self):
+    def run(key):
+      if 1 == key % 2:
+        raise ValueError('Error: %d failed.' % key)
+      return key
+
+    results, failures = self.scheduler.map(run, range(0, 6))
+    self.assertEqual({ 0: 0, 2: 2, 4: 4 }, results)
+    self.assertEqual([ 1, 3, 5 ], sorted(failures.keys()))
+    self.assertTrue(all([ isinstance(e, ValueError) for e in failures.values() ]))
+    # a wait collects only the tasks submitted since the last one.
+    self.assertEqual((dict(), dict()), self.scheduler.wait())
+
+class GetSchedulerTest(unittest.TestCase):
+  def test_user_conf(self):
+    scheduler = sc.get_scheduler({ 'concurrency': '4', 'concurrency.install': '2', 'concurrency.relay': '0', 'retries': '3' })
+    try:
+      self.assertEqual(3, scheduler.retries)
+      self.assertEqual([ 'install' ], list(scheduler.semaphores.keys()))
+    finally:
+      scheduler.shutdown()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from docw import tuning
+
+SIZE_SPECS = { slug: { 'memory': memory, 'vcpus': vcpus, 'disk': disk, 'price_hourly': price_hourly, 'regions': None }
+               for slug, (memory, vcpus, disk, price_hourly) in tuning.FALLBACK_SIZES.items() }
+WORKER_SLUGS = sorted([ slug for slug, spec in SIZE_SPECS.items() if tuning.is_worker_size(spec) ], key=lambda slug: SIZE_SPECS[slug]['memory'])
+# the os, the datanode & the nodemanager jvms.
+MIN_DAEMON_MEMORY = 1024
+
+class NodeResourcesTest(unittest.TestCase):
+  def test_small_sizes_are_not_workers(self):
+    self.assertEqual(set([ '512mb', '1gb' ]), set([ slug for slug in SIZE_SPECS if slug not in WORKER_SLUGS ]))
+
+  def test_daemons_fit(self):
+    for slug in WORKER_SLUGS:
+      spec = SIZE_SPECS[slug]
+      resources = tuning.get_node_resources(spec)
+      self.assertLessEqual(resources['memory_mb'] + MIN_DAEMON_MEMORY, spec['memory'], slug)
+      self.assertEqual(resources['containers'] * resources['container_mb'], resources['memory_mb'], slug)
+      self.assertLessEqual(resources['containers'], tuning.CONTAINERS_PER_VCPU * spec['vcpus'], slug)
+
+  def test_grows_with_size(self):
+    memories = [ tuning.get_node_resources(SIZE_SPECS[slug])['memory_mb'] for slug in WORKER_SLUGS ]
+    self.assertEqual(sorted(memories), memories)
+
+class HadoopTuningTest(unittest.TestCase):
+  def test_tasks_fit_every_node(self):
+    for slug in WORKER_SLUGS:
+      tunings = tuning.get_hadoop_tuning(SIZE_SPECS['4gb'], [ SIZE_SPECS[slug] ] * 3)
+      for node_tuning in tunings[1:]:
+        self.assertLessEqual(node_tuning['map_mb'], node_tuning['nm_memory_mb'], slug)
+        self.assertLessEqual(node_tuning['reduce_mb'], node_tuning['nm_memory_mb'], slug)
+        self.assertLess(node_tuning['map_heap_mb'], node_tuning['map_mb'], slug)
+        self.assertLess(node_tuning['reduce_heap_mb'], node_tuning['reduce_mb'], slug)
+        self.assertLessEqual(node_tuning['scheduler_max_mb'], node_tuning['nm_memory_mb'], slug)
+
+  def test_mixed_sizes(self):
+    slave_specs = [ SIZE_SPECS[slug] for slug in WORKER_SLUGS ]
+    tunings = tuning.get_hadoop_tuning(SIZE_SPECS['8gb'], slave_specs)
+    self.assertEqual(len(slave_specs) + 1, len(tunings))
+    for node_tuning in tunings[1:]:
+      self.assertLessEqual(node_tuning['reduce_mb'], node_tuning['nm_memory_mb'])
+      self.assertGreaterEqual(node_tuning['map_task_per_node'], 1)
+    self.assertEqual(sum([ node_tuning['map_task_per_node'] for node_tuning in tunings[1:] ]), tunings[0]['map_task_total'])
+
+  def test_refuses_small_workers(self):
+    for slug in ('512mb', '1gb'):
+      self.assertRaises(ValueError, tuning.get_hadoop_tuning, SIZE_SPECS['4gb'], [ SIZE_SPECS[slug] ])
+      self.assertRaises(ValueError, tuning.get_hadoop_tuning, SIZE_SPECS[slug], [])
+
+if __name__ == '__main__':
+  unittest.main()